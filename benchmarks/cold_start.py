@@ -0,0 +1,58 @@
+"""
+コールドスタート（新しいプロセスでの import と初回応答）のベンチマーク。
+
+    python -m benchmarks.cold_start --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# 新しいプロセスで lambda_function を import し、URL 検証イベントに応答するまでの時間を計測する
+CHALLENGE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from src.lambda_function import lambda_handler
+lambda_handler({"body": json.dumps({"challenge": "x"})}, None)
+elapsed = time.perf_counter() - started
+heavy = [m for m in ("openai", "notion_client", "arxiv", "pypdf", "markdownify", "injector", "httpx") if m in sys.modules]
+print(json.dumps({"elapsed": elapsed, "heavy_modules": heavy}))
+"""
+
+# 通常のメンションを処理するために、サービス一式を組み立てるまでの時間を計測する
+FULL_INIT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from src.lambda_function import get_slack_event_handler
+get_slack_event_handler()
+print(json.dumps({"elapsed": time.perf_counter() - started, "heavy_modules": []}))
+"""
+
+DUMMY_ENV = {"SLACK_TOKEN": "dummy", "OPENAI_API_KEY": "dummy", "NOTION_KEY": "dummy", "NOTION_DATABASE_ID": "dummy"}
+
+
+def run_script(script: str) -> dict:
+    env = {**DUMMY_ENV, **os.environ}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env)  # noqa: S603
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(name: str, script: str, repeat: int) -> None:
+    results = [run_script(script) for _ in range(repeat)]
+    durations = [result["elapsed"] * 1000 for result in results]
+    print(f"{name:<12} median={statistics.median(durations):.1f}ms max={max(durations):.1f}ms heavy={results[-1]['heavy_modules']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    measure("challenge", CHALLENGE_SCRIPT, args.repeat)
+    measure("full init", FULL_INIT_SCRIPT, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
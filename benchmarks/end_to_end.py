@@ -0,0 +1,188 @@
+"""
+外部サービスをローカルのスタブに置き換えて、メンションから投稿・Notion 保存までを計測するベンチマーク。
+
+    python -m benchmarks.end_to_end --iterations 5
+    python -m benchmarks.end_to_end --openai-latency-ms 1500 --error-rate 0.05 --summary-mode batched
+    python -m benchmarks.end_to_end --cache   # 2 回目以降はキャッシュが効いた状態を計測する
+
+ステージごと（ダウンロード・各 LLM 呼び出し・Slack 投稿・Notion 保存）と end-to-end の p50 / p95 を出力する。
+"""
+
+import argparse
+from collections import defaultdict
+from collections.abc import Iterator
+import functools
+import json
+import math
+import os
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.fake_services import FakeServiceServer, FaultProfile
+from benchmarks.synthetic_pdf import build_pdf
+
+# 代表的な論文として、ページ数の異なる PDF と HTML の記事を用意する
+PAPER_PAGES = {"short.pdf": 8, "typical.pdf": 20, "long.pdf": 60}
+# arXiv の論文は URL から ID を取り出し、スタブの arXiv から PDF とメタデータを取得する
+ARXIV_PAPERS = {"2401.00001": 20}
+HTML_ARTICLE = "<html><body><h1>A Synthetic Article</h1>" + "<p>This is a paragraph of a synthetic article.</p>" * 400 + "</body></html>"
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class StageTimer:
+    """サービスのメソッドを包み、呼び出しごとの所要時間をステージ名ごとに記録する"""
+
+    def __init__(self) -> None:
+        self.durations: dict[str, list[float]] = defaultdict(list)
+
+    def record(self, stage: str, started: float) -> None:
+        self.durations[stage].append((time.perf_counter() - started) * 1000)
+
+    def wrap(self, obj: object, method: str, stage: str) -> None:
+        func = getattr(obj, method)
+
+        @functools.wraps(func)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, started)
+
+        setattr(obj, method, timed)
+
+    def wrap_iterator(self, obj: object, method: str, stage: str) -> None:
+        """
+        ジェネレーターを返すメソッドは、最初の要素までと最後の要素までを分けて記録する。
+        後者には呼び出し側（Slack への投稿）の時間も含まれる。
+        """
+        func = getattr(obj, method)
+
+        @functools.wraps(func)
+        def timed(*args: Any, **kwargs: Any) -> Iterator[Any]:
+            started = time.perf_counter()
+            first = True
+            for item in func(*args, **kwargs):
+                if first:
+                    self.record(f"{stage} (first)", started)
+                    first = False
+                yield item
+            self.record(f"{stage} (all)", started)
+
+        setattr(obj, method, timed)
+
+
+def configure_env(server: FakeServiceServer, args: argparse.Namespace, workdir: str) -> None:
+    env = {
+        **server.env(),
+        "OPENAI_API_KEY": "dummy",
+        "SLACK_TOKEN": "dummy",
+        "NOTION_KEY": "dummy",
+        "NOTION_DATABASE_ID": "00000000-0000-0000-0000-000000000000",
+        "NOTION_PAGE_INDEX_PATH": ":memory:",
+        "JOB_QUEUE_BACKEND": "memory",
+        "IDEMPOTENCY_BACKEND": "memory",
+        "THREAD_SESSION_BACKEND": "memory",
+        "SLACK_EVENT_MODE": "sync",
+        "SUMMARY_MODE": args.summary_mode,
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+        "TEXT_CACHE_BACKEND": "disk" if args.cache else "none",
+        "TEXT_CACHE_DIR": os.path.join(workdir, "text"),
+        "LLM_CACHE_BACKEND": "memory" if args.cache else "none",
+        "ARXIV_METADATA_CACHE_BACKEND": "memory" if args.cache else "none",
+    }
+    # 呼び出し側で指定した環境変数（SLACK_CHANNEL_RATE_PER_SEC など）を優先する
+    for name, value in env.items():
+        os.environ.setdefault(name, value)
+
+
+def build_handler(timer: StageTimer) -> Any:
+    from src.lambda_function import get_slack_event_handler
+
+    handler = get_slack_event_handler()
+    timer.wrap(handler.content_downloader, "download_content", "download")
+    timer.wrap(handler.llm_service, "generate_title", "llm: title")
+    timer.wrap(handler.llm_service, "generate_category", "llm: category")
+    timer.wrap(handler.llm_service, "generate_brief_digest", "llm: brief digest")
+    timer.wrap_iterator(handler.llm_service, "iter_summary", "llm: summary")
+    timer.wrap(handler.slack_service, "post_message", "slack: post")
+    timer.wrap(handler.notion_repogitpry, "add_content", "notion: add")
+    return handler
+
+
+def mention_event(event_id: str, url: str, ts: str) -> dict[str, Any]:
+    blocks = [{"type": "rich_text", "elements": [{"type": "rich_text_section", "elements": [{"type": "link", "url": url}]}]}]
+    body = {"event_id": event_id, "event": {"type": "app_mention", "channel": "CBENCH", "ts": ts, "blocks": blocks}}
+    return {"headers": {}, "body": json.dumps(body)}
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, list[float]]]:
+    papers: dict[str, bytes] = {name: build_pdf(pages) for name, pages in PAPER_PAGES.items()}
+    papers["article.html"] = HTML_ARTICLE.encode()
+    arxiv_papers = {arxiv_id: build_pdf(pages) for arxiv_id, pages in ARXIV_PAPERS.items()}
+    jitter = args.jitter
+    profiles = {
+        "openai": FaultProfile(args.openai_latency_ms, args.openai_latency_ms * jitter, args.error_rate),
+        "slack": FaultProfile(args.slack_latency_ms, args.slack_latency_ms * jitter, args.error_rate),
+        "notion": FaultProfile(args.notion_latency_ms, args.notion_latency_ms * jitter, args.error_rate),
+        "papers": FaultProfile(args.download_latency_ms, args.download_latency_ms * jitter, args.error_rate),
+        "arxiv": FaultProfile(args.download_latency_ms, args.download_latency_ms * jitter, args.error_rate),
+    }
+    results: dict[str, dict[str, list[float]]] = {}
+    with tempfile.TemporaryDirectory() as workdir, FakeServiceServer(profiles, papers, arxiv_papers, seed=args.seed) as server:
+        configure_env(server, args, workdir)
+        timer = StageTimer()
+        handler = build_handler(timer)
+        urls = {name: server.paper_url(name) for name in papers} | {
+            f"arxiv:{arxiv_id}": f"https://arxiv.org/abs/{arxiv_id}" for arxiv_id in arxiv_papers
+        }
+        for name, url in urls.items():
+            timer.durations.clear()
+            for iteration in range(args.iterations):
+                event = mention_event(f"Ev{iteration}-{name}", url, f"{iteration}.{time.time_ns()}")
+                started = time.perf_counter()
+                handler.handle_event(event)
+                timer.record("end-to-end", started)
+            results[name] = dict(timer.durations)
+        print_service_stats(server)
+    return results
+
+
+def print_report(results: dict[str, dict[str, list[float]]]) -> None:
+    for name, durations in results.items():
+        print(f"\n== {name}")
+        print(f"{'stage':<24}{'n':>5}{'p50 [ms]':>12}{'p95 [ms]':>12}")
+        for stage, values in sorted(durations.items(), key=lambda item: item[0] == "end-to-end"):
+            print(f"{stage:<24}{len(values):>5}{percentile(values, 50):>12.1f}{percentile(values, 95):>12.1f}")
+
+
+def print_service_stats(server: FakeServiceServer) -> None:
+    print("== stub services")
+    for service, stats in server.stats.items():
+        print(f"{service:<8} requests={stats.requests} injected_errors={stats.injected_errors} endpoints={stats.endpoints}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=3, help="論文ごとの計測回数")
+    parser.add_argument("--openai-latency-ms", type=float, default=800)
+    parser.add_argument("--slack-latency-ms", type=float, default=80)
+    parser.add_argument("--notion-latency-ms", type=float, default=300)
+    parser.add_argument("--download-latency-ms", type=float, default=200)
+    parser.add_argument("--jitter", type=float, default=0.2, help="遅延に対するゆらぎの割合")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="各リクエストがエラーになる確率")
+    parser.add_argument("--summary-mode", choices=["per_question", "batched"], default="per_question")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cache", action="store_true", help="テキスト・LLM 応答のキャッシュを有効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    print_report(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+ベンチマーク用に、OpenAI / Slack / Notion / 論文ホストの代わりに応答するローカルの HTTP サーバー。
+サービスごとに応答の遅延・ゆらぎ・エラーの発生率を指定できる。
+"""
+
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from typing import Any
+from urllib.parse import parse_qs
+import uuid
+
+SERVICES = ("openai", "slack", "notion", "papers", "arxiv")
+ANSWER_TEXT = "・この論文は合成データに対する手法を提案している。\n・既存手法と比べて高速である。\n" * 4
+
+
+@dataclass
+class FaultProfile:
+    latency_ms: float = 0.0
+    # 遅延は latency_ms ± jitter_ms の一様分布でゆらがせる
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+
+@dataclass
+class ServiceStats:
+    requests: int = 0
+    injected_errors: int = 0
+    endpoints: dict[str, int] = field(default_factory=dict)
+
+
+class FakeServiceServer:
+    """
+    1 つのポートでパスの先頭によって各サービスを振り分ける。
+        /openai/v1/...  /slack/api/...  /notion/v1/...  /papers/<name>  /arxiv/api/query  /arxiv/pdf/<id>
+    """
+
+    def __init__(
+        self, profiles: dict[str, FaultProfile], papers: dict[str, bytes], arxiv_papers: dict[str, bytes] | None = None, seed: int = 0
+    ) -> None:
+        self.profiles = {service: profiles.get(service, FaultProfile()) for service in SERVICES}
+        self.papers = papers
+        self.arxiv_papers = arxiv_papers or {}
+        self.stats = {service: ServiceStats() for service in SERVICES}
+        self._random = random.Random(seed)  # noqa: S311
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def env(self) -> dict[str, str]:
+        """各サービスのクライアントをこのサーバーに向けるための環境変数"""
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/openai/v1",
+            "SLACK_API_BASE_URL": f"{self.base_url}/slack/api",
+            "NOTION_API_BASE_URL": f"{self.base_url}/notion",
+            "ARXIV_BASE_URL": f"{self.base_url}/arxiv",
+            "ARXIV_API_URL": f"{self.base_url}/arxiv/api/query",
+        }
+
+    def paper_url(self, name: str) -> str:
+        return f"{self.base_url}/papers/{name}"
+
+    def __enter__(self) -> "FakeServiceServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def inject(self, service: str, endpoint: str) -> bool:
+        """プロファイルに従って待ち、エラーを返すべきであれば True を返す"""
+        profile = self.profiles[service]
+        with self._lock:
+            delay = max(0.0, profile.latency_ms + self._random.uniform(-profile.jitter_ms, profile.jitter_ms)) / 1000
+            failed = self._random.random() < profile.error_rate
+            stats = self.stats[service]
+            stats.requests += 1
+            stats.injected_errors += int(failed)
+            stats.endpoints[endpoint] = stats.endpoints.get(endpoint, 0) + 1
+        time.sleep(delay)
+        return failed
+
+
+# -----------------------------
+# Fake responses
+# -----------------------------
+def chat_completion(request: dict[str, Any]) -> dict[str, Any]:
+    content = _completion_content(request)
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 2,
+            "total_tokens": prompt_chars // 4 + len(content) // 2,
+        },
+    }
+
+
+def _completion_content(request: dict[str, Any]) -> str:
+    system_prompt = str(request.get("messages", [{}])[0].get("content", ""))
+    response_format = request.get("response_format") or {}
+    if "タイトル抽出" in system_prompt:
+        return json.dumps({"title": "A Synthetic Paper for Benchmarking"})
+    if "論文分類" in system_prompt:
+        return json.dumps({"category": ["LLM", "Agent"]})
+    if "60文字以内" in system_prompt:
+        return json.dumps({"summary": "ベンチマーク用の合成論文"}, ensure_ascii=False)
+    if response_format.get("type") == "json_schema":
+        properties = response_format["json_schema"]["schema"]["properties"]
+        return json.dumps(dict.fromkeys(properties, ANSWER_TEXT), ensure_ascii=False)
+    question = re.search(r"^(Q\d+): ", system_prompt, flags=re.MULTILINE)
+    if question:
+        return json.dumps({question.group(1): ANSWER_TEXT}, ensure_ascii=False)
+    return ANSWER_TEXT
+
+
+def arxiv_feed(id_list: str) -> bytes:
+    entries = "".join(
+        f"<entry><id>http://arxiv.org/abs/{arxiv_id}v1</id><title>A Synthetic arXiv Paper {arxiv_id}</title>"
+        f"<summary>{ANSWER_TEXT}</summary><category term='cs.CL'/></entry>"
+        for arxiv_id in id_list.split(",")
+        if arxiv_id
+    )
+    return f"<?xml version='1.0' encoding='UTF-8'?><feed xmlns='http://www.w3.org/2005/Atom'>{entries}</feed>".encode()
+
+
+def slack_response(method: str) -> dict[str, Any]:
+    if method == "conversations.replies":
+        return {"ok": True, "messages": []}
+    return {"ok": True, "channel": "CBENCH", "ts": f"{time.time():.6f}"}
+
+
+def notion_response(path: str) -> dict[str, Any]:
+    if path.endswith("/query"):
+        return {"object": "list", "results": [], "has_more": False, "next_cursor": None}
+    if "/blocks/" in path:
+        return {"object": "list", "results": []}
+    return {"object": "page", "id": str(uuid.uuid4()), "last_edited_time": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())}
+
+
+def respond(server: FakeServiceServer, service: str, path: str, body: dict[str, Any]) -> tuple[int, bytes, str, dict[str, str]]:
+    """(ステータス, ボディ, Content-Type, 追加のヘッダ) を返す"""
+    endpoint, _, query = path.partition("?")
+    if service not in SERVICES:
+        return 404, b"not found", "text/plain", {}
+    if server.inject(service, endpoint):
+        if service == "slack":
+            return 429, b'{"ok": false, "error": "ratelimited"}', "application/json", {"Retry-After": "1"}
+        return 500, b'{"error": "injected failure"}', "application/json", {}
+    status, content, content_type = _respond_ok(server, service, endpoint, parse_qs(query), body)
+    return status, content, content_type, {}
+
+
+def _respond_ok(
+    server: FakeServiceServer, service: str, endpoint: str, query: dict[str, list[str]], body: dict[str, Any]
+) -> tuple[int, bytes, str]:
+    if service == "openai":
+        return 200, json.dumps(chat_completion(body)).encode(), "application/json"
+    if service == "slack":
+        return 200, json.dumps(slack_response(endpoint.rsplit("/", 1)[-1])).encode(), "application/json"
+    if service == "notion":
+        return 200, json.dumps(notion_response(endpoint)).encode(), "application/json"
+    if service == "arxiv" and endpoint == "api/query":
+        return 200, arxiv_feed(query.get("id_list", [""])[0]), "application/atom+xml"
+    return _paper_response(server, service, endpoint)
+
+
+def _paper_response(server: FakeServiceServer, service: str, endpoint: str) -> tuple[int, bytes, str]:
+    if service == "arxiv" and endpoint.removeprefix("pdf/") in server.arxiv_papers:
+        return 200, server.arxiv_papers[endpoint.removeprefix("pdf/")], "application/pdf"
+    if service == "papers" and endpoint in server.papers:
+        content_type = "application/pdf" if endpoint.endswith(".pdf") else "text/html; charset=utf-8"
+        return 200, server.papers[endpoint], content_type
+    return 404, b"not found", "text/plain"
+
+
+def _make_handler(server: FakeServiceServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # ヘッダとボディを別々に書き込むため、Nagle のアルゴリズムによる遅延を避ける
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:  # noqa: N802
+            self._dispatch()
+
+        def do_POST(self) -> None:  # noqa: N802
+            self._dispatch()
+
+        def do_PATCH(self) -> None:  # noqa: N802
+            self._dispatch()
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            pass
+
+        def _dispatch(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            service, _, rest = self.path.lstrip("/").partition("/")
+            status, content, content_type, headers = respond(server, service, rest, body)
+            self._send(status, content, content_type, headers)
+
+        def _send(self, status: int, content: bytes, content_type: str, headers: dict[str, str]) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
@@ -0,0 +1,76 @@
+"""
+PDF テキスト抽出のベンチマーク。
+
+    python -m benchmarks.pdf_extraction --pages 300
+    python -m benchmarks.pdf_extraction --pdf path/to/paper.pdf --workers 4
+
+合成した小さな PDF（--small-pages、一般的な論文の長さ）でも計測し、短い論文で子プロセスの起動が遅延にならないことを確かめる。
+"""
+
+import argparse
+from io import BytesIO
+from pathlib import Path
+import statistics
+import time
+from typing import Callable
+
+from pypdf import PdfReader
+
+from benchmarks.synthetic_pdf import build_pdf
+from src.infrastructure.file_downloader.pdf_processor import PDFProcessor
+
+
+def legacy_read_text(binary_content: bytes) -> str:
+    """変更前の PDFProcessor.read_text と同じ処理"""
+    reader = PdfReader(BytesIO(binary_content))
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() or ""
+    return text
+
+
+def measure(name: str, func: Callable[[bytes], str], binary_content: bytes, repeat: int) -> None:
+    durations = []
+    length = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        length = len(func(binary_content))
+        durations.append(time.perf_counter() - started)
+    print(f"{name:<20} median={statistics.median(durations):.3f}s min={min(durations):.3f}s chars={length}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", type=Path, help="計測に使う PDF。省略時は合成した PDF を使う")
+    parser.add_argument("--pages", type=int, default=300, help="合成する PDF のページ数")
+    parser.add_argument("--small-pages", type=int, default=12, help="小さな PDF として合成するページ数")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    binary_content = args.pdf.read_bytes() if args.pdf else build_pdf(args.pages)
+    print(f"PDF size: {len(binary_content) / 1024:.0f} KiB, pages: {len(PdfReader(BytesIO(binary_content)).pages)}")
+    no_limit = 10**6
+    measure("legacy", legacy_read_text, binary_content, args.repeat)
+    measure("serial", PDFProcessor(max_workers=1, max_pages=no_limit).read_text, binary_content, args.repeat)
+    measure(
+        f"parallel x{args.workers}",
+        PDFProcessor(max_workers=args.workers, max_pages=no_limit, parallel_min_pages=1).read_text,
+        binary_content,
+        args.repeat,
+    )
+
+    small_content = build_pdf(args.small_pages)
+    print(f"Small PDF: {len(small_content) / 1024:.0f} KiB, pages: {args.small_pages}")
+    measure("legacy (small)", legacy_read_text, small_content, args.repeat)
+    measure("default (small)", PDFProcessor().read_text, small_content, args.repeat)
+    measure(
+        "isolated (small)",
+        PDFProcessor(max_workers=1, max_pages=no_limit, parallel_min_pages=1).read_text,
+        small_content,
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""ベンチマーク・テスト用に、テキストを含む PDF をライブラリ無しで生成する"""
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(num_pages: int, lines_per_page: int | list[int] = 45) -> bytes:
+    """lines_per_page にリストを渡すと、ページごとに行数を変える（抽出に時間のかかるページを作る場合など）"""
+    objects: list[bytes] = []
+    page_ids = [4 + i * 2 for i in range(num_pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {num_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_number in range(num_pages):
+        lines = [
+            f"BT /F1 9 Tf 40 {800 - line * 16} Td "
+            f"({_escape(f'Page {page_number + 1} line {line + 1}: transformer attention benchmark dataset evaluation.')}) Tj ET"
+            for line in range(lines_per_page if isinstance(lines_per_page, int) else lines_per_page[page_number])
+        ]
+        stream = "\n".join(lines).encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_ids[page_number] + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for index, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{index} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(output)
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from injector import inject
+
+from src.domain.models import Paper, PaperSummary
+from src.domain.services import IContentDownloader, ILLMService, INotionRepogitory
+from src.infrastructure.file_downloader.url import content_key
+from src.utils.concurrency import iter_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+class BulkIngestError(Exception):
+    pass
+
+
+class IngestCheckpoint:
+    """
+    一括取り込みの進み具合を JSON ファイルに保存する。
+    中断した取り込みを同じファイルで再開すると、完了済みの論文は飛ばし、投入済みのバッチジョブは結果の回収から再開する。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.state: dict[str, Any] = {"done": {}, "failed": {}, "batch": None}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    def is_done(self, url: str) -> bool:
+        return content_key(url) in self.state["done"]
+
+    def mark_done(self, url: str, title: str) -> None:
+        self.state["failed"].pop(content_key(url), None)
+        self.state["done"][content_key(url)] = {"url": url, "title": title, "finished_at": time.time()}
+        self._save()
+
+    def mark_failed(self, url: str, error: str) -> None:
+        # 失敗した論文は次回の実行で再び処理する
+        self.state["failed"][content_key(url)] = {"url": url, "error": error}
+        self._save()
+
+    @property
+    def batch(self) -> dict[str, Any] | None:
+        return self.state["batch"]
+
+    def start_batch(self, batch_id: str, urls: dict[str, str]) -> None:
+        self.state["batch"] = {"id": batch_id, "urls": urls}
+        self._save()
+
+    def finish_batch(self) -> None:
+        self.state["batch"] = None
+        self._save()
+
+    def _save(self) -> None:
+        # 書き込み途中で中断しても壊れないよう、一時ファイルに書いてから置き換える
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class BulkIngester:
+    """
+    URL のリストをまとめて要約し、Notion に保存する（カンファレンスの採択論文の一覧の取り込みなど）。
+    "concurrent": 論文ごとにダウンロードから保存までを並列に行う
+    "batch": ダウンロードを並列に行い、LLM の処理は Batch API の 1 つのジョブとしてまとめて投入する
+    """
+
+    @inject
+    def __init__(self, content_downloader: IContentDownloader, llm_service: ILLMService, notion_repogitory: INotionRepogitory) -> None:
+        self.content_downloader = content_downloader
+        self.llm_service = llm_service
+        self.notion_repogitory = notion_repogitory
+        self.max_concurrency = int(os.environ.get("BULK_MAX_CONCURRENCY", "4"))
+
+    def ingest(self, urls: list[str], checkpoint: IngestCheckpoint, mode: str = "concurrent") -> None:
+        if checkpoint.batch is not None:
+            # 前回の実行で投入したバッチジョブの結果を先に回収する
+            self._collect_batch(checkpoint)
+        unique_urls = list({content_key(url): url.strip() for url in urls if url.strip()}.values())
+        pending = [url for url in unique_urls if not checkpoint.is_done(url)]
+        logger.info("Ingesting %d papers (%d already done)", len(pending), len(unique_urls) - len(pending))
+        if mode == "batch":
+            self._ingest_batched(pending, checkpoint)
+        else:
+            self._ingest_concurrently(pending, checkpoint)
+
+    def _ingest_concurrently(self, urls: list[str], checkpoint: IngestCheckpoint) -> None:
+        for idx, result in iter_concurrently(self._ingest_one, urls, max_workers=self.max_concurrency):
+            self._record(checkpoint, urls[idx], result)
+
+    def _ingest_one(self, url: str) -> Paper:
+        content = self.content_downloader.download_content(url)
+        summary = PaperSummary(
+            title=self.llm_service.generate_title(content),
+            category=self.llm_service.generate_category(content),
+            summary=self.llm_service.generate_summary(content),
+        )
+        return self._save(url, summary)
+
+    def _ingest_batched(self, urls: list[str], checkpoint: IngestCheckpoint) -> None:
+        texts: dict[str, str] = {}
+        batch_urls: dict[str, str] = {}
+        for idx, result in iter_concurrently(self.content_downloader.download_content, urls, max_workers=self.max_concurrency):
+            if isinstance(result, Exception):
+                self._record(checkpoint, urls[idx], result)
+            else:
+                texts[str(idx)] = result
+                batch_urls[str(idx)] = urls[idx]
+        if not texts:
+            return
+        checkpoint.start_batch(self.llm_service.submit_summary_batch(texts), batch_urls)
+        self._collect_batch(checkpoint)
+
+    def _collect_batch(self, checkpoint: IngestCheckpoint) -> None:
+        batch = checkpoint.batch
+        if batch is None:
+            return
+        summaries = self.llm_service.collect_summary_batch(batch["id"])
+        # 回収の途中で中断した場合に、保存済みの論文を二重に保存しない
+        items = [(key, url) for key, url in batch["urls"].items() if not checkpoint.is_done(url)]
+        # ダイジェストは要約が揃ってから作るため、通常の呼び出しで並列に行う
+        results = iter_concurrently(
+            lambda item: self._save(item[1], self._batch_summary(summaries, item[0])),
+            items,
+            max_workers=self.max_concurrency,
+        )
+        for idx, result in results:
+            self._record(checkpoint, items[idx][1], result)
+        checkpoint.finish_batch()
+
+    def _batch_summary(self, summaries: dict[str, PaperSummary], key: str) -> PaperSummary:
+        if key not in summaries:
+            msg = "No result in the batch job"
+            raise BulkIngestError(msg)
+        return summaries[key]
+
+    def _save(self, url: str, summary: PaperSummary) -> Paper:
+        paper = Paper(
+            title=summary.title,
+            url=url,
+            category=summary.category,
+            summary=summary.summary,
+            brief_digest=self.llm_service.generate_brief_digest(summary.summary),
+        )
+        self.notion_repogitory.add_content(paper)
+        return paper
+
+    def _record(self, checkpoint: IngestCheckpoint, url: str, result: Paper | Exception) -> None:
+        if isinstance(result, Exception):
+            logger.error("Failed to ingest %s: %r", url, result)
+            checkpoint.mark_failed(url, repr(result))
+        else:
+            logger.info("Ingested %s: %s", url, result.title)
+            checkpoint.mark_done(url, result.title)
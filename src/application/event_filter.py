@@ -0,0 +1,30 @@
+import json
+from typing import Any
+
+# NOTE: URL 検証や再送への応答を軽くするため、このモジュールでは重いライブラリを import しないこと
+
+
+def parse_event_body(event: dict[str, Any]) -> dict[str, Any]:
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except Exception:
+        body = {}
+    return body
+
+
+def early_response(event: dict[str, Any], body: dict[str, Any], event_mode: str) -> dict[str, Any] | None:
+    """
+    サービスを組み立てなくても応答できるイベント（URL 検証・メンション以外・同期モードでの再送）であれば応答を返す。
+    処理が必要なイベントであれば None を返す。
+    """
+    if "challenge" in body:
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"challenge": body["challenge"]}),
+        }
+    if body.get("event", {}).get("type") != "app_mention":
+        return {"statusCode": 200}
+    if event_mode != "async" and "X-Slack-Retry-Num" in event.get("headers", {}):
+        # 同期モードでは最初のリクエストがまだ処理中のため、再送は処理しない
+        return {"statusCode": 200}
+    return None
@@ -1,20 +1,44 @@
-import json
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import Decimal
+import functools
 import logging
+import os
+import queue
 import re
-from typing import Any
+import time
+from typing import Any, TypeVar
 
 from injector import inject
 
-from src.domain.models import Paper
+from src.application.event_filter import early_response, parse_event_body
+from src.domain.models import Paper, PaperMetadata, SlackPost, ThreadSession
 from src.domain.services import (
     IContentDownloader,
+    IIdempotencyStore,
+    IJobQueue,
     ILLMService,
     INotionRepogitory,
+    IPaperMetadataResolver,
+    IPaperRetriever,
     ISlackService,
+    IThreadSessionStore,
 )
+from src.infrastructure.file_downloader.url import content_key
+from src.infrastructure.llm.schemas import LLMOutputError
+from src.infrastructure.slack.slack import message_text
+from src.utils.concurrency import iter_concurrently, submit
+from src.utils.deadline import remaining
+from src.utils.metrics import record_metric
+from src.utils.tracing import set_trace_attributes, trace
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# スレッドの会話として保存するやりとりの件数の上限
+MAX_SESSION_TURNS = 100
+
 
 class SlackEventHandlerError(Exception):
     pass
@@ -22,130 +46,400 @@ class SlackEventHandlerError(Exception):
 
 class SlackEventHandler:
     @inject
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         slack_service: ISlackService,
         content_downloader: IContentDownloader,
         llm_service: ILLMService,
         notion_repogitpry: INotionRepogitory,
+        paper_retriever: IPaperRetriever,
+        job_queue: IJobQueue,
+        idempotency_store: IIdempotencyStore,
+        metadata_resolver: IPaperMetadataResolver,
+        thread_session_store: IThreadSessionStore,
     ) -> None:
         self.slack_service = slack_service
         self.content_downloader = content_downloader
         self.llm_service = llm_service
         self.notion_repogitpry = notion_repogitpry
+        self.paper_retriever = paper_retriever
+        self.job_queue = job_queue
+        self.idempotency_store = idempotency_store
+        self.metadata_resolver = metadata_resolver
+        self.thread_session_store = thread_session_store
+        # "sync": イベントを受けたリクエスト内で処理する / "async": ジョブを積んですぐに 200 を返し、ワーカーで処理する
+        self.event_mode = os.environ.get("SLACK_EVENT_MODE", "sync")
+        # スレッドでの質問応答で、論文全文の代わりに渡す関連箇所の数
+        self.retrieval_top_k = int(os.environ.get("RETRIEVAL_TOP_K", "6"))
+        # 1 件のメンションで処理するリンクの上限と、同時に処理する論文の数
+        self.max_urls_per_mention = int(os.environ.get("MAX_URLS_PER_MENTION", "10"))
+        self.max_url_concurrency = int(os.environ.get("URL_MAX_CONCURRENCY", "3"))
+        # LLM の呼び出しを締め切りの何秒前に打ち切るか（LLMService と同じ値）。残りの時間で途中までの要約を投稿・保存する
+        self.deadline_reserve = float(os.environ.get("LLM_DEADLINE_RESERVE_SECONDS", "5"))
+        # ワーカーは、残り時間がこれより短ければ新しいジョブを取り出さない
+        self.job_min_remaining_seconds = float(os.environ.get("WORKER_MIN_REMAINING_SECONDS", "60"))
 
     def handle_event(self, event: dict[str, Any]) -> dict[str, Any]:
-        if "X-Slack-Retry-Num" in event.get("headers", {}):
+        body = parse_event_body(event)
+        response = early_response(event, body, self.event_mode)
+        if response is not None:
+            return response
+        slack_event = body["event"]
+        event_id = body.get("event_id") or f"{slack_event.get('channel')}:{slack_event.get('ts')}"
+        if not self.idempotency_store.try_acquire(event_id):
+            logger.info("Skip duplicated event: %s", event_id)
             return {"statusCode": 200}
-        body = self._parse_event_body(event)
-        if "challenge" in body:
-            return {
-                "statusCode": 200,
-                "body": json.dumps({"challenge": body["challenge"]}),
-            }
-        slack_event = body.get("event", {})
-        if slack_event.get("type") == "app_mention":
+        if self.event_mode == "async":
+            try:
+                self.job_queue.enqueue(event_id, slack_event)
+            except Exception:
+                # 積めなかったイベントは Slack からの再送で処理できるようにする
+                self.idempotency_store.release(event_id)
+                raise
+            return {"statusCode": 200}
+        try:
             self.handle_mention(slack_event)
+        except Exception:
+            self.idempotency_store.release(event_id)
+            raise
+        self.idempotency_store.mark_done(event_id)
         return {"statusCode": 200}
 
-    def _parse_event_body(self, event: dict[str, Any]) -> dict[str, Any]:
-        try:
-            body = json.loads(event.get("body", "{}"))
-        except Exception:
-            body = {}
-        return body
+    def process_jobs(self, max_jobs: int | None = None) -> int:
+        """キューに積まれたジョブを取り出して処理する（ワーカー用）。処理したジョブの数を返す"""
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            left = remaining()
+            if left is not None and left < self.job_min_remaining_seconds:
+                # 途中で打ち切られないよう、残り時間が少なければ次のジョブを取り出さずに終える
+                logger.info("Stop taking jobs: %.1f seconds left", left)
+                break
+            job = self.job_queue.dequeue()
+            if job is None:
+                break
+            try:
+                self.handle_mention(job.event)
+            except Exception:
+                logger.exception("Failed to process job: %s", job.job_id)
+                self.job_queue.fail(job)
+            else:
+                self.job_queue.complete(job)
+                self.idempotency_store.mark_done(job.event_id)
+            processed += 1
+        return processed
 
     def handle_mention(self, slack_event: dict[str, Any]) -> None:
+        # 1 件のメンションの処理を 1 つのトレースにまとめ、ステージごとの時間・トークン数・コストを集計する
+        trace_id = f"{slack_event.get('channel')}:{slack_event.get('ts')}"
         if "thread_ts" not in slack_event:
-            self._handle_main_message(slack_event)
+            with trace(trace_id, kind="summary"):
+                self._handle_main_message(slack_event)
         else:
-            self._handle_thread_message(slack_event)
+            with trace(trace_id, kind="thread"):
+                self._handle_thread_message(slack_event)
 
     def _handle_main_message(self, slack_event: dict[str, Any]) -> None:
-        try:
-            target_url = self._extract_url_from_blocks(slack_event.get("blocks", []))
-        except ValueError:
-            self.slack_service.post_message(
-                channel=slack_event["channel"],
-                message="URLが見つかりませんでした。",
-                thread_ts=slack_event.get("ts"),
-            )
+        started_at = time.monotonic()
+        channel, ts = slack_event["channel"], slack_event.get("ts")
+        urls = self._extract_urls_from_blocks(slack_event.get("blocks", []))
+        if not urls:
+            self.slack_service.post_message(channel, "URLが見つかりませんでした。", ts)
             return
+        set_trace_attributes(url=urls[0] if len(urls) == 1 else urls)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # メタデータはまとめて取得し、ダウンロードと並行させる
+            metadata_future = submit(executor, self._resolve_metadata, urls)
+            if len(urls) == 1:
+                paper = self._process_url(urls[0], metadata_future, functools.partial(self._post, channel, ts), started_at)
+                if paper is not None and ts is not None:
+                    # スレッドでのフォローアップの質問に、Slack の履歴を取り直さずに答えられるようにする
+                    self._save_session(
+                        ThreadSession(
+                            channel=channel,
+                            thread_ts=ts,
+                            paper_url=paper.url,
+                            paper_id=content_key(paper.url),
+                            title=paper.title,
+                            summary=paper.summary,
+                            last_ts=ts,
+                        )
+                    )
+                return
+            # 複数の論文は並列に処理し、論文ごとの投稿を混ぜないよう、処理が終わった論文から 1 つの投稿にまとめる
+            for idx, result in iter_concurrently(
+                lambda url: self._process_url_grouped(url, metadata_future, channel, ts),
+                urls,
+                max_workers=self.max_url_concurrency,
+            ):
+                if isinstance(result, Exception):
+                    logger.error("Failed to process %s: %s", urls[idx], result)
 
+    def _process_url_grouped(self, url: str, metadata_future: Future[dict[str, PaperMetadata]], channel: str, ts: str | None) -> None:
+        messages: list[str] = []
         try:
-            content = self.content_downloader.download_content(target_url)
-        except Exception:
-            self.slack_service.post_message(
-                slack_event["channel"],
-                "コンテンツのダウンロードに失敗しました。",
-                slack_event.get("ts"),
-            )
-            return
+            self._process_url(url, metadata_future, messages.append, None)
+        finally:
+            if messages:
+                self.slack_service.post_messages([SlackPost(channel=channel, messages=messages, thread_ts=ts)])
 
+    def _process_url(
+        self, url: str, metadata_future: Future[dict[str, PaperMetadata]], post: Callable[[str], None], started_at: float | None
+    ) -> Paper | None:
+        """1 本の論文をダウンロードから Notion への保存まで処理する。started_at は最初の回答までの時間の計測に使う"""
         try:
-            title = self.llm_service.generate_title(content)
-            summary = self.llm_service.generate_summary(content)
-            category = self.llm_service.generate_category(content)
-            brief_digest = self.llm_service.generate_brief_digest(summary)
-            paper = Paper(
-                title=title,
-                url=target_url,
-                brief_digest=brief_digest,
-                category=category,
-                summary=summary,
-            )
+            content = self.content_downloader.download_content(url)
         except Exception:
-            self.slack_service.post_message(
-                slack_event["channel"],
-                "コンテンツの処理に失敗しました。",
-                slack_event.get("ts"),
-            )
-            return
+            logger.exception("Failed to download content: %s", url)
+            post(f"{url}\nコンテンツのダウンロードに失敗しました。")
+            return None
 
-        # 論文タイトルと URL を Slack に投稿
-        self.slack_service.post_message(slack_event["channel"], f"{paper.title}\n{paper.url}", slack_event["ts"])
-        # 論文の要約を Slack に投稿
-        for question, answer in paper.summary.items():
-            self.slack_service.post_message(slack_event["channel"], f"{question}\n\n{answer}", slack_event["ts"])
+        try:
+            paper = self._deliver_progressively(content, metadata_future.result().get(url), url, post, started_at)
+        except Exception:
+            logger.exception("Failed to process content: %s", url)
+            post(f"{url}\nコンテンツの処理に失敗しました。")
+            return None
 
         try:
             self.notion_repogitpry.add_content(paper)
         except Exception:
             logger.exception("Failed to add content to Notion")
+        return paper
+
+    def _post(self, channel: str, thread_ts: str | None, message: str) -> None:
+        self.slack_service.post_message(channel, message, thread_ts)
+
+    def _resolve_metadata(self, urls: list[str]) -> dict[str, PaperMetadata]:
+        try:
+            return self.metadata_resolver.resolve_many(urls)
+        except Exception:
+            logger.exception("Failed to resolve paper metadata")
+            return {}
+
+    def _deliver_progressively(
+        self, content: str, metadata: PaperMetadata | None, url: str, post: Callable[[str], None], started_at: float | None
+    ) -> Paper:
+        """
+        タイトル、各質問の回答の順に、生成でき次第 post に渡す。
+        カテゴリとダイジェストは Slack には出さないため、全回答の投稿後に揃える。
+        """
+        # タイトルの完了と回答の到着を 1 つのキューで待ち、投稿は全てこのスレッドから行う
+        events: queue.Queue[tuple[str, Any]] = queue.Queue()
+
+        def produce_answers() -> None:
+            try:
+                for item in self.llm_service.iter_summary(content):
+                    events.put(("answer", item))
+            finally:
+                events.put(("done", None))
+
+        # タイトルとカテゴリは要約と並列に生成する
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            if metadata is not None:
+                # メタデータがあれば、タイトルは LLM を使わずに決め、カテゴリは全文ではなくアブストラクトから判定する
+                title_future = submit(executor, lambda: metadata.title)
+                category_input = f"{metadata.title}\n{', '.join(metadata.categories)}\n{metadata.abstract}"
+            else:
+                title_future = submit(executor, self.llm_service.generate_title, content)
+                category_input = content
+            category_future = submit(executor, self.llm_service.generate_category, category_input)
+            title_future.add_done_callback(lambda _: events.put(("title", None)))
+            summary_future = submit(executor, produce_answers)
+            answers = self._post_title_then_answers(events, title_future, url, post, started_at)
+            # 要約の生成中に起きた例外はここで送出する
+            summary_future.result()
+            category = self._category_or_default(category_future)
+        # 回答は完了順に届くため、Q1〜Q8 の順に並べ直す
+        summary = dict(sorted(answers.items()))
+        if self._llm_deadline_passed():
+            # 締め切りに間に合わなかった回答は失敗した旨を投稿済みのため、ダイジェストは作らずに得られた分だけを保存する
+            logger.warning("Deadline reached, saving a partial summary: %s", url)
+            set_trace_attributes(partial=True)
+            post("時間内に生成できなかった回答があります。")
+            brief_digest = ""
+        else:
+            brief_digest = self.llm_service.generate_brief_digest(summary)
+        return Paper(
+            title=self._result_or_default(title_future, "No Title"),
+            url=url,
+            brief_digest=brief_digest,
+            category=category,
+            summary=summary,
+        )
+
+    def _post_title_then_answers(
+        self,
+        events: queue.Queue[tuple[str, Any]],
+        title_future: Future[str],
+        url: str,
+        post: Callable[[str], None],
+        started_at: float | None,
+    ) -> dict[str, str]:
+        """
+        タイトルは完了し次第投稿し、回答は届いた順に投稿する。
+        タイトルより先に届いた回答は、スレッドの先頭にタイトルが来るよう、タイトルの投稿まで保留する。
+        """
+        answers: dict[str, str] = {}
+        held: list[str] = []
+        title_posted = summary_done = False
+        while not (title_posted and summary_done):
+            kind, item = events.get()
+            if kind == "title":
+                post(f"{self._result_or_default(title_future, 'No Title')}\n{url}")
+                title_posted = True
+            elif kind == "answer":
+                question, answer = item
+                answers[question] = answer
+                held.append(f"{question}\n\n{answer}")
+            else:
+                summary_done = True
+            if title_posted and held:
+                if started_at is not None and len(answers) == len(held):
+                    # まだ 1 件も回答を投稿していない
+                    record_metric("TimeToFirstAnswer", (time.monotonic() - started_at) * 1000)
+                for message in held:
+                    post(message)
+                held.clear()
+        return answers
+
+    def _category_or_default(self, future: Future[list[str]]) -> list[str]:
+        """カテゴリは全回答の投稿後に揃うため、どの失敗でも投稿済みの要約を捨てずに既定値で保存する"""
+        try:
+            return future.result()
+        except Exception:
+            logger.warning("Failed to generate category, falling back to No Category", exc_info=True)
+            return ["No Category"]
+
+    def _result_or_default(self, future: Future[T], default: T) -> T:
+        """
+        締め切りで打ち切られた生成と、修正してもスキーマに合わなかった出力は default を返す。
+        回答は投稿済みのため、タイトル・カテゴリが得られなくても論文は保存する。それ以外の失敗は従来どおり送出する。
+        """
+        try:
+            return future.result()
+        except LLMOutputError:
+            logger.warning("Falling back to %r", default, exc_info=True)
+            return default
+        except Exception:
+            if not self._llm_deadline_passed():
+                raise
+            return default
+
+    def _llm_deadline_passed(self) -> bool:
+        # LLM の呼び出しは締め切りの deadline_reserve 秒前に打ち切られる
+        left = remaining(self.deadline_reserve)
+        return left is not None and left <= 0
 
     def _handle_thread_message(self, slack_event: dict[str, Any]) -> None:
-        question, answer, url = self._answer_message_from_history(slack_event)
-        self.slack_service.post_message(slack_event["channel"], answer, slack_event["thread_ts"])
+        channel, thread_ts = slack_event["channel"], slack_event["thread_ts"]
+        session = self._load_session(channel, thread_ts)
+        if session is not None and self._session_is_behind(session, slack_event):
+            # 別のインスタンスが答えた質問など、保存した会話に含まれないメッセージがあれば取り込み直す
+            logger.info("Thread session is behind, rebuilding from history: %s", thread_ts)
+            session = None
+        set_trace_attributes(session_hit=session is not None)
+        if session is None:
+            # 別のインスタンスで要約したスレッドや期限切れのスレッドは、Slack の履歴から組み立て直す
+            session = self._session_from_history(slack_event)
+        set_trace_attributes(url=session.paper_url)
+        question = slack_event.get("text", "")
+        # 生成途中の回答をプレースホルダーのメッセージに随時反映する
+        answer = self.slack_service.stream_message(
+            channel,
+            self.llm_service.stream_chat_response(self._build_messages(session, question)),
+            thread_ts,
+        )
+        session.turns = [*session.turns, {"role": "user", "content": question}, {"role": "assistant", "content": answer}][
+            -MAX_SESSION_TURNS:
+        ]
+        session.last_ts = slack_event.get("ts")
+        self._save_session(session)
         try:
-            if url:
-                self.notion_repogitpry.update_content(url, {"question": question, "answer": answer})
+            if session.paper_url:
+                self.notion_repogitpry.update_content(session.paper_url, {"question": re.sub(r"<[^>]*>", "", question), "answer": answer})
         except Exception:
             logger.exception("Failed to update content in Notion")
 
-    def _answer_message_from_history(self, slack_event: dict[str, Any]) -> tuple[str, str, str | None]:
-        messages = []
-        first_url = None
+    def _build_messages(self, session: ThreadSession, question: str) -> list[dict[str, Any]]:
+        messages: list[dict[str, Any]] = []
+        if session.paper_url:
+            # 論文の内容は全文ではなく、質問に関連する箇所だけを渡す
+            passages = self.paper_retriever.retrieve(session.paper_url, question, self.retrieval_top_k)
+            excerpt = "論文のうち、質問に関連する箇所の抜粋:\n" + "\n---\n".join(passages)
+            # 抜粋は会話の要約に畳み込まずに残す
+            messages.append({"role": "user", "content": excerpt, "pinned": True})
+        else:
+            logger.warning("URL not found in thread messages")
+        if session.title:
+            messages.append({"role": "assistant", "content": f"{session.title}\n{session.paper_url}"})
+        messages += [{"role": "assistant", "content": f"{key}\n\n{answer}"} for key, answer in session.summary.items()]
+        # トークン予算に収まらない古いやりとりは、LLMService が要約に畳み込む
+        messages += session.turns
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def _session_from_history(self, slack_event: dict[str, Any]) -> ThreadSession:
+        session = ThreadSession(channel=slack_event["channel"], thread_ts=slack_event["thread_ts"])
         conversations = self.slack_service.get_conversations(slack_event["channel"], slack_event["thread_ts"])
         if not conversations.get("ok"):
             raise SlackEventHandlerError
-        for chat_message in conversations.get("messages", [])[-30:]:
+        for chat_message in conversations.get("messages", []):
+            if chat_message.get("ts") == slack_event.get("ts"):
+                # 今回の質問は最後に加える
+                continue
             if chat_message.get("bot_id"):
-                messages.append({"role": "assistant", "content": chat_message.get("text", "")})
-            elif "attachments" in chat_message and "original_url" in chat_message["attachments"][0] and not first_url:
-                first_url = chat_message["attachments"][0]["original_url"]
-                content = self.content_downloader.download_content(first_url)
-                messages.append({"role": "user", "content": content})
+                session.turns.append({"role": "assistant", "content": message_text(chat_message)})
+            elif "attachments" in chat_message and "original_url" in chat_message["attachments"][0] and not session.paper_url:
+                paper_url = chat_message["attachments"][0]["original_url"]
+                session.paper_url, session.paper_id = paper_url, content_key(paper_url)
             else:
-                messages.append({"role": "user", "content": chat_message.get("text", "")})
-        answer = self.llm_service.generate_chat_response(messages)
-        if not first_url:
-            logger.warning("URL not found in thread messages")
-        return re.sub(r"<[^>]*>", "", messages[-1]["content"]), answer, first_url
-
-    def _extract_url_from_blocks(self, blocks: list[Any]) -> str:
-        for block in blocks:
-            for element in block.get("elements", []):
-                for inner in element.get("elements", []):
-                    if inner.get("type") == "link":
-                        return inner.get("url", "").strip()
-        raise KeyError
+                session.turns.append({"role": "user", "content": chat_message.get("text", "")})
+        session.last_ts = slack_event.get("ts")
+        return session
+
+    def _session_is_behind(self, session: ThreadSession, slack_event: dict[str, Any]) -> bool:
+        """保存した会話より後に、今回の質問以外のユーザーのメッセージがスレッドにあるか（ボットの投稿は数えない）"""
+        if session.last_ts is None:
+            return True
+        conversations = self.slack_service.get_conversations(session.channel, session.thread_ts, oldest=session.last_ts)
+        if not conversations.get("ok"):
+            raise SlackEventHandlerError
+        last_ts = Decimal(session.last_ts)
+        return any(
+            not chat_message.get("bot_id") and chat_message.get("ts") != slack_event.get("ts") and Decimal(chat_message["ts"]) > last_ts
+            for chat_message in conversations.get("messages", [])
+        )
+
+    def _load_session(self, channel: str, thread_ts: str) -> ThreadSession | None:
+        try:
+            return self.thread_session_store.get(channel, thread_ts)
+        except Exception:
+            logger.exception("Failed to load thread session")
+            return None
+
+    def _save_session(self, session: ThreadSession) -> None:
+        try:
+            self.thread_session_store.put(session)
+        except Exception:
+            logger.exception("Failed to save thread session")
+
+    def _extract_urls_from_blocks(self, blocks: list[Any]) -> list[str]:
+        """メッセージ中のリンクを出現順に集め、同じ論文を指すものは最初の 1 つだけを残す"""
+        urls: dict[str, str] = {}
+        for url in _iter_link_urls(blocks):
+            urls.setdefault(content_key(url), url)
+        if len(urls) > self.max_urls_per_mention:
+            logger.warning("Too many links in a mention: %d", len(urls))
+        return list(urls.values())[: self.max_urls_per_mention]
+
+
+def _iter_link_urls(elements: list[Any]) -> Iterator[str]:
+    """
+    rich_text の要素を深さ優先でたどり、リンクの URL を出現順に返す
+    （箇条書きは rich_text_list → rich_text_section → link のように入れ子になる）。
+    """
+    for element in elements:
+        if element.get("type") == "link" and element.get("url", "").strip():
+            yield element["url"].strip()
+        yield from _iter_link_urls(element.get("elements", []))
@@ -0,0 +1,33 @@
+"""
+URL を 1 行に 1 つずつ書いたファイルから、論文をまとめて要約して Notion に保存する。
+
+    python -m src.bulk_ingest urls.txt
+    python -m src.bulk_ingest urls.txt --mode batch --checkpoint accepted_papers.json
+
+中断しても同じチェックポイントのファイルを指定して実行し直せば、完了済みの論文は飛ばして再開する。
+"""
+
+import argparse
+import logging
+
+from src.application.bulk_ingester import BulkIngester, IngestCheckpoint
+from src.dependency_injector import get_injector
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url_file", help="URL を 1 行に 1 つずつ書いたファイル。# で始まる行は無視する")
+    parser.add_argument("--mode", choices=["concurrent", "batch"], default="concurrent")
+    parser.add_argument("--checkpoint", default="bulk_ingest_checkpoint.json", help="進み具合を保存するファイル")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.url_file, encoding="utf-8") as f:
+        urls = [line.strip() for line in f if not line.startswith("#")]
+    checkpoint = IngestCheckpoint(args.checkpoint)
+    get_injector().get(BulkIngester).ingest(urls, checkpoint, mode=args.mode)
+    print(f"done: {len(checkpoint.state['done'])}, failed: {len(checkpoint.state['failed'])}")
+
+
+if __name__ == "__main__":
+    main()
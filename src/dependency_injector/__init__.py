@@ -1,22 +1,54 @@
-from injector import Binder, Injector
+from functools import cache
+from typing import TYPE_CHECKING
 
-from src.domain.services import (
-    IContentDownloader,
-    ILLMService,
-    INotionRepogitory,
-    ISlackService,
-)
-from src.infrastructure.file_downloader.file_downloader import FileDownloader
-from src.infrastructure.llm.llm import LLMService
-from src.infrastructure.notion.notion import NotionRepository
-from src.infrastructure.slack.slack import SlackService
+if TYPE_CHECKING:
+    from injector import Binder, Injector
 
+# NOTE: コールドスタートを短くするため、injector や各サービスのモジュールは実際に組み立てるときに import する
 
-def configure(binder: Binder) -> None:
+
+def configure(binder: "Binder") -> None:
+    from injector import CallableProvider, singleton
+
+    from src.domain.services import (
+        IContentDownloader,
+        IIdempotencyStore,
+        IJobQueue,
+        ILLMService,
+        INotionRepogitory,
+        IPaperMetadataResolver,
+        IPaperRetriever,
+        ISlackService,
+        IThreadSessionStore,
+    )
+    from src.infrastructure.arxiv_resolver.arxiv_resolver import ArxivResolver
+    from src.infrastructure.file_downloader.file_downloader import FileDownloader
+    from src.infrastructure.http_client.http_client import HTTPClientPool
+    from src.infrastructure.idempotency.idempotency import create_idempotency_store_from_env
+    from src.infrastructure.job_queue.job_queue import create_job_queue_from_env
+    from src.infrastructure.llm.llm import LLMService
+    from src.infrastructure.notion.notion import NotionRepository
+    from src.infrastructure.retrieval.retrieval import PaperRetriever
+    from src.infrastructure.slack.slack import SlackService
+    from src.infrastructure.thread_session.thread_session import create_thread_session_store_from_env
+
+    # HTTP クライアントやキャッシュを保持するため、ウォームスタート間で使い回せるようシングルトンにする
+    binder.bind(HTTPClientPool, scope=singleton)
+    for service_class in (SlackService, FileDownloader, LLMService, NotionRepository, PaperRetriever, ArxivResolver):
+        binder.bind(service_class, scope=singleton)
     binder.bind(ISlackService, SlackService)  # type: ignore[type-abstract]
     binder.bind(IContentDownloader, FileDownloader)  # type: ignore[type-abstract]
     binder.bind(ILLMService, LLMService)  # type: ignore[type-abstract]
     binder.bind(INotionRepogitory, NotionRepository)  # type: ignore[type-abstract]
+    binder.bind(IPaperRetriever, PaperRetriever)  # type: ignore[type-abstract]
+    binder.bind(IPaperMetadataResolver, ArxivResolver)  # type: ignore[type-abstract]
+    binder.bind(IJobQueue, to=CallableProvider(create_job_queue_from_env), scope=singleton)  # type: ignore[type-abstract]
+    binder.bind(IIdempotencyStore, to=CallableProvider(create_idempotency_store_from_env), scope=singleton)  # type: ignore[type-abstract]
+    binder.bind(IThreadSessionStore, to=CallableProvider(create_thread_session_store_from_env), scope=singleton)  # type: ignore[type-abstract]
+
 
+@cache
+def get_injector() -> "Injector":
+    from injector import Injector
 
-injector = Injector(configure)
+    return Injector(configure)
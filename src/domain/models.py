@@ -1,3 +1,5 @@
+from typing import Any
+
 from pydantic import BaseModel, StrictStr
 
 
@@ -7,3 +9,47 @@ class Paper(BaseModel):
     brief_digest: StrictStr
     url: StrictStr
     summary: dict[StrictStr, StrictStr]
+
+
+class PaperSummary(BaseModel):
+    """ダイジェストを作る前の、LLM による生成結果"""
+
+    title: StrictStr
+    category: list[StrictStr]
+    summary: dict[StrictStr, StrictStr]
+
+
+class PaperMetadata(BaseModel):
+    paper_id: StrictStr
+    title: StrictStr
+    categories: list[StrictStr]
+    abstract: StrictStr
+
+
+class Job(BaseModel):
+    job_id: StrictStr
+    event_id: StrictStr
+    event: dict[StrictStr, Any]
+    attempts: int = 0
+
+
+class ThreadSession(BaseModel):
+    """論文の要約を投稿したスレッドでの会話の状態。フォローアップの質問のたびに Slack の履歴を取り直さずに済むよう保存する"""
+
+    channel: StrictStr
+    thread_ts: StrictStr
+    paper_url: StrictStr | None = None
+    # 論文の識別子（arXiv の ID か正規化した URL）。本文は PaperRetriever がこの単位でキャッシュしている
+    paper_id: StrictStr | None = None
+    title: StrictStr | None = None
+    summary: dict[StrictStr, StrictStr] = {}
+    # これまでのやりとり（{"role": ..., "content": ...}）
+    turns: list[dict[StrictStr, StrictStr]] = []
+    # turns に取り込んだ最後のメッセージ（質問）の ts。これより新しい質問が Slack にあれば、保存した会話は古い
+    last_ts: StrictStr | None = None
+
+
+class SlackPost(BaseModel):
+    channel: StrictStr
+    messages: list[StrictStr]
+    thread_ts: StrictStr | None = None
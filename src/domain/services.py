@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
 from typing import Any
 
-from .models import Paper
+from .models import Job, Paper, PaperMetadata, PaperSummary, SlackPost, ThreadSession
 
 
 class IContentDownloader(ABC):
@@ -10,6 +11,22 @@ class IContentDownloader(ABC):
         """指定された URL からコンテンツをダウンロードし、テキスト（もしくは Markdown 化された HTML）として返す"""
 
 
+class IPaperRetriever(ABC):
+    @abstractmethod
+    def retrieve(self, url: str, query: str, top_k: int) -> list[str]:
+        """指定された URL の論文から、質問に関連する箇所を最大 top_k 件取り出す"""
+
+
+class IPaperMetadataResolver(ABC):
+    @abstractmethod
+    def resolve(self, url: str) -> PaperMetadata | None:
+        """URL の論文のメタデータ（タイトル・カテゴリ・アブストラクト）を返す。取得できない URL では None を返す"""
+
+    @abstractmethod
+    def resolve_many(self, urls: list[str]) -> dict[str, PaperMetadata]:
+        """複数の URL のメタデータをまとめて取得し、取得できたものだけを URL をキーにして返す"""
+
+
 class ILLMService(ABC):
     @abstractmethod
     def generate_title(self, text: str) -> str:
@@ -19,6 +36,10 @@ class ILLMService(ABC):
     def generate_summary(self, text: str) -> dict[str, str]:
         """詳細な要約のための LLM 呼び出し"""
 
+    @abstractmethod
+    def iter_summary(self, text: str) -> Iterator[tuple[str, str]]:
+        """詳細な要約を、質問ごとに (質問, 回答) として生成でき次第返す"""
+
     @abstractmethod
     def generate_category(self, text: str) -> list[str]:
         """カテゴリ分類のための LLM 呼び出し"""
@@ -27,10 +48,25 @@ class ILLMService(ABC):
     def generate_brief_digest(self, summary: dict[str, str]) -> str:
         """短い要約（ダイジェスト）のための LLM 呼び出し"""
 
+    @abstractmethod
+    def submit_summary_batch(self, texts: dict[str, str]) -> str:
+        """
+        複数の文書のタイトル・カテゴリ・要約の生成を 1 つのバッチジョブとして投入し、ジョブ ID を返す。
+        texts のキーには ":" を含めないこと。
+        """
+
+    @abstractmethod
+    def collect_summary_batch(self, batch_id: str) -> dict[str, PaperSummary]:
+        """バッチジョブの完了を待ち、生成できた文書の結果を submit_summary_batch に渡したキーごとに返す"""
+
     @abstractmethod
     def generate_chat_response(self, messages: list[dict[str, Any]]) -> str:
         """会話のための LLM 呼び出し"""
 
+    @abstractmethod
+    def stream_chat_response(self, messages: list[dict[str, Any]]) -> Iterator[str]:
+        """会話のための LLM 呼び出し（生成されたテキストを断片ごとに返す）"""
+
 
 class INotionRepogitory(ABC):
     @abstractmethod
@@ -48,5 +84,61 @@ class ISlackService(ABC):
         """指定されたメッセージを Slack に通知する"""
 
     @abstractmethod
-    def get_conversations(self, channel: str, ts: str) -> dict[str, Any]:
-        """指定されたスレッドのメッセージを取得する"""
+    def post_messages(self, posts: list[SlackPost]) -> None:
+        """
+        複数のメッセージをサイズ上限の許す限り少ない Block Kit メッセージにまとめて通知する。
+        同じスレッドへの投稿は順序を保ち、異なるスレッド・チャンネルへの投稿は並列に行う。
+        """
+
+    @abstractmethod
+    def stream_message(self, channel: str, chunks: Iterable[str], thread_ts: str | None = None) -> str:
+        """
+        プレースホルダーを投稿し、届いたテキストの断片で一定間隔ごとにメッセージを更新する。
+        最終的に投稿したテキスト全体を返す。
+        """
+
+    @abstractmethod
+    def get_conversations(self, channel: str, ts: str, oldest: str | None = None) -> dict[str, Any]:
+        """指定されたスレッドのメッセージを取得する。oldest を指定すると、それ以降のメッセージだけを取得する"""
+
+
+class IJobQueue(ABC):
+    @abstractmethod
+    def enqueue(self, event_id: str, event: dict[str, Any]) -> str:
+        """Slack イベントをジョブとして積み、ジョブ ID を返す"""
+
+    @abstractmethod
+    def dequeue(self) -> Job | None:
+        """処理可能なジョブを 1 件取り出す。取り出したジョブは complete / fail を呼ぶまで他から見えない"""
+
+    @abstractmethod
+    def complete(self, job: Job) -> None:
+        """ジョブの完了を記録する"""
+
+    @abstractmethod
+    def fail(self, job: Job) -> None:
+        """ジョブの失敗を記録する。リトライ回数の上限までは再び取り出せるようにする"""
+
+
+class IIdempotencyStore(ABC):
+    @abstractmethod
+    def try_acquire(self, key: str) -> bool:
+        """未処理のキーであれば処理中として記録して True を返す。処理中・処理済みであれば False を返す"""
+
+    @abstractmethod
+    def mark_done(self, key: str) -> None:
+        """キーを処理済みとして記録する"""
+
+    @abstractmethod
+    def release(self, key: str) -> None:
+        """処理に失敗したキーの記録を消し、再送されたイベントを処理できるようにする"""
+
+
+class IThreadSessionStore(ABC):
+    @abstractmethod
+    def get(self, channel: str, thread_ts: str) -> ThreadSession | None:
+        """スレッドの会話の状態を返す。保存されていない・期限切れの場合は None を返す"""
+
+    @abstractmethod
+    def put(self, session: ThreadSession) -> None:
+        """スレッドの会話の状態を保存する（同じスレッドのものは上書きする）"""
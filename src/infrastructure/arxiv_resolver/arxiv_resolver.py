@@ -0,0 +1,89 @@
+import logging
+import os
+import re
+from xml.etree import ElementTree as ET
+
+from injector import NoInject, inject
+
+from src.domain.models import PaperMetadata
+from src.domain.services import IPaperMetadataResolver
+from src.infrastructure.cache.cache import AbstractCache, create_cache_from_env
+from src.infrastructure.file_downloader.url import extract_arxiv_id, strip_arxiv_version
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.utils.deadline import timeout_for
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+ATOM_NAMESPACE = {"atom": "http://www.w3.org/2005/Atom"}
+# arXiv API の id_list に一度に渡す ID の数
+MAX_IDS_PER_QUERY = 100
+
+
+class ArxivResolver(IPaperMetadataResolver):
+    """
+    arXiv の論文のメタデータを取得する。
+    arxiv パッケージのクライアントはリクエスト間に数秒待つため使わず、API を直接 1 回の id_list クエリでまとめて呼ぶ。
+    メタデータは更新されることがほぼないため、キャッシュに保存して使い回す。
+    """
+
+    API_URL = "https://export.arxiv.org/api/query"
+
+    @inject
+    def __init__(self, http_pool: HTTPClientPool, metadata_cache: NoInject[AbstractCache | None] = None) -> None:
+        self.session = http_pool.session
+        self.api_url = os.environ.get("ARXIV_API_URL", self.API_URL)
+        self.metadata_cache = metadata_cache or create_cache_from_env("ARXIV_METADATA_CACHE", "/tmp/ai-paper-summarizer/arxiv")  # noqa: S108
+
+    def resolve(self, url: str) -> PaperMetadata | None:
+        return self.resolve_many([url]).get(url)
+
+    def resolve_many(self, urls: list[str]) -> dict[str, PaperMetadata]:
+        base_ids = {url: strip_arxiv_version(arxiv_id) for url in urls if (arxiv_id := extract_arxiv_id(url))}
+        metadata: dict[str, PaperMetadata] = {}
+        for base_id in set(base_ids.values()):
+            cached = self.metadata_cache.get(f"arxiv_meta:{base_id}")
+            if cached is not None:
+                metadata[base_id] = PaperMetadata.model_validate_json(cached)
+        missing = sorted(set(base_ids.values()) - set(metadata))
+        for start in range(0, len(missing), MAX_IDS_PER_QUERY):
+            try:
+                fetched = self._query(missing[start : start + MAX_IDS_PER_QUERY])
+            except Exception:
+                # メタデータは無くても要約できるため、取得に失敗しても処理は止めない
+                logger.exception("Failed to query arXiv metadata")
+                continue
+            for base_id, paper_metadata in fetched.items():
+                self.metadata_cache.set(f"arxiv_meta:{base_id}", paper_metadata.model_dump_json())
+            metadata.update(fetched)
+        return {url: metadata[base_id] for url, base_id in base_ids.items() if base_id in metadata}
+
+    def _query(self, base_ids: list[str]) -> dict[str, PaperMetadata]:
+        with span("arxiv.query", ids=len(base_ids)):
+            response = self.session.get(
+                self.api_url, params={"id_list": ",".join(base_ids), "max_results": len(base_ids)}, timeout=timeout_for(10)
+            )
+            response.raise_for_status()
+        return parse_feed(response.content)
+
+
+def parse_feed(content: bytes) -> dict[str, PaperMetadata]:
+    """arXiv API の Atom フィードを、バージョンを除いた ID をキーにしたメタデータに変換する"""
+    metadata = {}
+    for entry in ET.fromstring(content).findall("atom:entry", ATOM_NAMESPACE):  # noqa: S314
+        arxiv_id = extract_arxiv_id(entry.findtext("atom:id", "", ATOM_NAMESPACE))
+        # 存在しない ID などはエラーを表すエントリとして返ってくるため、ID が取れないものは捨てる
+        if not arxiv_id:
+            continue
+        base_id = strip_arxiv_version(arxiv_id)
+        metadata[base_id] = PaperMetadata(
+            paper_id=base_id,
+            title=_normalize_space(entry.findtext("atom:title", "", ATOM_NAMESPACE)),
+            categories=[category.get("term", "") for category in entry.findall("atom:category", ATOM_NAMESPACE)],
+            abstract=_normalize_space(entry.findtext("atom:summary", "", ATOM_NAMESPACE)),
+        )
+    return metadata
+
+
+def _normalize_space(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
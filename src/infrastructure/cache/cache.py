@@ -0,0 +1,339 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# ローカルディレクトリのキャッシュのサイズ上限の既定値。Lambda の /tmp（既定 512 MB）を複数のキャッシュと PDF の処理で分け合う
+DEFAULT_LOCAL_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# 上限を超えたときは、上限のこの割合まで削除する（書き込みのたびに削除が走らないようにする）
+EVICTION_TARGET_RATIO = 0.8
+
+
+class CacheError(Exception):
+    pass
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def as_dict(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Abstract Base Class
+# -----------------------------
+class AbstractCache(ABC):
+    """
+    文字列の値を保持するキャッシュ。TTL を過ぎたエントリはミス扱いにする。
+    """
+
+    def __init__(self, ttl_seconds: float | None = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> str | None:
+        try:
+            value = self._get(key)
+        except Exception:
+            logger.exception("Failed to read cache: %s", key)
+            value = None
+        if value is None:
+            self.stats.record_miss()
+        else:
+            self.stats.record_hit()
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self._set(key, value)
+        except Exception:
+            # キャッシュへの書き込み失敗で本処理を止めない
+            logger.exception("Failed to write cache: %s", key)
+
+    def is_expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    @abstractmethod
+    def _get(self, key: str) -> str | None:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: str) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+
+# -----------------------------
+# Object store
+# -----------------------------
+class ObjectInfo:
+    def __init__(self, name: str, size: int, last_modified: float) -> None:
+        self.name = name
+        self.size = size
+        self.last_modified = last_modified
+
+
+class IObjectStore(ABC):
+    """S3 のような「名前 → バイト列」のオブジェクトストア"""
+
+    @abstractmethod
+    def get_object(self, name: str) -> bytes | None:
+        """オブジェクトを取得する。存在しない場合は None を返す"""
+
+    @abstractmethod
+    def put_object(self, name: str, data: bytes) -> None:
+        """オブジェクトを保存する"""
+
+    @abstractmethod
+    def delete_object(self, name: str) -> None:
+        """オブジェクトを削除する"""
+
+    @abstractmethod
+    def list_objects(self) -> list[ObjectInfo]:
+        """保存されているオブジェクトの一覧を返す"""
+
+
+class LocalDirectoryObjectStore(IObjectStore):
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get_object(self, name: str) -> bytes | None:
+        path = self.directory / name
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # LRU で追い出せるよう、読み出し時刻を更新日時として記録する
+        os.utime(path)
+        return data
+
+    def put_object(self, name: str, data: bytes) -> None:
+        path = self.directory / name
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def delete_object(self, name: str) -> None:
+        (self.directory / name).unlink(missing_ok=True)
+
+    def list_objects(self) -> list[ObjectInfo]:
+        objects = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            objects.append(ObjectInfo(name=path.name, size=stat.st_size, last_modified=stat.st_mtime))
+        return objects
+
+
+class S3ObjectStore(IObjectStore):
+    def __init__(self, bucket: str, prefix: str = "") -> None:
+        import boto3  # Lambda ランタイムには同梱されているため、使う場合のみ import する
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3")
+
+    def get_object(self, name: str) -> bytes | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def put_object(self, name: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+    def delete_object(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+
+    def list_objects(self) -> list[ObjectInfo]:
+        objects: list[ObjectInfo] = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            objects.extend(
+                ObjectInfo(
+                    name=item["Key"].removeprefix(self.prefix),
+                    size=item["Size"],
+                    last_modified=item["LastModified"].timestamp(),
+                )
+                for item in page.get("Contents", [])
+            )
+        return objects
+
+
+# -----------------------------
+# Concrete Classes
+# -----------------------------
+class ObjectStoreCache(AbstractCache):
+    """
+    オブジェクトストア上のキャッシュ。キーは SHA-256 でハッシュ化したオブジェクト名にする。
+    max_bytes を超えた場合は更新日時の古いものから削除する。ローカルディレクトリでは読み出し時に更新日時を
+    更新するため LRU になるが、S3 では読み出しで LastModified が変わらないため書き込みの古い順になる。
+    一覧の取得（S3 ではページングされた LIST）は、書き込んだサイズの累計から上限を超えたと見積もったときだけ行う。
+    """
+
+    def __init__(self, store: IObjectStore, ttl_seconds: float | None = None, max_bytes: int | None = None) -> None:
+        super().__init__(ttl_seconds)
+        self.store = store
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 保存されている合計サイズの見積もり。最初の書き込みで一覧から初期化する（上書きも加算するため多めに見積もる）
+        self._estimated_bytes: int | None = None
+
+    def _get(self, key: str) -> str | None:
+        data = self.store.get_object(hash_key(key))
+        if data is None:
+            return None
+        entry = json.loads(data)
+        if entry.get("key") != key or self.is_expired(entry["stored_at"]):
+            return None
+        return entry["value"]
+
+    def _set(self, key: str, value: str) -> None:
+        entry: dict[str, Any] = {"key": key, "stored_at": time.time(), "value": value}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        self.store.put_object(hash_key(key), data)
+        self._evict_if_needed(len(data))
+
+    def delete(self, key: str) -> None:
+        self.store.delete_object(hash_key(key))
+
+    def _evict_if_needed(self, written_bytes: int) -> None:
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._estimated_bytes is None:
+                self._estimated_bytes = sum(obj.size for obj in self.store.list_objects())
+            else:
+                self._estimated_bytes += written_bytes
+            if self._estimated_bytes > self.max_bytes:
+                self._estimated_bytes = self._evict(int(self.max_bytes * EVICTION_TARGET_RATIO))
+
+    def _evict(self, target_bytes: int) -> int:
+        """更新日時の古いものから target_bytes 以下になるまで削除し、残った合計サイズを返す"""
+        objects = sorted(self.store.list_objects(), key=lambda obj: obj.last_modified)
+        total = sum(obj.size for obj in objects)
+        for obj in objects:
+            if total <= target_bytes:
+                break
+            self.store.delete_object(obj.name)
+            total -= obj.size
+        return total
+
+
+class LocalDiskCache(ObjectStoreCache):
+    def __init__(self, directory: str, ttl_seconds: float | None = None, max_bytes: int | None = None) -> None:
+        super().__init__(LocalDirectoryObjectStore(directory), ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+
+
+class InMemoryLRUCache(AbstractCache):
+    """プロセス内のキャッシュ。max_entries を超えた場合は最も使われていないものから削除する"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float | None = None) -> None:
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.is_expired(stored_at):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class NullCache(AbstractCache):
+    """キャッシュを無効化する場合に使う"""
+
+    def _get(self, key: str) -> str | None:
+        _ = key
+        return None
+
+    def _set(self, key: str, value: str) -> None:
+        _ = key, value
+
+    def delete(self, key: str) -> None:
+        _ = key
+
+
+def create_cache_from_env(
+    prefix: str, default_directory: str, default_backend: str = "disk", default_max_bytes: int = DEFAULT_LOCAL_CACHE_MAX_BYTES
+) -> AbstractCache:
+    """
+    環境変数からキャッシュを生成する。
+    - {prefix}_BACKEND: "memory" / "disk" / "object_store" / "s3" / "none"
+    - {prefix}_DIR: disk / object_store のときの保存先ディレクトリ
+    - {prefix}_S3_BUCKET, {prefix}_S3_PREFIX: s3 のときの保存先
+    - {prefix}_TTL_SECONDS, {prefix}_MAX_BYTES: TTL とサイズ上限（disk / object_store の上限は既定で default_max_bytes、
+      s3 は既定で上限なし。S3 ではライフサイクルルールか TTL で古いエントリを消すこと）
+    - {prefix}_MAX_ENTRIES: memory のときのエントリ数上限
+    """
+    backend = os.environ.get(f"{prefix}_BACKEND", default_backend)
+    ttl = os.environ.get(f"{prefix}_TTL_SECONDS")
+    max_bytes = os.environ.get(f"{prefix}_MAX_BYTES")
+    ttl_seconds = float(ttl) if ttl else None
+    max_size = int(max_bytes) if max_bytes else None
+    local_max_size = default_max_bytes if max_size is None else max_size
+    directory = os.environ.get(f"{prefix}_DIR", default_directory)
+    if backend == "none":
+        return NullCache()
+    if backend == "memory":
+        return InMemoryLRUCache(int(os.environ.get(f"{prefix}_MAX_ENTRIES", "256")), ttl_seconds=ttl_seconds)
+    if backend == "disk":
+        return LocalDiskCache(directory, ttl_seconds=ttl_seconds, max_bytes=local_max_size)
+    if backend == "object_store":
+        return ObjectStoreCache(LocalDirectoryObjectStore(directory), ttl_seconds=ttl_seconds, max_bytes=local_max_size)
+    if backend == "s3":
+        store = S3ObjectStore(os.environ[f"{prefix}_S3_BUCKET"], os.environ.get(f"{prefix}_S3_PREFIX", ""))
+        return ObjectStoreCache(store, ttl_seconds=ttl_seconds, max_bytes=max_size)
+    msg = f"Unknown cache backend: {backend}"
+    raise CacheError(msg)
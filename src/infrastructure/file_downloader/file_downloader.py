@@ -1,66 +1,134 @@
-from io import BytesIO
+import json
+import logging
+import os
+import time
 
-import arxiv  # type: ignore[import-untyped]
-from markdownify import markdownify  # type: ignore[import-untyped]
-from pypdf import PdfReader
+from injector import NoInject, inject
 import requests  # type: ignore[import-untyped]
 
 from src.domain.services import IContentDownloader
+from src.infrastructure.cache.cache import AbstractCache, create_cache_from_env
+from src.infrastructure.file_downloader.html_extractor import charset_from_content_type, extract_main_content
+from src.infrastructure.file_downloader.pdf_processor import PDFProcessor
+from src.infrastructure.file_downloader.url import content_key, extract_arxiv_id
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.utils.deadline import timeout_for
+from src.utils.tracing import set_attributes, span
 
+# 抽出処理を変更した場合は上げること（古い抽出結果のキャッシュを使わないようにするため）
+EXTRACTOR_VERSION = "3"
+NOT_MODIFIED = 304
 
-class DownloadFailureError(Exception):
-    pass
-
+logger = logging.getLogger(__name__)
 
-class PDFProcessor:
-    def __init__(self) -> None:
-        self.text = ""
 
-    def to_file(self, binary_content: bytes) -> BytesIO:
-        return BytesIO(binary_content)
-
-    def read_text(self, binary_content: bytes) -> str:
-        reader = PdfReader(self.to_file(binary_content))
-        self.text = ""
-        for page in reader.pages:
-            self.text += page.extract_text() or ""
-        return self.text
+class DownloadFailureError(Exception):
+    pass
 
 
 class FileDownloader(IContentDownloader):
-    def __init__(self) -> None:
+    @inject
+    def __init__(self, http_pool: HTTPClientPool, text_cache: NoInject[AbstractCache | None] = None) -> None:
+        self.session = http_pool.session
         self.pdf_processor = PDFProcessor()
+        self.text_cache = text_cache or create_cache_from_env("TEXT_CACHE", "/tmp/ai-paper-summarizer/text")  # noqa: S108
+        self.arxiv_base_url = os.environ.get("ARXIV_BASE_URL", "https://arxiv.org")
+        # HTML はこのサイズまでしか読まない（巨大なページの変換に時間がかかるのを防ぐ）
+        self.html_max_bytes = int(os.environ.get("HTML_MAX_BYTES", str(2 * 1024 * 1024)))
+        # HTML は更新されうるため、この秒数を過ぎたら条件付きリクエストで更新を確認する
+        self.html_revalidate_seconds = float(os.environ.get("HTML_REVALIDATE_SECONDS", "3600"))
 
     def download_content(self, url: str) -> str:
-        url_lower = url.lower()
-        if "arxiv" in url_lower:
-            arxiv_id = url.split("/")[-1].removesuffix(".pdf")
-            binary_content = self._download_pdf_from_arxiv(arxiv_id)
-            return self.pdf_processor.read_text(binary_content)
-        if "pdf" in url_lower:
-            binary_content = self._download_pdf(url)
-            return self.pdf_processor.read_text(binary_content)
-        return self._download_html_as_markdown(url)
+        with span("download", url=url):
+            is_pdf = extract_arxiv_id(url) is not None or "pdf" in url.lower()
+            text = self._download_pdf_text(url) if is_pdf else self._download_html_as_markdown(url)
+            set_attributes(chars=len(text))
+            return text
 
-    def _download_pdf_from_arxiv(self, arxiv_id: str) -> bytes:
-        client = arxiv.Client()
-        search = arxiv.Search(id_list=[arxiv_id], max_results=1)
-        paper = next(client.results(search))
-        try:
-            return requests.get(paper.pdf_url, timeout=10).content
-        except Exception as e:
-            raise DownloadFailureError from e
+    def _download_pdf_text(self, url: str) -> str:
+        cache_key = f"text:{EXTRACTOR_VERSION}:{content_key(url)}"
+        cached = self.text_cache.get(cache_key)
+        set_attributes(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+        arxiv_id = extract_arxiv_id(url)
+        # arXiv の PDF の URL は ID から決まるため、メタデータ API を経由せずに直接ダウンロードする
+        binary_content = self._download_pdf(f"{self.arxiv_base_url}/pdf/{arxiv_id}" if arxiv_id else url)
+        text = self._extract_pdf(binary_content)
+        if text:
+            self.text_cache.set(cache_key, text)
+        return text
+
+    def _extract_pdf(self, binary_content: bytes) -> str:
+        with span("download.pdf_parse", bytes=len(binary_content)):
+            return self.pdf_processor.read_text(binary_content)
 
     def _download_pdf(self, url: str) -> bytes:
         try:
-            return requests.get(url, timeout=10).content
+            with span("download.fetch") as current:
+                content = self.session.get(url, timeout=timeout_for(10)).content
+                current.attributes["bytes"] = len(content)
+                return content
         except Exception as e:
             raise DownloadFailureError from e
 
     def _download_html_as_markdown(self, url: str) -> str:
+        """
+        本文部分だけを Markdown に変換して返す。
+        前回の取得結果があれば ETag / Last-Modified で条件付きリクエストを送り、304 の場合は前回の抽出結果を使う。
+        """
+        entry_key = f"html:{EXTRACTOR_VERSION}:{content_key(url)}"
+        cached = self.text_cache.get(entry_key)
+        entry = json.loads(cached) if cached else None
+        if entry is not None and time.time() - entry["fetched_at"] < self.html_revalidate_seconds:
+            set_attributes(cache_hit=True)
+            return entry["text"]
+
         headers = {"User-Agent": "Mozilla/5.0"}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
         try:
-            html_text = requests.get(url, headers=headers, timeout=10).text
-            return markdownify(html_text)
+            with (
+                span("download.fetch") as current,
+                self.session.get(url, headers=headers, timeout=timeout_for(10), stream=True) as response,
+            ):
+                not_modified = entry is not None and response.status_code == NOT_MODIFIED
+                current.attributes["not_modified"] = not_modified
+                if not not_modified:
+                    response.raise_for_status()
+                    body = self._read_capped(response)
+                    current.attributes["bytes"] = len(body)
         except Exception as e:
             raise DownloadFailureError from e
+
+        set_attributes(cache_hit=not_modified)
+        if entry is not None and not_modified:
+            entry["fetched_at"] = time.time()
+            self.text_cache.set(entry_key, json.dumps(entry, ensure_ascii=False))
+            return entry["text"]
+
+        with span("download.html_convert", bytes=len(body)):
+            text = extract_main_content(body, charset_from_content_type(response.headers.get("Content-Type")))
+        entry = {
+            "text": text,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        if text:
+            self.text_cache.set(entry_key, json.dumps(entry, ensure_ascii=False))
+        return text
+
+    def _read_capped(self, response: requests.Response) -> bytes:
+        """html_max_bytes を超える分は読まずに捨てる"""
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk[: self.html_max_bytes - size])
+            size += len(chunks[-1])
+            if size >= self.html_max_bytes:
+                logger.info("HTML exceeds %d bytes, truncated: %s", self.html_max_bytes, response.url)
+                break
+        return b"".join(chunks)
@@ -0,0 +1,60 @@
+import re
+from typing import Any
+
+# 本文を含みえない要素。本文のコンテナを選ぶ前に文書全体から取り除く
+SCRIPT_TAGS = ("script", "style", "noscript", "template", "svg")
+# 本文と無関係な要素（ナビゲーション・コメント欄など）。本文のコンテナの中からだけ取り除く
+NOISE_TAGS = ("nav", "header", "footer", "aside", "form", "iframe", "button")
+# class / id のトークン全体がこれに一致する要素を取り除く（"with-sidebar" や "related-work" のような部分一致は対象外）
+NOISE_PATTERN = re.compile(
+    r"^(?:comments?|sidebar|footer|navbar|menu|cookies?|share|social|related|advert|ads?|promo|banner|breadcrumbs?|subscribe|newsletter)"
+    r"(?:[-_](?:area|section|list|links|buttons|posts|widget|bar|box|container|wrapper))?$",
+    re.IGNORECASE,
+)
+# 本文のコンテナとして優先する要素。いずれも無いか短すぎる場合は body 全体を使う
+MAIN_SELECTORS = ("article", "main", "[role=main]", "#content", "#main-content", ".post-content", ".entry-content", ".article-body")
+MIN_MAIN_CONTENT_CHARS = 200
+PROTECTED_TAGS = ("html", "body", "main", "article")
+CHARSET_PATTERN = re.compile(r"charset=([\w-]+)", re.IGNORECASE)
+
+
+def charset_from_content_type(content_type: str | None) -> str | None:
+    match = CHARSET_PATTERN.search(content_type or "")
+    return match.group(1) if match else None
+
+
+def extract_main_content(html: bytes | str, encoding: str | None = None) -> str:
+    """
+    HTML からナビゲーションやコメント欄などを取り除き、本文部分だけを Markdown に変換する。
+    encoding が無い場合は meta タグなどから推定する。
+    """
+    from bs4 import BeautifulSoup, Comment
+    from markdownify import MarkdownConverter  # type: ignore[import-untyped]
+
+    soup = BeautifulSoup(html, "html.parser", from_encoding=encoding if isinstance(html, bytes) else None)
+    for tag in soup(SCRIPT_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+
+    # 先に本文のコンテナを決め、その中のノイズだけを取り除く（コンテナ自身とその祖先は消さない）
+    root: Any = _find_main(soup) or soup.body or soup
+    for tag in [*root(NOISE_TAGS), *root.find_all(class_=NOISE_PATTERN), *root.find_all(id=NOISE_PATTERN)]:
+        if not tag.decomposed and tag.name not in PROTECTED_TAGS:
+            tag.decompose()
+    markdown = MarkdownConverter().convert_soup(root)
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    if title and root.find("h1") is None:
+        markdown = f"{title}\n\n{markdown}"
+    return re.sub(r"\n{3,}", "\n\n", markdown).strip()
+
+
+def _find_main(soup: Any) -> Any:
+    for selector in MAIN_SELECTORS:
+        candidates = soup.select(selector)
+        if not candidates:
+            continue
+        best = max(candidates, key=lambda tag: len(tag.get_text(strip=True)))
+        if len(best.get_text(strip=True)) >= MIN_MAIN_CONTENT_CHARS:
+            return best
+    return None
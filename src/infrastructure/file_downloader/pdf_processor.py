@@ -0,0 +1,203 @@
+from collections.abc import Iterator
+from io import BytesIO
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.pool import AsyncResult, Pool
+import os
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# 子プロセスの起動と PDF のパースを待つ秒数（ページごとのタイムアウトとは別に数える）
+WORKER_START_TIMEOUT_SECONDS = 30.0
+
+
+class PageText(NamedTuple):
+    page_number: int
+    # 抽出結果を連結したテキスト中での、このページの開始位置（文字数）
+    offset: int
+    text: str
+
+
+# -----------------------------
+# Worker functions
+# -----------------------------
+# ワーカープロセスごとに 1 度だけ PDF をパースし、以降のページ抽出で使い回す
+_worker_reader: "PdfReader | None" = None
+
+
+def _init_worker(binary_content: bytes) -> None:
+    from pypdf import PdfReader
+
+    global _worker_reader  # noqa: PLW0603
+    _worker_reader = PdfReader(BytesIO(binary_content))
+
+
+def _extract_page(page_number: int) -> str:
+    if _worker_reader is None:
+        msg = "Worker is not initialized"
+        raise RuntimeError(msg)
+    return _worker_reader.pages[page_number].extract_text() or ""
+
+
+def _extract_pages_to_pipe(conn: Connection, binary_content: bytes, start: int, stop: int) -> None:
+    """start ページから順に抽出し、1 ページごとに (ページ番号, テキスト) を送る。パースが終わった時点で None を送る"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(binary_content))
+    conn.send(None)
+    for page_number in range(start, stop):
+        try:
+            text = reader.pages[page_number].extract_text() or ""
+        except Exception:
+            logger.exception("Failed to extract page %d", page_number)
+            text = ""
+        conn.send((page_number, text))
+    conn.close()
+
+
+# -----------------------------
+# PDF Processor
+# -----------------------------
+class PDFProcessor:
+    """
+    PDF からページ単位でテキストを抽出する。
+    ページ数が parallel_min_pages 以上の場合はプロセスプールで並列に抽出し、ページ順に yield する。
+    プロセスプールが使えない環境（/dev/shm の無い AWS Lambda など）では、1 つの子プロセスで逐次抽出する
+    （Process と Pipe は /dev/shm を使わない）。どちらの場合も page_timeout 秒を超えたページは空として扱う。
+    parallel_min_pages 未満の PDF と、page_timeout に 0 を指定した場合は、タイムアウトなしで同じプロセス内で抽出する。
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        page_timeout: float | None = None,
+        max_pages: int | None = None,
+        parallel_min_pages: int | None = None,
+    ) -> None:
+        self.max_workers = max_workers or int(os.environ.get("PDF_MAX_WORKERS", str(os.cpu_count() or 1)))
+        self.page_timeout = float(os.environ.get("PDF_PAGE_TIMEOUT_SECONDS", "10")) if page_timeout is None else page_timeout
+        self.max_pages = max_pages or int(os.environ.get("PDF_MAX_PAGES", "200"))
+        self.parallel_min_pages = parallel_min_pages or int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "16"))
+
+    def to_file(self, binary_content: bytes) -> BytesIO:
+        return BytesIO(binary_content)
+
+    def read_text(self, binary_content: bytes) -> str:
+        return "".join(page.text for page in self.iter_pages(binary_content))
+
+    def iter_pages(self, binary_content: bytes) -> Iterator[PageText]:
+        # pypdf は PDF を扱うときだけ読み込む（コールドスタート対策）
+        from pypdf import PdfReader
+
+        reader = PdfReader(self.to_file(binary_content))
+        num_pages = len(reader.pages)
+        if num_pages > self.max_pages:
+            logger.info("PDF has %d pages, extracting first %d pages only", num_pages, self.max_pages)
+            num_pages = self.max_pages
+
+        if self.max_workers > 1 and num_pages >= self.parallel_min_pages:
+            try:
+                pool = multiprocessing.get_context("spawn").Pool(
+                    processes=min(self.max_workers, num_pages), initializer=_init_worker, initargs=(binary_content,)
+                )
+            except OSError:
+                logger.warning("Process pool is not available, falling back to serial extraction")
+            else:
+                yield from self._iter_pages_parallel(pool, num_pages)
+                return
+
+        # 子プロセスの起動と PDF の再パースには数百ミリ秒かかるため、小さな PDF は同じプロセス内で抽出する
+        if self.page_timeout > 0 and num_pages >= self.parallel_min_pages:
+            yield from self._iter_pages_isolated(binary_content, reader, num_pages)
+        else:
+            yield from self._iter_pages_serial(reader, 0, num_pages, 0)
+
+    def _iter_pages_serial(self, reader: "PdfReader", start: int, stop: int, offset: int) -> Iterator[PageText]:
+        for page_number in range(start, stop):
+            text = reader.pages[page_number].extract_text() or ""
+            yield PageText(page_number=page_number, offset=offset, text=text)
+            offset += len(text)
+
+    def _iter_pages_isolated(self, binary_content: bytes, reader: "PdfReader", num_pages: int) -> Iterator[PageText]:
+        """
+        子プロセスで逐次抽出し、page_timeout 秒以内に届かないページは空として扱う。
+        詰まった子プロセスは終了させ、次のページから新しい子プロセスで続ける。
+        """
+        context = multiprocessing.get_context("spawn")
+        page_number = 0
+        offset = 0
+        while page_number < num_pages:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_extract_pages_to_pipe, args=(sender, binary_content, page_number, num_pages), daemon=True)
+            try:
+                process.start()
+            except OSError:
+                logger.warning("Child process is not available, extracting remaining pages without a timeout")
+                receiver.close()
+                sender.close()
+                yield from self._iter_pages_serial(reader, page_number, num_pages, offset)
+                return
+            sender.close()
+            try:
+                ready = self._wait_worker_ready(receiver)
+                while ready and page_number < num_pages:
+                    received = receiver.poll(self.page_timeout)
+                    text = ""
+                    if received:
+                        try:
+                            _, text = receiver.recv()
+                        except EOFError:
+                            logger.warning("Child process exited while extracting page %d", page_number)
+                            received = False
+                    else:
+                        # 1 ページの処理が詰まっても全体を止めないよう、そのページは空として扱う
+                        logger.warning("Timed out extracting page %d", page_number)
+                    yield PageText(page_number=page_number, offset=offset, text=text)
+                    offset += len(text)
+                    page_number += 1
+                    if not received:
+                        # 詰まった（または終了した）子プロセスは捨てて、次のページから起動し直す
+                        break
+            finally:
+                process.kill()
+                process.join()
+                receiver.close()
+            if not ready:
+                # 残りのページを捨てて途中までのテキストを返さないよう、同じプロセス内で抽出し直す
+                logger.warning("Child process failed to parse PDF, extracting remaining pages without a timeout")
+                yield from self._iter_pages_serial(reader, page_number, num_pages, offset)
+                return
+
+    def _wait_worker_ready(self, receiver: Connection) -> bool:
+        try:
+            if receiver.poll(WORKER_START_TIMEOUT_SECONDS):
+                receiver.recv()
+                return True
+        except EOFError:
+            pass
+        return False
+
+    def _iter_pages_parallel(self, pool: Pool, num_pages: int) -> Iterator[PageText]:
+        try:
+            results: list[AsyncResult[str]] = [pool.apply_async(_extract_page, (page_number,)) for page_number in range(num_pages)]
+            offset = 0
+            for page_number, result in enumerate(results):
+                try:
+                    text = result.get(timeout=self.page_timeout or None)
+                except multiprocessing.TimeoutError:
+                    # 1 ページの処理が詰まっても全体を止めないよう、そのページは空として扱う
+                    logger.warning("Timed out extracting page %d", page_number)
+                    text = ""
+                except Exception:
+                    logger.exception("Failed to extract page %d", page_number)
+                    text = ""
+                yield PageText(page_number=page_number, offset=offset, text=text)
+                offset += len(text)
+        finally:
+            # 処理が詰まったワーカーも含めて確実に終了させる
+            pool.terminate()
@@ -0,0 +1,45 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 新形式（2401.00001）と旧形式（hep-th/9901001）の ID。どちらも末尾にバージョン（v2 など）が付くことがある
+_ARXIV_ID = r"(?:\d{4}\.\d{4,5}|[a-z][a-z-]*(?:\.[a-z]{2})?/\d{7})(?:v\d+)?"
+ARXIV_ID_PATTERN = re.compile(rf"arxiv\.org/(?:abs|pdf|html)/(?P<arxiv_id>{_ARXIV_ID})", re.IGNORECASE)
+BARE_ARXIV_ID_PATTERN = re.compile(rf"^(?:arxiv:)?(?P<arxiv_id>{_ARXIV_ID})$", re.IGNORECASE)
+ARXIV_VERSION_PATTERN = re.compile(r"v\d+$")
+TRACKING_QUERY_PREFIXES = ("utm_", "fbclid", "gclid", "ref_src")
+
+
+def extract_arxiv_id(url: str) -> str | None:
+    """
+    arXiv の URL（abs / pdf / html、export.arxiv.org なども含む）や "arXiv:2401.00001" から論文 ID を取り出す。
+    バージョンが指定されていれば残す。arXiv 以外の URL では None を返す。
+    """
+    match = ARXIV_ID_PATTERN.search(url.strip()) or BARE_ARXIV_ID_PATTERN.match(url.strip())
+    if not match:
+        return None
+    return match.group("arxiv_id")
+
+
+def strip_arxiv_version(arxiv_id: str) -> str:
+    return ARXIV_VERSION_PATTERN.sub("", arxiv_id)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    同じ論文・ページを指す URL が同じ文字列になるよう正規化する。
+    スキーム・ホストの小文字化、フラグメントとトラッキング用クエリの除去、末尾スラッシュの除去を行う。
+    """
+    parts = urlsplit(url.strip())
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if not key.lower().startswith(TRACKING_QUERY_PREFIXES)
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ""))
+
+
+def content_key(url: str) -> str:
+    """キャッシュ等で使う論文の識別子。arXiv の場合は URL の形式によらず ID で識別する"""
+    arxiv_id = extract_arxiv_id(url)
+    if arxiv_id:
+        return f"arxiv:{arxiv_id}"
+    return canonicalize_url(url)
@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import httpx
+import requests  # type: ignore[import-untyped]
+from requests.adapters import HTTPAdapter  # type: ignore[import-untyped]
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    from notion_client import Client
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HTTPClientPool:
+    """
+    Slack / Notion / OpenAI / ダウンロードで共有する HTTP クライアント。
+    keep-alive で接続を使い回し、Lambda のウォームスタート間でも TLS ハンドシェイクを省く。
+    injector にシングルトンとして登録して使う。
+    """
+
+    def __init__(self) -> None:
+        # 接続先ホストごとのコネクションプールの数と、各プールの最大接続数
+        self.pool_connections = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+        self.pool_maxsize = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))
+        self.max_retries = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+        self._lock = threading.Lock()
+        self._session: requests.Session | None = None
+        self._openai_http_client: httpx.Client | None = None
+        self._notion_clients: dict[str, Client] = {}
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self) -> requests.Session:
+        # POST は冪等でないため、リトライは GET などの冪等なメソッドに限る（urllib3 のデフォルト）
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize)
+
+    @property
+    def openai_http_client(self) -> httpx.Client:
+        """
+        OpenAI クライアントの http_client に渡す。通常の呼び出しは SDK のリトライを切り（max_retries=0）、
+        締め切りに合わせて RequestPolicy でリトライする。SDK の max_retries を使うのは Batch API のクライアントだけ
+        """
+        from openai import DefaultHttpxClient
+
+        with self._lock:
+            if self._openai_http_client is None:
+                self._openai_http_client = DefaultHttpxClient(limits=self.httpx_limits)
+            return self._openai_http_client
+
+    def notion_client(self, auth: str) -> "Client":
+        from notion_client import Client
+
+        # Notion の SDK は渡した httpx クライアントのヘッダ等を書き換えるため、他の SDK とは共有しない
+        with self._lock:
+            if auth not in self._notion_clients:
+                transport = httpx.HTTPTransport(limits=self.httpx_limits, retries=self.max_retries)
+                # ベンチマークなどでスタブのサーバーに向けるときは NOTION_API_BASE_URL で上書きする
+                options = {"auth": auth, "base_url": os.environ.get("NOTION_API_BASE_URL", "https://api.notion.com")}
+                self._notion_clients[auth] = Client(options=options, client=httpx.Client(transport=transport))
+            return self._notion_clients[auth]
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from src.domain.services import IIdempotencyStore
+from src.utils.storage import is_async_mode, is_container_local
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_DONE = "done"
+
+
+class IdempotencyStoreError(Exception):
+    pass
+
+
+class InMemoryIdempotencyStore(IIdempotencyStore):
+    """
+    キーごとに (状態, 有効期限) を保持する。
+    処理中のまま in_progress_ttl を過ぎたキー（途中で落ちた処理など）は再び取得できる。
+    """
+
+    def __init__(self, in_progress_ttl: float = 900, done_ttl: float = 86400) -> None:
+        self.in_progress_ttl = in_progress_ttl
+        self.done_ttl = done_ttl
+        self._entries: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._entries[key] = (STATUS_IN_PROGRESS, now + self.in_progress_ttl)
+            # 期限切れのエントリを掃除する
+            for expired_key in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[expired_key]
+            return True
+
+    def mark_done(self, key: str) -> None:
+        with self._lock:
+            self._entries[key] = (STATUS_DONE, time.time() + self.done_ttl)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteIdempotencyStore(IIdempotencyStore):
+    def __init__(self, path: str, in_progress_ttl: float = 900, done_ttl: float = 86400) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.in_progress_ttl = in_progress_ttl
+        self.done_ttl = done_ttl
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys (key TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def try_acquire(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            # 期限切れのキーを消してから挿入を試みる。既にキーがあれば挿入されない
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO idempotency_keys (key, status, expires_at) VALUES (?, ?, ?)",
+                    (key, STATUS_IN_PROGRESS, now + self.in_progress_ttl),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def mark_done(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, status, expires_at) VALUES (?, ?, ?)",
+                (key, STATUS_DONE, time.time() + self.done_ttl),
+            )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+
+def create_idempotency_store_from_env() -> IIdempotencyStore:
+    """
+    IDEMPOTENCY_BACKEND: "sqlite"（デフォルト） / "memory"、IDEMPOTENCY_PATH: sqlite の保存先。
+    SLACK_EVENT_MODE=async では、再送を受けたインスタンスとワーカーが処理済みの記録を共有する必要があるため、
+    /tmp などコンテナごとに分かれる場所は使わない（EFS など共有ストレージ上のパスを IDEMPOTENCY_PATH に指定する）。
+    """
+    backend = os.environ.get("IDEMPOTENCY_BACKEND", "sqlite")
+    path = os.environ.get("IDEMPOTENCY_PATH", "/tmp/ai-paper-summarizer/idempotency.sqlite3")  # noqa: S108
+    if is_async_mode() and (backend == "memory" or (backend == "sqlite" and is_container_local(path))):
+        msg = f"SLACK_EVENT_MODE=async needs IDEMPOTENCY_PATH on storage shared with the worker ({backend}: {path})"
+        raise IdempotencyStoreError(msg)
+    if backend == "memory":
+        return InMemoryIdempotencyStore()
+    if backend == "sqlite":
+        return SQLiteIdempotencyStore(path)
+    msg = f"Unknown idempotency store backend: {backend}"
+    raise IdempotencyStoreError(msg)
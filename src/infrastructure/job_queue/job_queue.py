@@ -0,0 +1,131 @@
+from collections import deque
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any
+import uuid
+
+from src.domain.models import Job
+from src.domain.services import IJobQueue
+from src.utils.storage import is_async_mode, is_container_local
+
+
+class JobQueueError(Exception):
+    pass
+
+
+class InMemoryJobQueue(IJobQueue):
+    """同一プロセス内でのみ共有されるジョブキュー（テスト・ローカル実行用）"""
+
+    def __init__(self, max_attempts: int = 3) -> None:
+        self.max_attempts = max_attempts
+        self._jobs: deque[Job] = deque()
+        self._lock = threading.Lock()
+
+    def enqueue(self, event_id: str, event: dict[str, Any]) -> str:
+        job = Job(job_id=uuid.uuid4().hex, event_id=event_id, event=event)
+        with self._lock:
+            self._jobs.append(job)
+        return job.job_id
+
+    def dequeue(self) -> Job | None:
+        with self._lock:
+            if not self._jobs:
+                return None
+            job = self._jobs.popleft()
+        job.attempts += 1
+        return job
+
+    def complete(self, job: Job) -> None:
+        _ = job
+
+    def fail(self, job: Job) -> None:
+        if job.attempts < self.max_attempts:
+            with self._lock:
+                self._jobs.append(job)
+
+
+class SQLiteJobQueue(IJobQueue):
+    """
+    SQLite をバックエンドにしたジョブキュー。
+    取り出したジョブは visibility_timeout の間だけ他から見えなくなり、complete されないまま時間が過ぎると再び取り出せる。
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 900, max_attempts: int = 3) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, event_id TEXT NOT NULL, event TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def enqueue(self, event_id: str, event: dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, event_id, event, available_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, event_id, json.dumps(event, ensure_ascii=False), now, now),
+            )
+        return job_id
+
+    def dequeue(self) -> Job | None:
+        now = time.time()
+        with self._lock:
+            # 複数プロセスから同時に取り出しても同じジョブを二重に取らないよう、書き込みロックを取ってから選ぶ
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT job_id, event_id, event, attempts FROM jobs "
+                    "WHERE available_at <= ? AND attempts < ? ORDER BY created_at LIMIT 1",
+                    (now, self.max_attempts),
+                ).fetchone()
+                if row is None:
+                    self._connection.execute("COMMIT")
+                    return None
+                self._connection.execute(
+                    "UPDATE jobs SET attempts = attempts + 1, available_at = ? WHERE job_id = ?",
+                    (now + self.visibility_timeout, row[0]),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return Job(job_id=row[0], event_id=row[1], event=json.loads(row[2]), attempts=row[3] + 1)
+
+    def complete(self, job: Job) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE job_id = ?", (job.job_id,))
+
+    def fail(self, job: Job) -> None:
+        # 失敗したジョブは少し時間を置いてから再び取り出せるようにする（上限回数に達したものは残すだけ）
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET available_at = ? WHERE job_id = ?", (time.time() + 30 * job.attempts, job.job_id))
+
+
+def create_job_queue_from_env() -> IJobQueue:
+    """
+    JOB_QUEUE_BACKEND: "sqlite"（デフォルト） / "memory"、JOB_QUEUE_PATH: sqlite の保存先。
+    SLACK_EVENT_MODE=async では、イベントを受けるインスタンスとワーカーが同じキューを読み書きする必要があるため、
+    /tmp などコンテナごとに分かれる場所のキューは使わない（EFS など共有ストレージ上のパスを JOB_QUEUE_PATH に指定する）。
+    """
+    backend = os.environ.get("JOB_QUEUE_BACKEND", "sqlite")
+    path = os.environ.get("JOB_QUEUE_PATH", "/tmp/ai-paper-summarizer/jobs.sqlite3")  # noqa: S108
+    if is_async_mode() and (backend == "memory" or (backend == "sqlite" and is_container_local(path))):
+        msg = f"SLACK_EVENT_MODE=async needs JOB_QUEUE_PATH on storage shared with the worker ({backend}: {path})"
+        raise JobQueueError(msg)
+    if backend == "memory":
+        return InMemoryJobQueue()
+    if backend == "sqlite":
+        return SQLiteJobQueue(path)
+    msg = f"Unknown job queue backend: {backend}"
+    raise JobQueueError(msg)
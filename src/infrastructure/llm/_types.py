@@ -1,6 +1,6 @@
 from typing import Any, TypeVar
 
-from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessageParam
 
 # -----------------------------
 # Type definitions
@@ -9,5 +9,6 @@ LLMInputType = TypeVar("LLMInputType")
 LLMOutputType = TypeVar("LLMOutputType")
 Messages = list[ChatCompletionMessageParam]
 Response = ChatCompletion
+ResponseChunk = ChatCompletionChunk
 LLMSettings = dict[str, Any]
 ClientSettings = dict[str, Any]
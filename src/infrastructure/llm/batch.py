@@ -0,0 +1,62 @@
+import json
+import logging
+import time
+from typing import Any, Final
+
+from openai import OpenAI
+
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT: Final = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+HTTP_OK = 200
+
+
+class LLMBatchError(Exception):
+    pass
+
+
+class BatchJobClient:
+    """
+    OpenAI の Batch API に、chat.completions のリクエストを JSONL にまとめて投入し、結果を回収する。
+    通常の呼び出しより安価でスループットが高い代わりに、結果が返るまで数分〜最大 24 時間かかる。
+    """
+
+    def __init__(self, client: OpenAI, poll_interval_seconds: float) -> None:
+        self.client = client
+        self.poll_interval_seconds = poll_interval_seconds
+
+    def submit(self, requests: list[dict[str, Any]]) -> str:
+        """リクエスト（custom_id, method, url, body）を投入し、バッチジョブの ID を返す"""
+        content = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests).encode()
+        with span("llm.batch_submit", requests=len(requests)):
+            input_file = self.client.files.create(file=("batch.jsonl", content), purpose="batch")
+            batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h")
+        logger.info("Batch submitted: %s (%d requests)", batch.id, len(requests))
+        return batch.id
+
+    def wait(self, batch_id: str) -> dict[str, dict[str, Any]]:
+        """
+        バッチジョブの終了を待ち、custom_id ごとの結果行を返す。
+        個々のリクエストの失敗は結果行の error / status_code に入る。ジョブが failed / expired / cancelled で終わった場合も、
+        それまでに得られた結果だけを返す（結果の無いリクエストは呼び出し側で失敗として扱う）。
+        """
+        with span("llm.batch_wait", batch_id=batch_id):
+            batch = self.client.batches.retrieve(batch_id)
+            while batch.status not in TERMINAL_STATUSES:
+                logger.info("Batch %s is %s: %s", batch_id, batch.status, batch.request_counts)
+                time.sleep(self.poll_interval_seconds)
+                batch = self.client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            # 期限切れやキャンセルでも、完了したリクエストの結果は output_file_id に残る
+            logger.error("Batch %s finished with status %s: %s (%s)", batch_id, batch.status, batch.errors, batch.request_counts)
+        results: dict[str, dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                for line in self.client.files.content(file_id).text.splitlines():
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["custom_id"]] = result
+        return results
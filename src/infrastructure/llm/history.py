@@ -0,0 +1,99 @@
+from collections.abc import Callable
+import hashlib
+import json
+import logging
+import math
+from typing import Any
+
+from src.infrastructure.cache.cache import AbstractCache
+from src.infrastructure.llm.tokenizer import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "これまでの会話の要約:\n"
+
+
+class ConversationCompactor:
+    """
+    会話の履歴をプロンプトのトークン予算に収める。
+    新しいやりとりはそのまま残し、収まらない古いやりとりは要約（rolling summary）に畳み込む。
+    要約は畳み込んだ範囲ごとにキャッシュし、次の返信では続きのやりとりだけを追加で要約する。
+    "pinned": True のメッセージ（論文の抜粋など）は畳み込まずに残す。
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        token_counter: TokenCounter,
+        summarize: Callable[[str, list[dict[str, Any]]], str],
+        cache: AbstractCache | None,
+        prompt_token_budget: int,
+        summary_tokens: int,
+        fold_step: int = 6,
+    ) -> None:
+        self.token_counter = token_counter
+        self.summarize = summarize
+        self.cache = cache
+        self.prompt_token_budget = prompt_token_budget
+        self.summary_tokens = summary_tokens
+        # 畳み込む範囲を fold_step 件単位で広げ、返信のたびに要約し直さないようにする
+        self.fold_step = fold_step
+
+    def compact(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if self.token_counter.count_messages(messages) <= self.prompt_token_budget:
+            return messages
+        pinned = self._fit_pinned([message for message in messages if message.get("pinned")])
+        history = [message for message in messages if not message.get("pinned")]
+        if not history:
+            return pinned
+        recent_budget = self.prompt_token_budget - self.token_counter.count_messages(pinned) - self.summary_tokens
+        split = self._recent_start(history, recent_budget)
+        if split > 0:
+            split = min(len(history) - 1, math.ceil(split / self.fold_step) * self.fold_step)
+        recent = history[split:]
+        if self.token_counter.count_messages(recent) > recent_budget:
+            # 最新のメッセージだけで予算を超える場合は、その内容を切り詰める
+            last = recent[-1]
+            recent = [{**last, "content": self.token_counter.truncate(str(last.get("content") or ""), max(recent_budget - 4, 0))}]
+        if split == 0:
+            return pinned + recent
+        summary = self._rolling_summary(history[:split])
+        logger.info("Compacted %d messages into a summary, keeping %d recent messages", split, len(recent))
+        return [*pinned, {"role": "system", "content": SUMMARY_PREFIX + summary}, *recent]
+
+    def _fit_pinned(self, pinned: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # 固定のメッセージには予算の半分までを割り当てる
+        if not pinned or self.token_counter.count_messages(pinned) <= self.prompt_token_budget // 2:
+            return pinned
+        per_message = self.prompt_token_budget // 2 // len(pinned)
+        return [{**message, "content": self.token_counter.truncate(str(message.get("content") or ""), per_message)} for message in pinned]
+
+    def _recent_start(self, history: list[dict[str, Any]], budget: int) -> int:
+        """末尾から予算に収まるだけ遡り、そのまま残す最初のメッセージの位置を返す（最新のメッセージは必ず残す）"""
+        used = 0
+        for idx in range(len(history) - 1, -1, -1):
+            used += self.token_counter.count_messages([history[idx]])
+            if used > budget:
+                return min(idx + 1, len(history) - 1)
+        return 0
+
+    def _rolling_summary(self, folded: list[dict[str, Any]]) -> str:
+        # 先頭から idx 件目までのやりとりを表すキャッシュキー
+        digest = hashlib.sha256()
+        keys = []
+        for message in folded:
+            digest.update(json.dumps([message.get("role"), message.get("content")], ensure_ascii=False).encode())
+            keys.append("history:" + digest.hexdigest())
+        # 以前の返信で要約済みの、最も長い先頭部分から続ける
+        start, previous = 0, ""
+        if self.cache is not None:
+            for idx in range(len(folded), 0, -1):
+                cached = self.cache.get(keys[idx - 1])
+                if cached is not None:
+                    start, previous = idx, cached
+                    break
+        if start == len(folded):
+            return previous
+        summary = self.summarize(previous, folded[start:])
+        if self.cache is not None:
+            self.cache.set(keys[-1], summary)
+        return summary
@@ -1,33 +1,167 @@
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Iterator
+import json
+import logging
 import os
-from typing import Any, Generic
+import time
+from typing import Any, Generic, TypeVar
 
-from openai import OpenAI
+from injector import inject
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
+from pydantic import BaseModel, ValidationError
 
+from src.domain.models import PaperSummary
 from src.domain.services import ILLMService
-from src.infrastructure.llm._types import ClientSettings, LLMInputType, LLMOutputType, LLMSettings, Messages, Response
-from src.infrastructure.llm.utils import dict2json, json2dict
+from src.infrastructure.cache.cache import AbstractCache, InMemoryLRUCache, create_cache_from_env, hash_key
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.llm._types import ClientSettings, LLMInputType, LLMOutputType, LLMSettings, Messages, Response, ResponseChunk
+from src.infrastructure.llm.batch import BATCH_ENDPOINT, HTTP_OK, BatchJobClient, LLMBatchError
+from src.infrastructure.llm.history import ConversationCompactor
+from src.infrastructure.llm.schemas import (
+    CATEGORIES,
+    BriefDigestOutput,
+    CategoryOutput,
+    LLMOutputError,
+    SummaryAnswers,
+    TitleOutput,
+    answers_output,
+    response_format,
+    validation_errors,
+)
+from src.infrastructure.llm.tokenizer import TokenCounter
+from src.infrastructure.llm.usage import TokenUsageTracker, usage_fields
+from src.infrastructure.llm.utils import dict2json
+from src.infrastructure.llm.windowing import InputWindow, front_matter, head_window, render_summary
+from src.utils.concurrency import SingleFlight, iter_concurrently, map_concurrently
+from src.utils.deadline import RequestPolicy, timeout_for
+from src.utils.tracing import record_span, set_attributes, span
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_QUESTION_TEXTS = {
+    "Q1": "何に関する論文か、専門外の研究者向けに詳しく説明してください。",
+    "Q2": "論文の内容を、背景、新規性、方法などに分けて詳しく説明してください。",
+    "Q3": "本研究の手法について特筆すべき部分を、詳しく説明してください。",
+    "Q4": "本研究の成果や知見について特筆すべき部分を、詳しく説明してください。",
+    "Q5": "本研究の限界について特筆すべき部分を、詳しく説明してください。",
+    "Q6": "この論文中の記載で曖昧な部分を、詳しく説明してください。",
+    "Q7": "引用されている論文の中で特筆すべきものを列挙し、本研究との関連性や違いを詳しく説明してください。",
+    "Q8": "本研究で用いたデータセットを網羅的に列挙し、名前やURLなどがあればそれらも含めて詳しく説明してください。",
+}
+SUMMARY_QUESTIONS = list(SUMMARY_QUESTION_TEXTS)
+SUMMARY_FAILURE_MESSAGE = "この質問への回答の生成に失敗しました。"
+SUMMARY_MAX_REASKS = 1
+# スキーマに合わない出力を、出力だけを渡して直させる回数
+OUTPUT_MAX_REPAIRS = 1
+# リトライする OpenAI の例外（タイムアウト・接続エラー・レート制限・サーバーエラー）
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+# map-reduce で要約し直しても予算に収まらない場合に、何段まで reduce を繰り返すか
+MAX_REDUCE_ROUNDS = 2
+# map-reduce で要点を抜き出せたチャンクがこの割合に満たなければ、欠けた要約を渡さずに失敗とする
+CONDENSE_MIN_SUCCESS_RATIO = 0.5
+# 会話の古いやりとりを畳み込んだ要約の最大トークン数
+HISTORY_SUMMARY_TOKENS = 1024
+# ダイジェストには、論文の概要・内容・手法・成果の回答だけを渡す
+DIGEST_QUESTIONS = ["Q1", "Q2", "Q3", "Q4"]
+
+
+class LLMCondenseError(Exception):
+    pass
+
+
+def parse_question_groups(groups_str: str) -> list[list[str]]:
+    """
+    "Q1,Q2,Q3,Q4;Q5,Q6,Q7,Q8" のような文字列を質問グループのリストに変換する。
+    """
+    groups = [[question.strip() for question in group.split(",") if question.strip()] for group in groups_str.split(";")]
+    return [group for group in groups if group]
+
+
+def to_answer_key(question: str) -> str:
+    return f"{question}: {SUMMARY_QUESTION_TEXTS.get(question, 'No Question')}"
 
 
 # -----------------------------
 # Abstract Base Class
 # -----------------------------
 class AbstractLLM(ABC, Generic[LLMInputType, LLMOutputType]):
-    def __init__(self, model: str, llm_settings: LLMSettings, client_settings: ClientSettings) -> None:
+    # 同じ入力に同じ応答を返してよい処理かどうか。False のクラスはレスポンスキャッシュを使わない
+    cacheable = True
+    # 同一リクエストが同時に飛んだ場合に API 呼び出しを 1 回にまとめる（インスタンス間で共有）
+    _single_flight = SingleFlight()
+    # 論文のどの部分を入力にするか。LLMService が入力を渡す前に切り出す
+    input_window = InputWindow()
+    # 出力のスキーマ。指定したクラスは JSON Schema で出力の形式を強制し、応答を検証する（None は自由なテキスト）
+    output_schema: type[BaseModel] | None = None
+
+    def __init__(  # noqa: PLR0913
+        self,
+        model: str,
+        llm_settings: LLMSettings,
+        client_settings: ClientSettings,
+        response_cache: AbstractCache | None = None,
+        usage_tracker: TokenUsageTracker | None = None,
+        request_policy: RequestPolicy | None = None,
+    ) -> None:
         self.llm_settings = llm_settings
         self.model = model
         self.client = OpenAI(**client_settings)
+        self.response_cache = response_cache
+        self.usage_tracker = usage_tracker
+        self.request_policy = request_policy or RequestPolicy()
 
     @abstractmethod
     def preprocess(self, inputs: LLMInputType) -> Messages:
         pass
 
-    def _generate(self, messages: Messages) -> Response:
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            **self.llm_settings,
+    def response_schema(self, inputs: LLMInputType) -> type[BaseModel] | None:
+        """API に送る出力のスキーマ。依頼内容によってキーが変わる場合に上書きする"""
+        _ = inputs
+        return self.output_schema
+
+    def _request_settings(self, inputs: LLMInputType) -> LLMSettings:
+        return self._settings_for(self.response_schema(inputs))
+
+    def _settings_for(self, schema: type[BaseModel] | None) -> LLMSettings:
+        if schema is None:
+            return self.llm_settings
+        return {**self.llm_settings, "response_format": response_format(schema)}
+
+    def _generate(self, messages: Messages, llm_settings: LLMSettings) -> Response:
+        with span(f"llm.{type(self).__name__}", model=self.model):
+            if not self.cacheable or self.response_cache is None:
+                return self._create_completion(messages, llm_settings)
+            cache_key = self._cache_key(messages, llm_settings)
+            cached = self.response_cache.get(cache_key)
+            set_attributes(cache_hit=cached is not None)
+            if cached is not None:
+                return Response.model_validate_json(cached)
+            return self._single_flight.do(cache_key, lambda: self._create_and_cache(cache_key, messages, llm_settings))
+
+    def _cache_key(self, messages: Messages, llm_settings: LLMSettings) -> str:
+        request = {"model": self.model, "messages": messages, "llm_settings": llm_settings}
+        return "llm:" + hash_key(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _create_and_cache(self, cache_key: str, messages: Messages, llm_settings: LLMSettings) -> Response:
+        response = self._create_completion(messages, llm_settings)
+        if self.response_cache is not None:
+            self.response_cache.set(cache_key, response.model_dump_json())
+        return response
+
+    def _create_completion(self, messages: Messages, llm_settings: LLMSettings) -> Response:
+        # タイムアウトとリトライは、呼び出し全体の締め切りに合わせて request_policy で行う
+        response = self.request_policy.call(
+            lambda timeout: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=timeout,
+                **llm_settings,
+            ),
+            RETRYABLE_ERRORS,
         )
+        usage = self.usage_tracker.record(type(self).__name__, response) if self.usage_tracker else usage_fields(response)
+        set_attributes(**usage)
         return response
 
     @abstractmethod
@@ -36,14 +170,125 @@ class AbstractLLM(ABC, Generic[LLMInputType, LLMOutputType]):
 
     def __call__(self, inputs: LLMInputType) -> LLMOutputType:
         messages = self.preprocess(inputs)
-        response = self._generate(messages)
-        return self.postprocess(response)
+        schema = self.response_schema(inputs)
+        llm_settings = self._settings_for(schema)
+        response = self._generate(messages, llm_settings)
+        return self.postprocess(self._ensure_valid(response, schema, llm_settings, messages))
+
+    def _ensure_valid(
+        self,
+        response: Response,
+        schema: type[BaseModel] | None,
+        llm_settings: LLMSettings,
+        messages: Messages | None = None,
+    ) -> Response:
+        """
+        応答を API に送ったスキーマで検証する。不正な場合は、論文を含むプロンプトを送り直すのではなく、
+        出力と不正なフィールドだけを渡して直させる。直せなければ LLMOutputError を送出する。
+        キャッシュには検証を通った応答だけを残す（直した応答は元のリクエストのキーに置き直す）。
+        """
+        if schema is None:
+            return response
+        cache_keys = [] if messages is None else [self._cache_key(messages, llm_settings)]
+        for repairs in range(OUTPUT_MAX_REPAIRS + 1):
+            content = response.choices[0].message.content or ""
+            try:
+                schema.model_validate_json(content)
+            except ValidationError as e:
+                errors = validation_errors(e)
+            else:
+                if repairs > 0:
+                    self._replace_cached(cache_keys, response)
+                return response
+            # 出力が空（拒否など）の場合は、直す元が無いため修正を依頼しない
+            if repairs == OUTPUT_MAX_REPAIRS or not content.strip():
+                break
+            logger.warning("Invalid output from %s, requesting a repair:\n%s", type(self).__name__, errors)
+            repair_messages = self._repair_messages(content, errors)
+            cache_keys.append(self._cache_key(repair_messages, llm_settings))
+            response = self._generate(repair_messages, llm_settings)
+        # 不正な応答がキャッシュに残ると、同じ論文をやり直しても API を呼ばずに同じ失敗を繰り返すため消す
+        self._replace_cached(cache_keys, None)
+        msg = f"Invalid output from {type(self).__name__}:\n{errors}"
+        raise LLMOutputError(msg)
+
+    def _replace_cached(self, cache_keys: list[str], response: Response | None) -> None:
+        """不正だった応答のキャッシュを消し、直した応答があれば最初のリクエストのキーに保存する"""
+        if not self.cacheable or self.response_cache is None:
+            return
+        for cache_key in cache_keys:
+            self.response_cache.delete(cache_key)
+        if response is not None and cache_keys:
+            self.response_cache.set(cache_keys[0], response.model_dump_json())
+
+    def _repair_messages(self, content: str, errors: str) -> Messages:
+        system_prompt = (
+            "あなたは JSON の修正AIである。与えられる出力は指定された JSON Schema に合っていない。\n"
+            "指摘された誤りだけを直し、それ以外の内容は変えずに出力せよ。出力が途中で切れている場合は、切れた部分を短くまとめて閉じること。"
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"# 誤り\n{errors}\n\n# 出力\n{content}"},
+        ]
+
+    def stream(self, inputs: LLMInputType) -> Iterator[str]:
+        """
+        __call__ のストリーミング版。生成されたテキストを届いた順に断片ごとに返す。
+        postprocess は通さず、レスポンスキャッシュも使わない。
+        """
+        messages = self.preprocess(inputs)
+        started_at = time.perf_counter()
+        chunks = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout_for(self.request_policy.timeout, self.request_policy.reserve),
+            **self._request_settings(inputs),
+        )
+        attributes: dict[str, Any] = {"model": self.model, "stream": True}
+        for chunk in chunks:
+            attributes.update(self._record_chunk_usage(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                attributes.setdefault("time_to_first_token_ms", (time.perf_counter() - started_at) * 1000)
+                yield chunk.choices[0].delta.content
+        record_span(f"llm.{type(self).__name__}", started_at, **attributes)
+
+    def batch_request(self, custom_id: str, inputs: LLMInputType) -> dict[str, Any]:
+        """Batch API の入力ファイルの 1 行分のリクエストを作る"""
+        body = {"model": self.model, "messages": self.preprocess(inputs), **self._request_settings(inputs)}
+        return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+    def parse_batch_result(self, result: dict[str, Any], inputs: LLMInputType) -> LLMOutputType:
+        """
+        Batch API の結果ファイルの 1 行を postprocess に通す。
+        inputs は依頼したスキーマを作り直すためだけに使う（response_schema が参照する項目があればよい）。
+        """
+        response_body = result.get("response") or {}
+        if result.get("error") or response_body.get("status_code") != HTTP_OK:
+            msg = f"Batch request {result.get('custom_id')} failed: {result.get('error') or response_body.get('body')}"
+            raise LLMBatchError(msg)
+        response = Response.model_validate(response_body["body"])
+        if self.usage_tracker is not None:
+            self.usage_tracker.record(type(self).__name__, response)
+        schema = self.response_schema(inputs)
+        return self.postprocess(self._ensure_valid(response, schema, self._settings_for(schema)))
+
+    def _record_chunk_usage(self, chunk: ResponseChunk) -> dict[str, Any]:
+        # include_usage を指定すると、最後のチャンクにだけ usage が入る
+        if self.usage_tracker is not None:
+            return self.usage_tracker.record(type(self).__name__, chunk)
+        return usage_fields(chunk)
 
 
 # -----------------------------
 # Concrete Classes
 # -----------------------------
 class TitleExtractor(AbstractLLM[str, str]):
+    # タイトルは 1 ページ目の冒頭にある
+    input_window = InputWindow(kind="head", max_tokens=1024)
+    output_schema = TitleOutput
+
     def preprocess(self, inputs: str) -> Messages:
         output_format = {"title": "(string) Title of the content"}
         system_prompt = f"あなたは研究論文のタイトル抽出AIである。以下の形式に従い論文タイトルを抽出せよ。\n{dict2json(output_format)}"
@@ -53,38 +298,40 @@ class TitleExtractor(AbstractLLM[str, str]):
         ]
 
     def postprocess(self, response: Response) -> str:
-        output_dict = json2dict(response.choices[0].message.content or "")
-        return output_dict.get("title", "No Title")
+        output = TitleOutput.model_validate_json(response.choices[0].message.content or "")
+        return output.title.strip() or "No Title"
 
 
 class ContentSummarizer(AbstractLLM[dict[str, Any], dict[str, str]]):
+    answer_rules = (
+        "# 注意\n"
+        "- 出力は日本語で行うこと。その他の言語は一切認めません。ただし、専門用語と思われる単語はそのままでも良い。\n"
+        "- 可能な限り詳細に出力すること。だたし、最大300字程度とする。\n"
+        "- 敬語は使用しないこと。「〜である」、「〜だ」のような形式にすること。\n"
+        "- markdown形式は使用しないこと。特に、**bold** と __italics__ は使用しないこと。\n"
+        "- 見やすいように改行を入れること。箇条書きは・を使って表現すること。"
+    )
+    output_schema = SummaryAnswers
+
     @property
     def questions(self) -> dict[str, str]:
-        return {
-            "Q1": "何に関する論文か、専門外の研究者向けに詳しく説明してください。",
-            "Q2": "論文の内容を、背景、新規性、方法などに分けて詳しく説明してください。",
-            "Q3": "本研究の手法について特筆すべき部分を、詳しく説明してください。",
-            "Q4": "本研究の成果や知見について特筆すべき部分を、詳しく説明してください。",
-            "Q5": "本研究の限界について特筆すべき部分を、詳しく説明してください。",
-            "Q6": "この論文中の記載で曖昧な部分を、詳しく説明してください。",
-            "Q7": "引用されている論文の中で特筆すべきものを列挙し、本研究との関連性や違いを詳しく説明してください。",
-            "Q8": "本研究で用いたデータセットを網羅的に列挙し、名前やURLなどがあればそれらも含めて詳しく説明してください。",
-        }
+        return SUMMARY_QUESTION_TEXTS
 
     def to_questions_str(self, question: str) -> str:
         return self.questions.get(question, "No Question")
 
+    def to_answer_key(self, question: str) -> str:
+        return to_answer_key(question)
+
+    def response_schema(self, inputs: dict[str, Any]) -> type[BaseModel]:
+        return answers_output((inputs["question"],))
+
     def preprocess(self, inputs: dict[str, Any]) -> Messages:
         output_format = {inputs["question"]: f"(string) Answer to {inputs['question']} in markdown format"}
         system_prompt = (
             "与えられる文章を読み、以下の問いに答えて下さい。\n"
             f"{inputs['question']}: {self.to_questions_str(inputs['question'])}\n"
-            "# 注意\n"
-            "- 出力は日本語で行うこと。その他の言語は一切認めません。ただし、専門用語と思われる単語はそのままでも良い。\n"
-            "- 可能な限り詳細に出力すること。だたし、最大300字程度とする。\n"
-            "- 敬語は使用しないこと。「〜である」、「〜だ」のような形式にすること。\n"
-            "- markdown形式は使用しないこと。特に、**bold** と __italics__ は使用しないこと。\n"
-            "- 見やすいように改行を入れること。箇条書きは・を使って表現すること。"
+            f"{self.answer_rules}"
             "以下の番号の質問に対して、以下の形式で回答してください。\n"
             "# 出力形式\n"
             f"{dict2json(output_format)}"
@@ -98,16 +345,72 @@ class ContentSummarizer(AbstractLLM[dict[str, Any], dict[str, str]]):
         ]
 
     def postprocess(self, response: Response) -> dict[str, str]:
-        output_dict = json2dict(response.choices[0].message.content or "")
-        new_output_dict = {}
-        for question, answer in output_dict.items():
-            new_output_dict[f"{question}: {self.to_questions_str(question)}"] = answer
-        return new_output_dict
+        answers = SummaryAnswers.model_validate_json(response.choices[0].message.content or "").root
+        return {self.to_answer_key(question): answer for question, answer in answers.items()}
+
+
+class BatchContentSummarizer(ContentSummarizer):
+    """
+    複数の質問に 1 回の completion でまとめて回答させる。
+    出力は質問 ID をキーにした JSON Schema で強制する。
+    """
+
+    def response_schema(self, inputs: dict[str, Any]) -> type[BaseModel]:
+        _ = inputs
+        return answers_output(tuple(self.target_questions))
+
+    def __init__(  # noqa: PLR0913
+        self,
+        questions: list[str],
+        model: str,
+        llm_settings: LLMSettings,
+        client_settings: ClientSettings,
+        response_cache: AbstractCache | None = None,
+        usage_tracker: TokenUsageTracker | None = None,
+        request_policy: RequestPolicy | None = None,
+    ) -> None:
+        self.target_questions = questions
+        super().__init__(
+            model=model,
+            llm_settings=llm_settings,
+            client_settings=client_settings,
+            response_cache=response_cache,
+            usage_tracker=usage_tracker,
+            request_policy=request_policy,
+        )
+
+    def preprocess(self, inputs: dict[str, Any]) -> Messages:
+        output_format = {question: f"(string) Answer to {question} in markdown format" for question in self.target_questions}
+        questions_str = "\n".join(f"{question}: {self.to_questions_str(question)}" for question in self.target_questions)
+        system_prompt = (
+            "与えられる文章を読み、以下の問いにそれぞれ答えて下さい。\n"
+            f"{questions_str}\n"
+            f"{self.answer_rules}"
+            "全ての番号の質問に対して、以下の形式で回答してください。\n"
+            "# 出力形式\n"
+            f"{dict2json(output_format)}"
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": "please summarize the following text:\n" + inputs["text"],
+            },
+        ]
+
+    def postprocess(self, response: Response) -> dict[str, str]:
+        answers = SummaryAnswers.model_validate_json(response.choices[0].message.content or "").root
+        # 依頼した質問のうち、空でない回答が得られたものだけを返す（欠けた質問は呼び出し側で問い直す）
+        return {self.to_answer_key(question): answers[question] for question in self.target_questions if answers.get(question, "").strip()}
 
 
 class CategoryClassifier(AbstractLLM[str, list[str]]):
+    # 分類にはタイトルとアブストラクトがあれば足りる
+    input_window = InputWindow(kind="front_matter", max_tokens=1536)
+    output_schema = CategoryOutput
+
     def preprocess(self, text: str) -> Messages:
-        output_format = {"category": "(list) [Generative Model, Audio, LLM, Agent, Survey, CV, World Model, Reinforcement Learning]"}
+        output_format = {"category": f"(list) [{', '.join(CATEGORIES)}]"}
         system_prompt = "あなたは論文分類の専門AIである。以下のテキストから適切なカテゴリを判定せよ。\n出力形式:\n" + dict2json(
             output_format
         )
@@ -117,12 +420,13 @@ class CategoryClassifier(AbstractLLM[str, list[str]]):
         ]
 
     def postprocess(self, response: Response) -> list[str]:
-        output_dict = json2dict(response.choices[0].message.content or "")
-        list_str = output_dict.get("category", "['No Category']")
-        return [item.strip() for item in list_str.strip("[]").split(",")]
+        output = CategoryOutput.model_validate_json(response.choices[0].message.content or "")
+        return list(output.category) or ["No Category"]
 
 
 class BrieflySummarizer(AbstractLLM[str, str]):
+    output_schema = BriefDigestOutput
+
     def preprocess(self, text: str) -> Messages:
         few_shot_list = [
             {"summary": "スマートフォンで音声を別の声に変換する高速モデル「LLVC」"},
@@ -138,11 +442,35 @@ class BrieflySummarizer(AbstractLLM[str, str]):
         ]
 
     def postprocess(self, response: Response) -> str:
-        output_dict = json2dict(response.choices[0].message.content or "")
-        return output_dict.get("summary", "No Summary")
+        return BriefDigestOutput.model_validate_json(response.choices[0].message.content or "").summary
+
+
+class ChunkNoteTaker(AbstractLLM[dict[str, Any], str]):
+    """長い文書を分割した各チャンクから、後段の処理に必要な情報を抜き出す（map-reduce の map）"""
+
+    def preprocess(self, inputs: dict[str, Any]) -> Messages:
+        system_prompt = (
+            "あなたは研究論文の読解AIである。"
+            f"与えられるテキストは長い文書を分割したうちの {inputs['index']}/{inputs['total']} 番目である。\n"
+            "後段でタイトル抽出・要約・分類・質問応答に使うため、この部分に含まれる重要な情報を漏れなく抜き出せ。\n"
+            "# 注意\n"
+            "- タイトル、著者、背景、新規性、手法、実験設定、数値結果、データセット名やURL、引用文献、限界などを優先すること。\n"
+            "- 固有名詞・数値・専門用語は原文のまま残すこと。\n"
+            "- 簡潔な箇条書きで出力すること。"
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": inputs["text"]},
+        ]
+
+    def postprocess(self, response: Response) -> str:
+        return response.choices[0].message.content or ""
 
 
 class ChatAssistant(AbstractLLM[list[dict[str, Any]], str]):
+    # 会話の応答は毎回生成し直す
+    cacheable = False
+
     def preprocess(self, messages: list[dict[str, Any]]) -> Messages:
         system_prompt = (
             "あなたはAI研究の専門家である。論文の内容に関するやりとりを踏まえて、ユーザーの質問に回答しなさい。\n"
@@ -160,37 +488,287 @@ class ChatAssistant(AbstractLLM[list[dict[str, Any]], str]):
         return response.choices[0].message.content or "No Response"
 
 
+class ConversationSummarizer(AbstractLLM[dict[str, Any], str]):
+    """プロンプトに収まらない古いやりとりを、以前の要約に統合して要約し直す"""
+
+    def preprocess(self, inputs: dict[str, Any]) -> Messages:
+        system_prompt = (
+            "あなたは会話の要約AIである。論文に関する質問応答のやりとりを、後続の質問に答えるために必要な情報を残して簡潔に要約せよ。\n"
+            "# 注意\n"
+            "- 質問の内容と回答の要点、数値・固有名詞・専門用語は残すこと。\n"
+            "- 以前の要約が与えられた場合は、新しいやりとりを統合した 1 つの要約を出力すること。\n"
+            "- 出力は日本語の箇条書きで行うこと。"
+        )
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in inputs["messages"])
+        previous = f"以前の要約:\n{inputs['previous_summary']}\n\n" if inputs["previous_summary"] else ""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{previous}新しいやりとり:\n{transcript}"},
+        ]
+
+    def postprocess(self, response: Response) -> str:
+        return response.choices[0].message.content or ""
+
+
 # Service class ----------------------------
+LLMType = TypeVar("LLMType", bound=AbstractLLM[Any, Any])
+
+
 class LLMService(ILLMService):
+    @inject
+    def __init__(self, http_pool: HTTPClientPool) -> None:
+        self.http_pool = http_pool
+        # 1 を指定すると従来どおり逐次実行になる
+        self.max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+        # "per_question": 質問ごとに 1 回呼ぶ / "batched": SUMMARY_BATCH_GROUPS 単位でまとめて呼ぶ
+        self.summary_mode = os.environ.get("SUMMARY_MODE", "per_question")
+        self.summary_batch_groups = parse_question_groups(os.environ.get("SUMMARY_BATCH_GROUPS", ",".join(SUMMARY_QUESTIONS)))
+        self.response_cache = create_cache_from_env("LLM_CACHE", "/tmp/ai-paper-summarizer/llm", default_backend="memory")  # noqa: S108
+        # 入力がこのトークン数を超える場合は、チャンクに分割して map-reduce で圧縮してから各処理に渡す
+        self.input_token_budget = int(os.environ.get("LLM_INPUT_TOKEN_BUDGET", "100000"))
+        self.chunk_tokens = int(os.environ.get("LLM_CHUNK_TOKENS", "16000"))
+        self.token_counter = TokenCounter()
+        self.usage_tracker = TokenUsageTracker()
+        # 1 回の呼び出しのタイムアウトとリトライ。Lambda の締め切りの LLM_DEADLINE_RESERVE_SECONDS 秒前までに打ち切り、
+        # 途中までの要約を投稿・保存する時間を残す。LLM_HEDGE_AFTER_SECONDS を指定すると、遅い呼び出しをもう 1 本送る
+        hedge_after = os.environ.get("LLM_HEDGE_AFTER_SECONDS")
+        self.request_policy = RequestPolicy(
+            timeout=float(os.environ.get("LLM_REQUEST_TIMEOUT_SECONDS", "60")),
+            max_attempts=self.http_pool.max_retries + 1,
+            reserve=float(os.environ.get("LLM_DEADLINE_RESERVE_SECONDS", "5")),
+            hedge_after=float(hedge_after) if hedge_after else None,
+        )
+        # バッチジョブの完了を確認する間隔
+        self.batch_poll_interval_seconds = float(os.environ.get("LLM_BATCH_POLL_SECONDS", "30"))
+        # 会話のプロンプト（システムプロンプトを除く）のトークン予算。超える分の古いやりとりは要約に畳み込む
+        self.history_compactor = ConversationCompactor(
+            self.token_counter,
+            self._summarize_history,
+            self.response_cache,
+            prompt_token_budget=int(os.environ.get("LLM_CHAT_PROMPT_TOKEN_BUDGET", "12000")),
+            summary_tokens=HISTORY_SUMMARY_TOKENS,
+        )
+        # タイトル・要約・カテゴリで同じ文書を圧縮するため、結果を共有する
+        self._condensed_cache = InMemoryLRUCache(max_entries=8)
+        self._condense_single_flight = SingleFlight()
+
     @property
-    def client_settings(self) -> dict[str, str]:
+    def client_settings(self) -> ClientSettings:
         return {
             "api_key": os.environ["OPENAI_API_KEY"],
+            # 呼び出しごとに OpenAI クライアントを作っても、接続はプール内のものを使い回す
+            "http_client": self.http_pool.openai_http_client,
+            # リトライは SDK ではなく request_policy で行う
+            "max_retries": 0,
         }
 
+    def _create_llm(
+        self, llm_class: type[LLMType], max_tokens: int, usage_tracker: TokenUsageTracker | None = None, **kwargs: Any
+    ) -> LLMType:
+        return llm_class(
+            model="gpt-4o-mini",
+            client_settings=self.client_settings,
+            llm_settings={"max_tokens": max_tokens},
+            response_cache=self.response_cache,
+            usage_tracker=usage_tracker or self.usage_tracker,
+            request_policy=self.request_policy,
+            **kwargs,
+        )
+
     def generate_title(self, text: str) -> str:
-        title_extractor = TitleExtractor(model="gpt-4o-mini", client_settings=self.client_settings, llm_settings={"max_tokens": 512})
-        return title_extractor(text)
+        title_extractor = self._create_llm(TitleExtractor, max_tokens=512)
+        return title_extractor(self._window(title_extractor, text))
 
     def generate_summary(self, text: str) -> dict[str, str]:
-        content_summarizer = ContentSummarizer(model="gpt-4o-mini", client_settings=self.client_settings, llm_settings={"max_tokens": 2048})
-        return_results = {}
-        questoins = ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7", "Q8"]
-        for question_idx in questoins:
-            result = content_summarizer({"text": text, "question": question_idx})
-            return_results.update(result)
-        return return_results
+        answers = dict(self.iter_summary(text))
+        # 完了順ではなく Q1〜Q8 の順に並べ直す
+        keys = [to_answer_key(question) for question in SUMMARY_QUESTIONS]
+        return {key: answers[key] for key in keys if key in answers}
+
+    def iter_summary(self, text: str) -> Iterator[tuple[str, str]]:
+        text = self._fit_to_budget(text)
+        if self.summary_mode == "batched":
+            yield from self._iter_summary_batched(text)
+        else:
+            yield from self._iter_summary_per_question(text)
+
+    def _iter_summary_per_question(self, text: str) -> Iterator[tuple[str, str]]:
+        content_summarizer = self._create_llm(ContentSummarizer, max_tokens=2048)
+        results = iter_concurrently(
+            lambda question_idx: content_summarizer({"text": text, "question": question_idx}),
+            SUMMARY_QUESTIONS,
+            max_workers=self.max_concurrency,
+        )
+        for idx, result in results:
+            question_idx = SUMMARY_QUESTIONS[idx]
+            if isinstance(result, Exception):
+                # 1問の失敗で論文全体を落とさず、失敗した旨を回答として残す
+                logger.error("Failed to generate summary for %s", question_idx, exc_info=result)
+                yield content_summarizer.to_answer_key(question_idx), SUMMARY_FAILURE_MESSAGE
+            else:
+                yield from result.items()
+
+    def _iter_summary_batched(self, text: str) -> Iterator[tuple[str, str]]:
+        results = iter_concurrently(
+            lambda group: self._answer_question_group(text, group),
+            self.summary_batch_groups,
+            max_workers=self.max_concurrency,
+        )
+        for idx, result in results:
+            if isinstance(result, Exception):
+                logger.error("Failed to generate batched summary", exc_info=result)
+                result = {}  # noqa: PLW2901
+            # グループ内は Q1〜Q8 の順に返す
+            for question in SUMMARY_QUESTIONS:
+                if question in self.summary_batch_groups[idx]:
+                    yield to_answer_key(question), result.get(to_answer_key(question), SUMMARY_FAILURE_MESSAGE)
+
+    def _answer_question_group(self, text: str, questions: list[str]) -> dict[str, str]:
+        answers: dict[str, str] = {}
+        missing = questions
+        for _ in range(1 + SUMMARY_MAX_REASKS):
+            batch_summarizer = self._create_llm(BatchContentSummarizer, max_tokens=min(1024 * len(missing), 16384), questions=missing)
+            answers.update(batch_summarizer({"text": text}))
+            # 欠けたキーだけを再度問い合わせる
+            missing = [question for question in missing if batch_summarizer.to_answer_key(question) not in answers]
+            if not missing:
+                break
+            logger.warning("Missing answers in batched summary: %s", missing)
+        return answers
 
     def generate_category(self, text: str) -> list[str]:
-        category_classifier = CategoryClassifier(
-            model="gpt-4o-mini", client_settings=self.client_settings, llm_settings={"max_tokens": 512}
-        )
-        return category_classifier(text)
+        category_classifier = self._create_llm(CategoryClassifier, max_tokens=512)
+        return category_classifier(self._window(category_classifier, text))
 
     def generate_brief_digest(self, summary: dict[str, str]) -> str:
-        briefly_summarizer = BrieflySummarizer(model="gpt-4o-mini", client_settings=self.client_settings, llm_settings={"max_tokens": 512})
-        return briefly_summarizer(str(summary))
+        briefly_summarizer = self._create_llm(BrieflySummarizer, max_tokens=512)
+        digest_input = render_summary(summary, DIGEST_QUESTIONS, exclude=(SUMMARY_FAILURE_MESSAGE,))
+        # 概要系の回答がすべて失敗している場合は、得られた回答から作る
+        return briefly_summarizer(digest_input or render_summary(summary, exclude=(SUMMARY_FAILURE_MESSAGE,)))
 
     def generate_chat_response(self, messages: list[dict[str, Any]]) -> str:
-        chat_assistant = ChatAssistant(model="gpt-4o-mini", client_settings=self.client_settings, llm_settings={"max_tokens": 4096})
-        return chat_assistant(messages)
+        chat_assistant = self._create_llm(ChatAssistant, max_tokens=4096)
+        return chat_assistant(self.history_compactor.compact(messages))
+
+    def stream_chat_response(self, messages: list[dict[str, Any]]) -> Iterator[str]:
+        chat_assistant = self._create_llm(ChatAssistant, max_tokens=4096)
+        return chat_assistant.stream(self.history_compactor.compact(messages))
+
+    def _summarize_history(self, previous_summary: str, messages: list[dict[str, Any]]) -> str:
+        summarizer = self._create_llm(ConversationSummarizer, max_tokens=HISTORY_SUMMARY_TOKENS)
+        transcript_budget = self.history_compactor.prompt_token_budget
+        messages = [
+            {**message, "content": self.token_counter.truncate(str(message["content"]), transcript_budget // len(messages))}
+            for message in messages
+        ]
+        return summarizer({"previous_summary": previous_summary, "messages": messages})
+
+    def submit_summary_batch(self, texts: dict[str, str]) -> str:
+        requests = []
+        for key, text in texts.items():
+            fitted = self._fit_to_budget(text)
+            for task in ("title", "category"):
+                llm = self._batch_llm(task)
+                requests.append(llm.batch_request(f"{key}:{task}", self._window(llm, text)))
+            if self.summary_mode == "batched":
+                for group in self.summary_batch_groups:
+                    task = f"summary_batch:{','.join(group)}"
+                    requests.append(self._batch_llm(task).batch_request(f"{key}:{task}", {"text": fitted}))
+            else:
+                for question in SUMMARY_QUESTIONS:
+                    task = f"summary:{question}"
+                    requests.append(self._batch_llm(task).batch_request(f"{key}:{task}", {"text": fitted, "question": question}))
+        return self._batch_client().submit(requests)
+
+    def collect_summary_batch(self, batch_id: str) -> dict[str, PaperSummary]:
+        outputs: dict[str, dict[str, Any]] = defaultdict(dict)
+        for custom_id, result in self._batch_client().wait(batch_id).items():
+            key, _, task = custom_id.partition(":")
+            try:
+                outputs[key][task] = self._batch_llm(task).parse_batch_result(result, self._batch_schema_inputs(task))
+            except Exception:
+                logger.exception("Failed to parse batch result: %s", custom_id)
+        summaries = {}
+        for key, output in outputs.items():
+            if "title" not in output or "category" not in output:
+                # タイトルとカテゴリが無い論文は保存できないため、結果に含めず呼び出し側で失敗として扱う
+                continue
+            answers: dict[str, str] = {}
+            for task, answer in output.items():
+                if task.startswith("summary"):
+                    answers.update(answer)
+            summary = {
+                to_answer_key(question): answers.get(to_answer_key(question), SUMMARY_FAILURE_MESSAGE) for question in SUMMARY_QUESTIONS
+            }
+            summaries[key] = PaperSummary(title=output["title"], category=output["category"], summary=summary)
+        return summaries
+
+    def _batch_llm(self, task: str) -> AbstractLLM[Any, Any]:
+        """バッチのタスク名（"title", "summary:Q1", "summary_batch:Q1,Q2" など）に対応する LLM を作る"""
+        name, _, questions = task.partition(":")
+        if name == "title":
+            return self._create_llm(TitleExtractor, max_tokens=512)
+        if name == "category":
+            return self._create_llm(CategoryClassifier, max_tokens=512)
+        if name == "summary":
+            return self._create_llm(ContentSummarizer, max_tokens=2048)
+        group = questions.split(",")
+        return self._create_llm(BatchContentSummarizer, max_tokens=min(1024 * len(group), 16384), questions=group)
+
+    def _batch_schema_inputs(self, task: str) -> dict[str, Any]:
+        """結果の検証用に、依頼したときの入力のうち本文以外を作り直す（"summary:Q1" は質問 ID でスキーマが決まる）"""
+        name, _, question = task.partition(":")
+        return {"text": "", "question": question} if name == "summary" else {"text": ""}
+
+    def _batch_client(self) -> BatchJobClient:
+        client_settings: ClientSettings = {**self.client_settings, "max_retries": self.http_pool.max_retries}
+        return BatchJobClient(OpenAI(**client_settings), self.batch_poll_interval_seconds)
+
+    def _window(self, llm: AbstractLLM[Any, Any], text: str) -> str:
+        """LLM が宣言した範囲だけを入力として切り出す"""
+        window = llm.input_window
+        if window.kind == "head":
+            return head_window(text, self.token_counter, window.max_tokens)
+        if window.kind == "front_matter":
+            return front_matter(text, self.token_counter, window.max_tokens)
+        return self._fit_to_budget(text)
+
+    def _fit_to_budget(self, text: str) -> str:
+        """入力がトークン予算を超える場合に、map-reduce で圧縮したテキストを返す"""
+        if self.token_counter.count(text) <= self.input_token_budget:
+            return text
+        cache_key = hash_key(text)
+        condensed = self._condensed_cache.get(cache_key)
+        if condensed is None:
+            condensed = self._condense_single_flight.do(cache_key, lambda: self._condense(text))
+            self._condensed_cache.set(cache_key, condensed)
+        return condensed
+
+    def _condense(self, text: str) -> str:
+        # LLMService はコンテナ内で使い回されるため、この文書の圧縮で使った分だけを別に集計する
+        condense_usage = TokenUsageTracker(parent=self.usage_tracker)
+        note_taker = self._create_llm(ChunkNoteTaker, max_tokens=2048, usage_tracker=condense_usage)
+        for round_idx in range(MAX_REDUCE_ROUNDS):
+            chunks = self.token_counter.split(text, self.chunk_tokens)
+            logger.info(
+                "Map-reduce round %d: %d input tokens split into %d chunks",
+                round_idx + 1,
+                self.token_counter.count(text),
+                len(chunks),
+            )
+            chunk_inputs = [{"text": chunk, "index": idx, "total": len(chunks)} for idx, chunk in enumerate(chunks, start=1)]
+            results = map_concurrently(note_taker, chunk_inputs, max_workers=self.max_concurrency)
+            notes = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Failed to take notes from chunk", exc_info=result)
+                else:
+                    notes.append(result)
+            if not notes or len(notes) < len(chunks) * CONDENSE_MIN_SUCCESS_RATIO:
+                msg = f"Took notes from only {len(notes)} of {len(chunks)} chunks"
+                raise LLMCondenseError(msg)
+            text = "\n\n".join(notes)
+            if self.token_counter.count(text) <= self.input_token_budget:
+                break
+        logger.info("Map-reduce finished: %d tokens, usage=%s", self.token_counter.count(text), condense_usage.snapshot())
+        return self.token_counter.truncate(text, self.input_token_budget)
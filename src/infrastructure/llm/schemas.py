@@ -0,0 +1,53 @@
+from functools import lru_cache
+from typing import Any, Literal, get_args
+
+from pydantic import BaseModel, ConfigDict, Field, RootModel, ValidationError, create_model
+
+Category = Literal["Generative Model", "Audio", "LLM", "Agent", "Survey", "CV", "World Model", "Reinforcement Learning"]
+CATEGORIES: tuple[str, ...] = get_args(Category)
+
+
+class LLMOutputError(Exception):
+    pass
+
+
+class StructuredOutput(BaseModel):
+    """LLM の出力のスキーマ。Structured Outputs の strict モードに合わせて、全てのキーを必須にし、余分なキーを認めない"""
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class TitleOutput(StructuredOutput):
+    title: str = Field(description="Title of the content")
+
+
+class CategoryOutput(StructuredOutput):
+    category: list[Category]
+
+
+class BriefDigestOutput(StructuredOutput):
+    summary: str = Field(description="One-sentence summary within 60 characters")
+
+
+class SummaryAnswers(RootModel[dict[str, str]]):
+    """質問 ID をキーにした回答。どの質問を依頼したかに関わらず検証できるよう、キーは限定しない"""
+
+
+@lru_cache(maxsize=32)
+def answers_output(questions: tuple[str, ...]) -> type[StructuredOutput]:
+    """依頼した質問 ID だけをキーに持つ回答のスキーマ（API に送る response_format 用）"""
+    fields: dict[str, Any] = {question: (str, Field(description=f"Answer to {question}")) for question in questions}
+    return create_model(f"SummaryAnswers_{'_'.join(questions)}", __base__=StructuredOutput, **fields)
+
+
+def response_format(schema: type[BaseModel]) -> dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": schema.__name__, "strict": True, "schema": schema.model_json_schema()}}
+
+
+def validation_errors(error: ValidationError) -> str:
+    """不正なフィールドとその理由を、修正を依頼するプロンプト用に 1 行ずつ並べる"""
+    lines = []
+    for detail in error.errors():
+        location = ".".join(str(part) for part in detail["loc"]) or "(root)"
+        lines.append(f"- {location}: {detail['msg']}")
+    return "\n".join(lines)
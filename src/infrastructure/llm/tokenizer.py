@@ -0,0 +1,83 @@
+import logging
+import math
+import re
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# CJK 文字はおおむね 1 文字 1 トークン、それ以外は 4 文字 1 トークン程度として見積もる
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """
+    ローカルでトークン数を数える。
+    tiktoken がインストールされていればそれを使い、無ければ文字種から概算する。
+    """
+
+    def __init__(self, model: str = "gpt-4o-mini") -> None:
+        self.encoding = _load_encoding(model)
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        cjk_chars = len(CJK_PATTERN.findall(text))
+        return cjk_chars + math.ceil((len(text) - cjk_chars) / CHARS_PER_TOKEN)
+
+    def count_messages(self, messages: list[dict[str, Any]]) -> int:
+        # 1 メッセージあたりのロール等のオーバーヘッドを 4 トークンとして加算する
+        return sum(self.count(str(message.get("content") or "")) + 4 for message in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """先頭から max_tokens 以内に収まる部分を返す"""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        if self.count(text) <= max_tokens:
+            return text
+        # 概算の場合は二分探索で収まる長さを求める
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        """
+        段落（改行）の区切りを保ちながら、各チャンクが max_tokens 以内になるように分割する。
+        1 段落で max_tokens を超える場合はその段落を途中で切る。
+        """
+        chunks: list[str] = []
+        current: list[str] = []
+        current_tokens = 0
+        for paragraph in text.splitlines(keepends=True):
+            rest = paragraph
+            rest_tokens = self.count(rest)
+            if current and current_tokens + rest_tokens > max_tokens:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            while rest_tokens > max_tokens:
+                head = self.truncate(rest, max_tokens) or rest[:1]
+                chunks.append(head)
+                rest = rest[len(head) :]
+                rest_tokens = self.count(rest)
+            if rest:
+                current.append(rest)
+                current_tokens += rest_tokens
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+
+def _load_encoding(model: str) -> Any:
+    try:
+        import tiktoken  # type: ignore[import-not-found]
+
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        logger.debug("tiktoken is not available, using approximate token counting")
+        return None
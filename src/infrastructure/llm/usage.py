@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+from src.infrastructure.llm._types import Response, ResponseChunk
+
+logger = logging.getLogger(__name__)
+
+# 100 万トークンあたりの料金（USD）: (入力, キャッシュされた入力, 出力)。LLM_PRICES_JSON で上書きできる
+MODEL_PRICES: dict[str, tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+
+def load_prices() -> dict[str, tuple[float, float, float]]:
+    overrides = json.loads(os.environ.get("LLM_PRICES_JSON", "{}"))
+    return {**MODEL_PRICES, **{model: tuple(prices) for model, prices in overrides.items()}}
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """
+    推定コスト（USD）。レスポンスのモデル名は "gpt-4o-mini-2024-07-18" のように日付付きのため、最長一致で料金を引く。
+    料金が分からないモデルは 0 とする。
+    """
+    prices = load_prices()
+    matched = max((name for name in prices if model.startswith(name)), key=len, default=None)
+    if matched is None:
+        return 0.0
+    input_price, cached_price, output_price = prices[matched]
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def usage_fields(response: Response | ResponseChunk) -> dict[str, Any]:
+    """レスポンスからトークン数と推定コストを取り出す。usage が無ければ空の辞書を返す"""
+    if response.usage is None:
+        return {}
+    details = response.usage.prompt_tokens_details
+    cached_tokens = (details.cached_tokens or 0) if details else 0
+    return {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+        "cached_tokens": cached_tokens,
+        "cost_usd": estimate_cost(response.model, response.usage.prompt_tokens, cached_tokens, response.usage.completion_tokens),
+    }
+
+
+class TokenUsageTracker:
+    """
+    処理（ステージ）ごとに API で消費したトークン数と推定コストを集計する。
+    parent を指定すると、親の集計にも同じ使用量を加える（1 つの文書の処理など、範囲を絞った集計に使う）。
+    """
+
+    def __init__(self, parent: "TokenUsageTracker | None" = None) -> None:
+        self._usage: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self.parent = parent
+
+    def record(self, stage: str, response: Response | ResponseChunk) -> dict[str, Any]:
+        """使用量を集計に加え、そのレスポンスの使用量を返す"""
+        fields = usage_fields(response)
+        if not fields:
+            return fields
+        with self._lock:
+            usage = self._usage.setdefault(
+                stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+            )
+            usage["calls"] += 1
+            for name, value in fields.items():
+                usage[name] += value
+        logger.debug("LLM usage: stage=%s %s", stage, fields)
+        if self.parent is not None:
+            self.parent.record(stage, response)
+        return fields
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {stage: dict(usage) for stage, usage in self._usage.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._usage.clear()
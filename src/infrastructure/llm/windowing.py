@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+import re
+from typing import Literal
+
+from src.infrastructure.llm.tokenizer import TokenCounter
+
+# 見出しとみなす行。Markdown の見出し、"1 Introduction" / "II. RELATED WORK" のような番号付きの見出し、
+# 番号の無い代表的な見出し（Abstract, Introduction など）を拾う
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:"
+    r"#{1,6}[ \t]+(?P<markdown>[^\n]+)"
+    r"|(?:\d{1,2}(?:\.\d{1,2})*|[IVX]{1,5})\.?[ \t]+(?P<numbered>[A-Z][A-Za-z][^\n]{0,60})"
+    r"|(?P<keyword>abstract|introduction|background|related work|conclusions?|references|acknowledge?ments)\b[^\n]{0,3}"
+    r")[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# 見出しが無く本文と同じ行に続く形式（"Abstract—We propose ..."、"Abstract: ..."）
+INLINE_ABSTRACT_PATTERN = re.compile(r"^[ \t]*(?:abstract|要旨|概要)[ \t]*[.:\u2013\u2014-]", re.IGNORECASE | re.MULTILINE)
+ABSTRACT_HEADINGS = ("abstract", "要旨", "概要")
+# 先頭からこの文字数より後ろに出てくる Abstract は、論文冒頭のものではないとみなす
+MAX_ABSTRACT_OFFSET_CHARS = 20000
+# トークン数を数える前に、概算で十分に長い分だけ切り出しておく
+MAX_CHARS_PER_TOKEN = 8
+
+
+@dataclass(frozen=True)
+class Section:
+    title: str
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class InputWindow:
+    """
+    LLM の処理ごとに、論文のどの部分を入力にするかの宣言。
+    "full": 全文（トークン予算を超える場合は map-reduce で圧縮する）
+    "head": 先頭から max_tokens まで
+    "front_matter": タイトル・著者・アブストラクトまで（見つからなければ先頭から max_tokens まで）
+    """
+
+    kind: Literal["full", "head", "front_matter"] = "full"
+    max_tokens: int = 0
+
+
+def detect_sections(text: str) -> list[Section]:
+    """抽出済みのテキストから見出しを探し、見出しから次の見出しまでを 1 つのセクションとして返す"""
+    titles = {match.start(): _heading_title(match) for match in HEADING_PATTERN.finditer(text)}
+    for match in INLINE_ABSTRACT_PATTERN.finditer(text):
+        titles.setdefault(match.start(), "Abstract")
+    headings = sorted(titles.items())
+    return [
+        Section(title=title, start=start, end=headings[idx + 1][0] if idx + 1 < len(headings) else len(text))
+        for idx, (start, title) in enumerate(headings)
+    ]
+
+
+def front_matter(text: str, token_counter: TokenCounter, max_tokens: int) -> str:
+    """アブストラクトの終わりまでを max_tokens 以内で返す。アブストラクトが見つからなければ先頭から max_tokens まで返す"""
+    head = text[: MAX_ABSTRACT_OFFSET_CHARS + max_tokens * MAX_CHARS_PER_TOKEN]
+    for section in detect_sections(head):
+        if section.start > MAX_ABSTRACT_OFFSET_CHARS:
+            break
+        if section.title.lower().startswith(ABSTRACT_HEADINGS):
+            front = head[: section.end]
+            if token_counter.count(front) > max_tokens:
+                # 冒頭が長すぎる場合は、タイトル周辺とアブストラクトを優先して残す
+                abstract = token_counter.truncate(head[section.start : section.end], max_tokens // 2)
+                title_part = token_counter.truncate(head[: section.start], max_tokens - token_counter.count(abstract))
+                front = f"{title_part}\n\n{abstract}"
+            return front
+    return head_window(text, token_counter, max_tokens)
+
+
+def head_window(text: str, token_counter: TokenCounter, max_tokens: int) -> str:
+    return token_counter.truncate(text[: max_tokens * MAX_CHARS_PER_TOKEN], max_tokens)
+
+
+def render_summary(summary: dict[str, str], questions: list[str] | None = None, exclude: tuple[str, ...] = ()) -> str:
+    """
+    要約の dict を、repr ではなく「見出し + 回答」を並べたテキストにする。
+    questions を指定するとその番号（"Q1" など）の回答だけを、exclude に含まれる回答（失敗した旨など）は除いて並べる。
+    """
+    items = [
+        (key, answer)
+        for key, answer in summary.items()
+        if (questions is None or key.split(":", 1)[0] in questions) and answer not in exclude
+    ]
+    return "\n\n".join(f"## {key}\n{answer.strip()}" for key, answer in items)
+
+
+def _heading_title(match: re.Match[str]) -> str:
+    return (match.group("markdown") or match.group("numbered") or match.group("keyword") or "").strip()
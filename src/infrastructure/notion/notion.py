@@ -1,11 +1,17 @@
 import logging
 import os
+import time
 from typing import Any
 
+from injector import inject
 from notion_client import Client
 
 from src.domain.models import Paper
 from src.domain.services import INotionRepogitory
+from src.infrastructure.file_downloader.url import content_key
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.notion.page_index import NotionPageIndex
+from src.utils.tracing import span
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -15,16 +21,18 @@ class NotionRequestError(Exception):
     pass
 
 
-def get_notion_client() -> Client:
-    return Client(auth=os.environ["NOTION_KEY"])
-
-
 class NotionRepository(INotionRepogitory):
-    def __init__(self) -> None:
+    @inject
+    def __init__(self, http_pool: HTTPClientPool) -> None:
+        self.http_pool = http_pool
         self.database_id = os.environ["NOTION_DATABASE_ID"]
+        self.page_index = NotionPageIndex(os.environ.get("NOTION_PAGE_INDEX_PATH", "/tmp/ai-paper-summarizer/notion_pages.sqlite3"))  # noqa: S108
+        # インデックスに無い URL が続いても、差分同期はこの間隔より頻繁には行わない
+        self.sync_interval_seconds = float(os.environ.get("NOTION_INDEX_SYNC_INTERVAL_SECONDS", "60"))
+        self._last_synced_at = 0.0
 
     def add_content(self, paper: Paper) -> None:
-        client = get_notion_client()
+        client = self._get_client()
         properties = {
             "title": {"title": [{"text": {"content": paper.title}}]},
             "url": {"url": paper.url},
@@ -35,46 +43,108 @@ class NotionRepository(INotionRepogitory):
         for question, answer in paper.summary.items():
             children.append(self._create_callout_block(emoji="❓", title=question, content=answer))
         try:
-            response = client.pages.create(
-                parent={"database_id": self.database_id},
-                properties=properties,
-                children=children,
-            )
+            with span("notion.create_page", blocks=len(children)):
+                response: Any = client.pages.create(
+                    parent={"database_id": self.database_id},
+                    properties=properties,
+                    children=children,
+                )
             logger.info("Notion page created: %s", response)
         except Exception as e:
             raise NotionRequestError from e
+        # 作成したページをインデックスにも書き込んでおく
+        self.page_index.put(content_key(paper.url), response["id"], response.get("last_edited_time"))
 
     def update_content(self, url: str, contents: dict[str, Any]) -> None:
-        client = get_notion_client()
+        client = self._get_client()
         page_id = self._fetch_page_id(url)
         if not page_id:
             logger.error("No page found with URL: %s", url)
             return
         children = [self._create_callout_block("💬", contents["question"], contents["answer"])]
         try:
-            response = client.blocks.children.append(
-                block_id=page_id,
-                children=children,
-            )
+            with span("notion.append_blocks"):
+                response = client.blocks.children.append(
+                    block_id=page_id,
+                    children=children,
+                )
             logger.info("Notion update response: %s", response)
         except Exception as e:
             raise NotionRequestError from e
 
     def _fetch_page_id(self, url: str) -> str | None:
-        client = get_notion_client()
+        with span("notion.fetch_page_id") as current:
+            page_id = self._lookup_page_id(url)
+            current.attributes["found"] = page_id is not None
+            return page_id
+
+    def _lookup_page_id(self, url: str) -> str | None:
+        url_key = content_key(url)
+        page_id = self.page_index.get(url_key)
+        if page_id:
+            return page_id
+        if time.monotonic() - self._last_synced_at >= self.sync_interval_seconds:
+            self._sync_page_index()
+            page_id = self.page_index.get(url_key)
+            if page_id:
+                return page_id
+        return self._query_page_id_by_url(url)
+
+    def _sync_page_index(self) -> None:
+        """前回の同期以降に更新されたページを、ページングしながらインデックスに取り込む"""
+        client = self._get_client()
+        cursor = self.page_index.get_cursor(self.database_id)
+        query: dict[str, Any] = {
+            "database_id": self.database_id,
+            "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}],
+            "page_size": 100,
+        }
+        if cursor:
+            query["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": cursor}}
+        latest = cursor
         try:
-            response = client.databases.query(database_id=self.database_id)
-            for result in response.get("results", []):  # type: ignore[union-attr]
-                try:
-                    if result["properties"]["url"]["url"] == url:
-                        return result["id"]
-                except Exception as e:
-                    raise NotionRequestError from e
+            while True:
+                with span("notion.query_database", sync=True):
+                    response: Any = client.databases.query(**query)
+                for result in response.get("results", []):
+                    self._index_page(result)
+                    latest = max(latest or "", result.get("last_edited_time", ""))
+                if not response.get("has_more"):
+                    break
+                query["start_cursor"] = response["next_cursor"]
         except Exception as e:
             raise NotionRequestError from e
+        finally:
+            # 途中で失敗しても、取り込めた分までは次回の同期で再取得しない
+            if latest:
+                self.page_index.set_cursor(self.database_id, latest)
+        self._last_synced_at = time.monotonic()
 
+    def _query_page_id_by_url(self, url: str) -> str | None:
+        client = self._get_client()
+        try:
+            with span("notion.query_database", sync=False):
+                response: Any = client.databases.query(
+                    database_id=self.database_id,
+                    filter={"property": "url", "url": {"equals": url}},
+                    page_size=1,
+                )
+        except Exception as e:
+            raise NotionRequestError from e
+        for result in response.get("results", []):
+            return self._index_page(result)
         return None
 
+    def _index_page(self, result: dict[str, Any]) -> str | None:
+        page_url = result.get("properties", {}).get("url", {}).get("url")
+        if not page_url:
+            return None
+        self.page_index.put(content_key(page_url), result["id"], result.get("last_edited_time"))
+        return result["id"]
+
+    def _get_client(self) -> Client:
+        return self.http_pool.notion_client(os.environ["NOTION_KEY"])
+
     def _create_callout_block(self, emoji: str, title: str, content: str) -> dict[str, Any]:
         return {
             "object": "block",
@@ -0,0 +1,47 @@
+from pathlib import Path
+import sqlite3
+import threading
+
+
+class NotionPageIndex:
+    """
+    論文 URL（正規化済み）から Notion のページ ID を引くためのローカルインデックス（SQLite）。
+    データベースとの同期位置は last_edited_time のカーソルとして保持する。
+    """
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages (url_key TEXT PRIMARY KEY, page_id TEXT NOT NULL, last_edited_time TEXT)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS sync_state (database_id TEXT PRIMARY KEY, cursor TEXT NOT NULL)")
+
+    def get(self, url_key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute("SELECT page_id FROM pages WHERE url_key = ?", (url_key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, url_key: str, page_id: str, last_edited_time: str | None = None) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO pages (url_key, page_id, last_edited_time) VALUES (?, ?, ?) "
+                "ON CONFLICT(url_key) DO UPDATE SET page_id = excluded.page_id, last_edited_time = excluded.last_edited_time",
+                (url_key, page_id, last_edited_time),
+            )
+
+    def get_cursor(self, database_id: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute("SELECT cursor FROM sync_state WHERE database_id = ?", (database_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, database_id: str, cursor: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO sync_state (database_id, cursor) VALUES (?, ?) "
+                "ON CONFLICT(database_id) DO UPDATE SET cursor = excluded.cursor",
+                (database_id, cursor),
+            )
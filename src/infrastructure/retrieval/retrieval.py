@@ -0,0 +1,121 @@
+from collections import Counter, OrderedDict
+import json
+import logging
+import math
+import re
+import threading
+from typing import Any
+
+from injector import inject
+
+from src.domain.services import IPaperRetriever
+from src.infrastructure.file_downloader.file_downloader import EXTRACTOR_VERSION, FileDownloader
+from src.infrastructure.file_downloader.url import content_key
+from src.infrastructure.llm.tokenizer import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# インデックスの形式・分割方法を変更した場合は上げること
+INDEX_VERSION = "1"
+CHUNK_TOKENS = 400
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """英数字は単語単位、日本語は文字 bigram 単位でトークン化する（形態素解析器に依存しないため）"""
+    text = text.lower()
+    terms = WORD_PATTERN.findall(text)
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class PaperIndex:
+    """
+    1 本の論文をチャンクに分けて作る BM25 の転置インデックス。
+    スコア計算はクエリ語を含むチャンクだけを対象に行う。
+    """
+
+    def __init__(self, chunks: list[str], k1: float = 1.5, b: float = 0.75) -> None:
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: list[int] = []
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        for doc_id, chunk in enumerate(chunks):
+            term_freqs = Counter(tokenize(chunk))
+            self.doc_lengths.append(sum(term_freqs.values()))
+            for term, freq in term_freqs.items():
+                self.postings.setdefault(term, []).append((doc_id, freq))
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    @classmethod
+    def from_text(cls, text: str, token_counter: TokenCounter) -> "PaperIndex":
+        return cls([chunk for chunk in token_counter.split(text, CHUNK_TOKENS) if chunk.strip()])
+
+    def search(self, query: str, top_k: int) -> list[str]:
+        """クエリとの関連度が高い順に最大 top_k 件のチャンクを、文書中の出現順に並べて返す"""
+        scores: dict[int, float] = {}
+        num_docs = len(self.chunks)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        if not scores:
+            # 一致する語が無い場合は冒頭（タイトル・アブストラクト）を返す
+            return self.chunks[:top_k]
+        top_doc_ids = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)[:top_k]
+        return [self.chunks[doc_id] for doc_id in sorted(top_doc_ids)]
+
+    def to_json(self) -> str:
+        return json.dumps({"chunks": self.chunks, "k1": self.k1, "b": self.b}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, json_string: str) -> "PaperIndex":
+        data: dict[str, Any] = json.loads(json_string)
+        return cls(data["chunks"], k1=data["k1"], b=data["b"])
+
+
+class PaperRetriever(IPaperRetriever):
+    """
+    論文ごとのインデックスを 1 度だけ作り、抽出テキストと同じキャッシュに保存して使い回す。
+    """
+
+    @inject
+    def __init__(self, file_downloader: FileDownloader) -> None:
+        self.file_downloader = file_downloader
+        self.token_counter = TokenCounter()
+        self._indexes: OrderedDict[str, PaperIndex] = OrderedDict()
+        self._max_indexes = 16
+        self._lock = threading.Lock()
+
+    def retrieve(self, url: str, query: str, top_k: int) -> list[str]:
+        return self._get_index(url).search(query, top_k)
+
+    def _get_index(self, url: str) -> PaperIndex:
+        cache_key = f"index:{INDEX_VERSION}:{EXTRACTOR_VERSION}:{content_key(url)}"
+        with self._lock:
+            index = self._indexes.get(cache_key)
+            if index is not None:
+                self._indexes.move_to_end(cache_key)
+                return index
+        cached = self.file_downloader.text_cache.get(cache_key)
+        if cached is not None:
+            index = PaperIndex.from_json(cached)
+        else:
+            index = PaperIndex.from_text(self.file_downloader.download_content(url), self.token_counter)
+            self.file_downloader.text_cache.set(cache_key, index.to_json())
+            logger.info("Built paper index: %s (%d chunks)", url, len(index.chunks))
+        with self._lock:
+            self._indexes[cache_key] = index
+            while len(self._indexes) > self._max_indexes:
+                self._indexes.popitem(last=False)
+        return index
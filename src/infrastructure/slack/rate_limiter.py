@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    rate [回/秒] でトークンが補充され、最大 capacity 個まで貯まるトークンバケット。
+    Retry-After を受け取った場合は pause で指定時間トークンの払い出しを止める。
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class ChannelRateLimiter:
+    """Slack のレート制限はチャンネル単位のため、チャンネルごとにトークンバケットを持つ"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, channel: str) -> TokenBucket:
+        with self._lock:
+            if channel not in self._buckets:
+                self._buckets[channel] = TokenBucket(self.rate, self.capacity)
+            return self._buckets[channel]
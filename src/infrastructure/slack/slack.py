@@ -1,47 +1,207 @@
+from collections.abc import Iterable
+import logging
 import os
+import time
 from typing import Any
 
+from injector import inject
 import requests  # type: ignore[import-untyped]
 
+from src.domain.models import SlackPost
 from src.domain.services import ISlackService
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.slack.rate_limiter import ChannelRateLimiter, TokenBucket
+from src.utils.concurrency import map_concurrently
+from src.utils.deadline import remaining, timeout_for
+from src.utils.tracing import Span, span
+
+logger = logging.getLogger(__name__)
+
+# Block Kit の制限: section ブロックのテキストは 3000 文字、1 メッセージあたり 50 ブロックまで
+MAX_SECTION_TEXT_LENGTH = 3000
+MAX_BLOCKS_PER_MESSAGE = 50
+# 通知用の text フィールドの長さ
+MAX_FALLBACK_TEXT_LENGTH = 150
+TOO_MANY_REQUESTS = 429
+STREAM_PLACEHOLDER = "回答を生成中..."
+STREAM_INTERRUPTED_MESSAGE = "回答の生成が中断されました。"
 
 
 class SlackRequestError(Exception):
     pass
 
 
+def split_text(text: str, max_length: int = MAX_SECTION_TEXT_LENGTH) -> list[str]:
+    """section ブロックに収まるよう、なるべく改行の位置でテキストを分割する"""
+    chunks = []
+    while len(text) > max_length:
+        split_at = text.rfind("\n", 0, max_length)
+        if split_at <= 0:
+            split_at = max_length
+        chunks.append(text[:split_at])
+        text = text[split_at:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def text_blocks(text: str) -> list[dict[str, Any]]:
+    return [{"type": "section", "text": {"type": "mrkdwn", "text": chunk}} for chunk in split_text(text)]
+
+
+def pack_blocks(messages: list[str]) -> list[list[dict[str, Any]]]:
+    """
+    複数のメッセージを、ブロック数の上限に収まる範囲でまとめて Block Kit メッセージのリストにする。
+    メッセージの間には divider を入れる。
+    """
+    packed: list[list[dict[str, Any]]] = []
+    current: list[dict[str, Any]] = []
+    for message in messages:
+        sections = text_blocks(message)
+        needed = len(sections) + (1 if current else 0)
+        if current and len(current) + needed > MAX_BLOCKS_PER_MESSAGE:
+            packed.append(current)
+            current = []
+        if current:
+            current.append({"type": "divider"})
+        current.extend(sections)
+    if current:
+        packed.append(current)
+    return packed
+
+
+def message_text(message: dict[str, Any]) -> str:
+    """
+    投稿の全文を返す。text は通知用に短く切り詰めているため、section ブロックがあればそこから組み立て直す
+    （1 つのメッセージを分割した section は改行で、divider で区切ったメッセージは空行でつなぐ）。
+    """
+    parts: list[list[str]] = [[]]
+    for block in message.get("blocks") or []:
+        if block.get("type") == "divider":
+            parts.append([])
+        elif block.get("type") == "section" and (block.get("text") or {}).get("text"):
+            parts[-1].append(block["text"]["text"])
+    text = "\n\n".join("\n".join(part) for part in parts if part)
+    return text or message.get("text", "")
+
+
 class SlackService(ISlackService):
     BASE_URL = "https://slack.com/api"
 
-    def __init__(self) -> None:
+    @inject
+    def __init__(self, http_pool: HTTPClientPool) -> None:
+        self.session = http_pool.session
         self.token = os.environ["SLACK_TOKEN"]
+        # ベンチマークなどでスタブのサーバーに向けるときに上書きする
+        self.base_url = os.environ.get("SLACK_API_BASE_URL", self.BASE_URL)
         self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json; charset=utf-8",
         }
+        # chat.postMessage はチャンネルごとにおおむね 1 秒 1 件が上限
+        self.rate_limiter = ChannelRateLimiter(
+            rate=float(os.environ.get("SLACK_CHANNEL_RATE_PER_SEC", "1")),
+            capacity=float(os.environ.get("SLACK_CHANNEL_BURST", "3")),
+        )
+        self.max_rate_limit_retries = int(os.environ.get("SLACK_MAX_RATE_LIMIT_RETRIES", "3"))
+        self.max_concurrency = int(os.environ.get("SLACK_MAX_CONCURRENCY", "4"))
+        # chat.update は Tier 3（毎分 50 回程度）のため、ストリーミング中の更新間隔を空ける
+        self.stream_update_interval = float(os.environ.get("SLACK_STREAM_UPDATE_INTERVAL_SECONDS", "1.5"))
 
     def post_message(self, channel: str, message: str, thread_ts: str | None = None) -> None:
-        url = f"{self.BASE_URL}/chat.postMessage"
-        data = {
+        for blocks in pack_blocks([message]):
+            self._post_blocks(channel, blocks, message, thread_ts)
+
+    def post_messages(self, posts: list[SlackPost]) -> None:
+        # 同じスレッドへの投稿は 1 つのグループにまとめ、グループ内は順番に投稿する
+        groups: dict[tuple[str, str | None], list[str]] = {}
+        for post in posts:
+            groups.setdefault((post.channel, post.thread_ts), []).extend(post.messages)
+        results = map_concurrently(
+            lambda item: self._post_packed(item[0][0], item[1], item[0][1]),
+            list(groups.items()),
+            max_workers=self.max_concurrency,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    def _post_packed(self, channel: str, messages: list[str], thread_ts: str | None) -> None:
+        for blocks in pack_blocks(messages):
+            first_text = blocks[0]["text"]["text"]
+            self._post_blocks(channel, blocks, first_text, thread_ts)
+
+    def _post_blocks(self, channel: str, blocks: list[dict[str, Any]], text: str, thread_ts: str | None) -> dict[str, Any]:
+        url = f"{self.base_url}/chat.postMessage"
+        data: dict[str, Any] = {
             "channel": channel,
-            "blocks": [{"type": "section", "text": {"type": "mrkdwn", "text": message}}],
+            "text": text[:MAX_FALLBACK_TEXT_LENGTH],
+            "blocks": blocks,
         }
         if thread_ts:
             data["thread_ts"] = thread_ts
-        self._send_request("POST", url, json=data)
+        return self._send_request("POST", url, channel=channel, json=data)
+
+    def stream_message(self, channel: str, chunks: Iterable[str], thread_ts: str | None = None) -> str:
+        placeholder = self._post_blocks(channel, text_blocks(STREAM_PLACEHOLDER), STREAM_PLACEHOLDER, thread_ts)
+        ts = placeholder["ts"]
+        text = ""
+        updated_text = STREAM_PLACEHOLDER
+        updated_at = time.monotonic()
+        try:
+            for chunk in chunks:
+                text += chunk
+                if time.monotonic() - updated_at >= self.stream_update_interval:
+                    self._update_message(channel, ts, text)
+                    updated_text, updated_at = text, time.monotonic()
+        except Exception:
+            self._update_message(channel, ts, f"{text}\n{STREAM_INTERRUPTED_MESSAGE}".lstrip("\n"))
+            raise
+        text = text or "No Response"
+        if text != updated_text:
+            self._update_message(channel, ts, text)
+        return text
 
-    def get_conversations(self, channel: str, ts: str) -> dict[str, Any]:
-        url = f"{self.BASE_URL}/conversations.replies"
+    def _update_message(self, channel: str, ts: str, text: str) -> dict[str, Any]:
+        url = f"{self.base_url}/chat.update"
+        data = {"channel": channel, "ts": ts, "text": text[:MAX_FALLBACK_TEXT_LENGTH], "blocks": text_blocks(text)}
+        return self._send_request("POST", url, channel=channel, json=data)
+
+    def get_conversations(self, channel: str, ts: str, oldest: str | None = None) -> dict[str, Any]:
+        url = f"{self.base_url}/conversations.replies"
         params = {"channel": channel, "ts": ts}
+        if oldest is not None:
+            params["oldest"] = oldest
         return self._send_request("GET", url, params=params)
 
-    def _send_request(self, method: str, url: str, **kwargs: Any) -> dict[str, Any]:
+    def _send_request(self, method: str, url: str, channel: str | None = None, **kwargs: Any) -> dict[str, Any]:
+        bucket = self.rate_limiter.bucket(channel) if channel else None
         try:
-            if method.upper() == "POST":
-                response = requests.post(url, headers=self.headers, timeout=5, **kwargs)
-            else:
-                response = requests.get(url, headers=self.headers, timeout=5, **kwargs)
+            with span(f"slack.{url.rsplit('/', 1)[-1]}") as current:
+                response = self._request_with_rate_limit(method, url, bucket, current, **kwargs)
             response.raise_for_status()
             return response.json()
         except Exception as e:
             raise SlackRequestError from e
+
+    def _request_with_rate_limit(
+        self, method: str, url: str, bucket: TokenBucket | None, current: Span, **kwargs: Any
+    ) -> requests.Response:
+        for attempt in range(self.max_rate_limit_retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+            response = self.session.request(method.upper(), url, headers=self.headers, timeout=timeout_for(5), **kwargs)
+            current.attributes.update(status=response.status_code, rate_limited=attempt)
+            if response.status_code != TOO_MANY_REQUESTS:
+                break
+            # Retry-After の間はこのチャンネルへの投稿を止めてから再送する
+            retry_after = float(response.headers.get("Retry-After", "1"))
+            left = remaining()
+            if left is not None and retry_after >= left:
+                # 待っている間に締め切りを過ぎる場合は再送しない
+                break
+            logger.warning("Slack rate limited: retry after %s seconds", retry_after)
+            if bucket is not None:
+                bucket.pause(retry_after)
+            else:
+                time.sleep(retry_after)
+        return response
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from src.domain.models import ThreadSession
+from src.domain.services import IThreadSessionStore
+
+
+class ThreadSessionStoreError(Exception):
+    pass
+
+
+class InMemoryThreadSessionStore(IThreadSessionStore):
+    """最近使われたスレッドから max_entries 件を保持する（同一プロセス内でのみ共有される）"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 7 * 86400) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, channel: str, thread_ts: str) -> ThreadSession | None:
+        with self._lock:
+            entry = self._entries.get((channel, thread_ts))
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[(channel, thread_ts)]
+                return None
+            self._entries.move_to_end((channel, thread_ts))
+        # 呼び出し側が書き換えても保存済みの状態に影響しないよう、JSON から復元して返す
+        return ThreadSession.model_validate_json(entry[0])
+
+    def put(self, session: ThreadSession) -> None:
+        with self._lock:
+            self._entries[(session.channel, session.thread_ts)] = (session.model_dump_json(), time.time() + self.ttl)
+            self._entries.move_to_end((session.channel, session.thread_ts))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteThreadSessionStore(IThreadSessionStore):
+    def __init__(self, path: str, ttl: float = 7 * 86400) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS thread_sessions "
+                "(channel TEXT NOT NULL, thread_ts TEXT NOT NULL, session TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (channel, thread_ts))"
+            )
+
+    def get(self, channel: str, thread_ts: str) -> ThreadSession | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT session FROM thread_sessions WHERE channel = ? AND thread_ts = ? AND expires_at > ?",
+                (channel, thread_ts, time.time()),
+            ).fetchone()
+        return ThreadSession.model_validate_json(row[0]) if row else None
+
+    def put(self, session: ThreadSession) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM thread_sessions WHERE expires_at <= ?", (now,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO thread_sessions (channel, thread_ts, session, expires_at) VALUES (?, ?, ?, ?)",
+                (session.channel, session.thread_ts, session.model_dump_json(), now + self.ttl),
+            )
+
+
+def create_thread_session_store_from_env() -> IThreadSessionStore:
+    """
+    THREAD_SESSION_BACKEND: "sqlite"（デフォルト） / "memory"、THREAD_SESSION_PATH: sqlite の保存先、
+    THREAD_SESSION_TTL_SECONDS: 最後の更新から保持する秒数
+    """
+    backend = os.environ.get("THREAD_SESSION_BACKEND", "sqlite")
+    ttl = float(os.environ.get("THREAD_SESSION_TTL_SECONDS", str(7 * 86400)))
+    if backend == "memory":
+        return InMemoryThreadSessionStore(ttl=ttl)
+    if backend == "sqlite":
+        path = os.environ.get("THREAD_SESSION_PATH", "/tmp/ai-paper-summarizer/thread_sessions.sqlite3")  # noqa: S108
+        return SQLiteThreadSessionStore(path, ttl=ttl)
+    msg = f"Unknown thread session store backend: {backend}"
+    raise ThreadSessionStoreError(msg)
@@ -1,20 +1,30 @@
-from typing import Any
+from functools import cache
+import os
+from typing import TYPE_CHECKING, Any
 
-from src.application.slack_handler import SlackEventHandler
-from src.dependency_injector import injector
-from src.infrastructure.file_downloader.file_downloader import FileDownloader
-from src.infrastructure.llm.llm import LLMService
-from src.infrastructure.notion.notion import NotionRepository
-from src.infrastructure.slack.slack import SlackService
+from src.application.event_filter import early_response, parse_event_body
+from src.utils.deadline import deadline, lambda_deadline_seconds
 
-slack_event_handler = SlackEventHandler(
-    slack_service=injector.get(SlackService),
-    content_downloader=injector.get(FileDownloader),
-    llm_service=injector.get(LLMService),
-    notion_repogitpry=injector.get(NotionRepository),
-)
+if TYPE_CHECKING:
+    from src.application.slack_handler import SlackEventHandler
+
+
+@cache
+def get_slack_event_handler() -> "SlackEventHandler":
+    """
+    SlackEventHandler と依存するサービスを組み立てる。
+    URL 検証や再送への応答では不要なため、処理が必要なイベントが来て初めて import・生成する。
+    """
+    from src.application.slack_handler import SlackEventHandler
+    from src.dependency_injector import get_injector
+
+    return get_injector().get(SlackEventHandler)
 
 
 def lambda_handler(event: dict[str, Any], context: Any) -> dict[str, Any]:
-    _ = context  # NOTE: context は使用しない
-    return slack_event_handler.handle_event(event)
+    response = early_response(event, parse_event_body(event), os.environ.get("SLACK_EVENT_MODE", "sync"))
+    if response is not None:
+        return response
+    # Lambda の残り実行時間を締め切りとして、各サービスの呼び出しのタイムアウト・リトライに使う
+    with deadline(lambda_deadline_seconds(context, float(os.environ.get("LAMBDA_DEADLINE_MARGIN_SECONDS", "2")))):
+        return get_slack_event_handler().handle_event(event)
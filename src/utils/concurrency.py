@@ -0,0 +1,78 @@
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+import contextvars
+import threading
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(func: Callable[[T], R], items: Sequence[T], max_workers: int) -> list[R | Exception]:
+    """
+    items の順序を保ったまま func をスレッドプールで並列実行する。
+    失敗した要素は例外オブジェクトをそのまま結果に入れて返す（他の要素は巻き込まない）。
+    max_workers が 1 以下の場合は逐次実行する。
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [_call(func, item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [submit(executor, _call, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def iter_concurrently(func: Callable[[T], R], items: Sequence[T], max_workers: int) -> Iterator[tuple[int, R | Exception]]:
+    """
+    map_concurrently と同様に並列実行し、完了した順に (items 内の位置, 結果) を返す。
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        for idx, item in enumerate(items):
+            yield idx, _call(func, item)
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = {submit(executor, _call, func, item): idx for idx, item in enumerate(items)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def submit(executor: Executor, func: Callable[..., R], *args: Any) -> Future[R]:
+    """呼び出し元の contextvars（実行中のトレースなど）を引き継いでスレッドプールで実行する"""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def _call(func: Callable[[T], R], item: T) -> R | Exception:
+    try:
+        return func(item)
+    except Exception as e:
+        return e
+
+
+class SingleFlight:
+    """
+    同じキーの処理が同時に要求された場合に 1 回だけ実行し、結果を待っている全員で共有する。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future[Any]] = {}
+
+    def do(self, key: str, func: Callable[[], R]) -> R:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                self._in_flight[key] = future
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
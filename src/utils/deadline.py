@@ -0,0 +1,147 @@
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import logging
+import random
+import time
+from typing import Any, TypeVar
+
+from src.utils.concurrency import submit
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+# 残り時間がこれより短い場合でも、タイムアウトにはこの秒数を指定する（0 秒のタイムアウトは即座に失敗するため）
+MIN_TIMEOUT_SECONDS = 0.1
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    この中で行う処理の締め切りを、今から seconds 秒後に設定する（None の場合は締め切りなし）。
+    外側に締め切りがあれば早い方を使う。トレースと同様に contextvars で伝わるため、
+    スレッドプールで実行する処理には src.utils.concurrency のヘルパーを使うこと。
+    """
+    current = _deadline.get()
+    if seconds is not None:
+        at = time.monotonic() + seconds
+        current = at if current is None else min(current, at)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(reserve: float = 0.0) -> float | None:
+    """締め切りまでの残り秒数から reserve を引いたもの。締め切りが無ければ None を返す"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic() - reserve
+
+
+def timeout_for(default: float, reserve: float = 0.0) -> float:
+    """
+    1 回のリクエストのタイムアウト。締め切りの reserve 秒前までに終わるよう default を縮める。
+    既にその時刻を過ぎていれば DeadlineExceededError を送出する。
+    """
+    left = remaining(reserve)
+    if left is None:
+        return default
+    if left <= 0:
+        msg = "Deadline exceeded"
+        raise DeadlineExceededError(msg)
+    return max(min(default, left), MIN_TIMEOUT_SECONDS)
+
+
+def lambda_deadline_seconds(context: Any, margin: float) -> float | None:
+    """Lambda の残り実行時間から、後片付けのための margin 秒を引いた秒数。Lambda の外では None を返す"""
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining is None:
+        return None
+    return get_remaining() / 1000 - margin
+
+
+@dataclass(frozen=True)
+class RequestPolicy:
+    """
+    外部 API の 1 回の呼び出しのタイムアウト・リトライ・ヘッジの方針。
+    reserve: 締め切りのこの秒数前までに終わらせる（後続の投稿・保存の時間を残す）
+    hedge_after: この秒数で応答が無ければ同じリクエストをもう 1 本送り、早い方を使う（None で無効）
+    """
+
+    timeout: float = 60.0
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    reserve: float = 0.0
+    hedge_after: float | None = None
+
+    def call(self, func: Callable[[float], R], retry_on: tuple[type[Exception], ...]) -> R:
+        """func にタイムアウトの秒数を渡して呼び、retry_on の例外であれば締め切りの許す限りリトライする"""
+
+        def attempt() -> R:
+            if self.hedge_after is None:
+                return func(timeout_for(self.timeout, self.reserve))
+            return hedge(lambda: func(timeout_for(self.timeout, self.reserve)), self.hedge_after)
+
+        return retry(attempt, retry_on, self.max_attempts, self.base_delay, self.max_delay, self.reserve)
+
+
+def retry(  # noqa: PLR0913
+    func: Callable[[], R],
+    retry_on: tuple[type[Exception], ...],
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float,
+    reserve: float = 0.0,
+) -> R:
+    """
+    指数バックオフ（full jitter）でリトライする。待ち時間の後に締め切りを過ぎてしまう場合はリトライせずに送出する。
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func()
+        except retry_on as e:
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))  # noqa: S311
+            left = remaining(reserve)
+            if attempt == max_attempts or (left is not None and delay >= left):
+                raise
+            logger.warning("Retrying after %.2f seconds (attempt %d/%d): %r", delay, attempt, max_attempts, e)
+            time.sleep(delay)
+    msg = "max_attempts must be at least 1"
+    raise ValueError(msg)
+
+
+def hedge(func: Callable[[], R], hedge_after: float) -> R:
+    """
+    func を呼び、hedge_after 秒以内に終わらなければもう 1 本同じ呼び出しを並行して行い、先に成功した方の結果を返す。
+    遅い方の呼び出しは待たずに捨てる（結果は使われないが、実行は最後まで続く）。
+    """
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        futures: list[Future[R]] = [submit(executor, func)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            logger.info("Hedging a request that has not finished in %.2f seconds", hedge_after)
+            futures.append(submit(executor, func))
+        errors: list[BaseException] = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    return future.result()
+                errors.append(error)
+        raise errors[0]
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+EMF_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "AIPaperSummarizer")
+
+
+def emit(
+    event: str, fields: dict[str, Any], metrics: dict[str, tuple[float, str]] | None = None, dimensions: dict[str, str] | None = None
+) -> None:
+    """
+    計測結果を 1 行の JSON として出力する。TELEMETRY_FORMAT で出力形式を切り替える。
+    - "json": ロガーに構造化ログとして出力する（既定）
+    - "emf": CloudWatch Embedded Metric Format で標準出力に書き出し、metrics をメトリクスとして登録させる
+    - "none": 出力しない
+    """
+    output_format = os.environ.get("TELEMETRY_FORMAT", "json")
+    metrics = metrics or {}
+    dimensions = dimensions or {}
+    record = {"event": event, **dimensions, **fields, **{name: value for name, (value, _) in metrics.items()}}
+    if output_format == "emf" and metrics:
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": EMF_NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+                }
+            ],
+        }
+        # Lambda のロガーは行頭にプレフィックスを付けるため、EMF は標準出力にそのまま書く
+        print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+    elif output_format != "none":
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def record_metric(name: str, value: float, unit: str = "Milliseconds", **dimensions: str) -> None:
+    emit("metric", {}, {name: (value, unit)}, dimensions)
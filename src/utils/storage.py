@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+# Lambda のコンテナごとに別々に用意され、他のインスタンスからは見えないディレクトリ
+CONTAINER_LOCAL_DIRECTORIES = (Path("/tmp"),)  # noqa: S108
+
+
+def is_async_mode() -> bool:
+    return os.environ.get("SLACK_EVENT_MODE", "sync") == "async"
+
+
+def is_container_local(path: str) -> bool:
+    """path が他のインスタンスと共有されない場所（メモリ上・/tmp 以下）にあるか"""
+    if path == ":memory:":
+        return True
+    resolved = Path(path).resolve()
+    return any(resolved.is_relative_to(directory.resolve()) for directory in CONTAINER_LOCAL_DIRECTORIES)
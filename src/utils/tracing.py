@@ -0,0 +1,150 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any
+import uuid
+
+from src.utils.metrics import emit
+
+# 集計時に合計するスパンの属性（LLM 呼び出しのトークン数と推定コスト）
+SUMMED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str | None
+    parent_id: str | None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.perf_counter)
+    duration_ms: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    """1 件の処理（論文 1 本の要約やスレッドでの 1 回の応答）に属するスパンをまとめる"""
+
+    trace_id: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    spans: list[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """スパン名ごとの回数・合計時間・トークン数・コストを集計する"""
+        stages: dict[str, dict[str, float]] = {}
+        with self._lock:
+            for span in self.spans:
+                stage = stages.setdefault(span.name, {"count": 0, "duration_ms": 0.0})
+                stage["count"] += 1
+                stage["duration_ms"] += span.duration_ms
+                for name in SUMMED_ATTRIBUTES:
+                    if name in span.attributes:
+                        stage[name] = stage.get(name, 0) + span.attributes[name]
+        return stages
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(trace_id: str, **attributes: Any) -> Iterator[Trace]:
+    """
+    処理全体を 1 つのトレースとして記録し、終了時にステージごとの集計を出力する。
+    スレッドプールで実行する処理にも引き継ぐには、contextvars のコンテキストをコピーして実行すること
+    （src.utils.concurrency のヘルパーはそうしている）。
+    """
+    current = Trace(trace_id, dict(attributes))
+    token = _current_trace.set(current)
+    started_at = time.perf_counter()
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        stages = current.summary()
+        totals = {name: sum(stage.get(name, 0) for stage in stages.values()) for name in SUMMED_ATTRIBUTES}
+        emit(
+            "trace",
+            {"trace_id": trace_id, **current.attributes, "stages": stages},
+            {
+                "Duration": ((time.perf_counter() - started_at) * 1000, "Milliseconds"),
+                "PromptTokens": (totals["prompt_tokens"], "Count"),
+                "CompletionTokens": (totals["completion_tokens"], "Count"),
+                "CachedTokens": (totals["cached_tokens"], "Count"),
+                "CostUSD": (totals["cost_usd"], "None"),
+            },
+        )
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """処理の区間の所要時間を記録する。トレースの外で呼ばれた場合も単独のスパンとして出力する"""
+    current_trace = _current_trace.get()
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=current_trace.trace_id if current_trace else None,
+        parent_id=parent.span_id if parent else None,
+        attributes=dict(attributes),
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration_ms = (time.perf_counter() - current.started_at) * 1000
+        _finish(current, current_trace)
+
+
+def record_span(name: str, started_at: float, **attributes: Any) -> None:
+    """
+    time.perf_counter() で測った started_at から現在までを 1 つのスパンとして記録する。
+    ジェネレーターのように with で囲めない処理に使う（実行中のスパンは切り替えない）。
+    """
+    current_trace = _current_trace.get()
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=current_trace.trace_id if current_trace else None,
+        parent_id=parent.span_id if parent else None,
+        started_at=started_at,
+        duration_ms=(time.perf_counter() - started_at) * 1000,
+        attributes=dict(attributes),
+    )
+    _finish(current, current_trace)
+
+
+def _finish(current: Span, current_trace: Trace | None) -> None:
+    if current_trace is not None:
+        current_trace.add(current)
+    emit(
+        "span",
+        {"trace_id": current.trace_id, "span_id": current.span_id, "parent_id": current.parent_id, **current.attributes},
+        {"Duration": (current.duration_ms, "Milliseconds")},
+        {"Span": current.name},
+    )
+
+
+def set_attributes(**attributes: Any) -> None:
+    """実行中のスパンに属性を追加する"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def set_trace_attributes(**attributes: Any) -> None:
+    """実行中のトレースに属性を追加する（論文の URL など、集計の単位になる情報）"""
+    current = _current_trace.get()
+    if current is not None:
+        current.attributes.update(attributes)
@@ -0,0 +1,22 @@
+import os
+from typing import Any
+
+from src.lambda_function import get_slack_event_handler
+from src.utils.deadline import deadline, lambda_deadline_seconds
+
+
+def worker_handler(event: dict[str, Any], context: Any) -> dict[str, Any]:
+    """
+    SLACK_EVENT_MODE=async のときに、lambda_handler が積んだジョブを処理する。
+    lambda_handler とは別の Lambda 関数として、EventBridge のスケジュール（1 分ごとなど）で起動する。
+    キューと処理済みの記録を共有するため、両方の関数に同じ共有ストレージ（EFS など）をマウントし、
+    同じ JOB_QUEUE_PATH・IDEMPOTENCY_PATH を指定する。
+    """
+    _ = event  # NOTE: event は使用しない
+    with deadline(lambda_deadline_seconds(context, float(os.environ.get("LAMBDA_DEADLINE_MARGIN_SECONDS", "2")))):
+        processed = get_slack_event_handler().process_jobs(max_jobs=int(os.environ.get("WORKER_MAX_JOBS", "10")))
+    return {"processed": processed}
+
+
+if __name__ == "__main__":
+    print(worker_handler({}, None))
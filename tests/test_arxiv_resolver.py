@@ -0,0 +1,46 @@
+from pytest_mock import MockerFixture
+
+from src.infrastructure.arxiv_resolver.arxiv_resolver import ArxivResolver
+from src.infrastructure.cache.cache import InMemoryLRUCache
+from src.infrastructure.http_client.http_client import HTTPClientPool
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>http://arxiv.org/abs/2401.00001v2</id>
+    <title>Attention Is
+      All You Need</title>
+    <summary>  We propose the Transformer.  </summary>
+    <category term="cs.CL"/>
+    <category term="cs.LG"/>
+  </entry>
+  <entry>
+    <id>http://arxiv.org/abs/hep-th/9901001v1</id>
+    <title>Old Style Paper</title>
+    <summary>Abstract.</summary>
+    <category term="hep-th"/>
+  </entry>
+  <entry>
+    <id>http://arxiv.org/api/errors#incorrect_id_format_for_bad</id>
+    <title>Error</title>
+  </entry>
+</feed>
+"""
+
+
+def test_resolve_many_batches_ids_and_caches(mocker: MockerFixture) -> None:
+    """
+    複数の URL を 1 回の id_list クエリで解決し、2 回目以降はキャッシュから返すかをテストする。
+    """
+    resolver = ArxivResolver(HTTPClientPool(), metadata_cache=InMemoryLRUCache(max_entries=16))
+    get = mocker.patch.object(resolver.session, "get", return_value=mocker.Mock(content=FEED))
+    urls = ["https://arxiv.org/abs/2401.00001v2?context=cs", "https://arxiv.org/pdf/hep-th/9901001", "https://example.com/blog"]
+    metadata = resolver.resolve_many(urls)
+    assert get.call_count == 1
+    assert get.call_args.kwargs["params"]["id_list"] == "2401.00001,hep-th/9901001"
+    assert metadata[urls[0]].title == "Attention Is All You Need"
+    assert metadata[urls[0]].categories == ["cs.CL", "cs.LG"]
+    assert metadata[urls[0]].abstract == "We propose the Transformer."
+    assert urls[2] not in metadata
+    assert resolver.resolve("https://arxiv.org/abs/2401.00001") == metadata[urls[0]]
+    assert get.call_count == 1
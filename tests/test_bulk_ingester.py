@@ -0,0 +1,113 @@
+import json
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.application.bulk_ingester import BulkIngester, IngestCheckpoint
+from src.domain.models import PaperSummary
+from src.infrastructure.llm.batch import BatchJobClient
+
+
+def _ingester(mocker: MockerFixture) -> BulkIngester:
+    content_downloader = mocker.Mock()
+    content_downloader.download_content.side_effect = lambda url: f"content of {url}"
+    llm_service = mocker.Mock()
+    llm_service.generate_title.return_value = "Title"
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.generate_summary.return_value = {"Q1: a": "A"}
+    llm_service.generate_brief_digest.return_value = "digest"
+    return BulkIngester(content_downloader=content_downloader, llm_service=llm_service, notion_repogitory=mocker.Mock())
+
+
+def test_concurrent_ingest_resumes_from_checkpoint(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    完了した論文はチェックポイントに残り、同じファイルで再実行すると失敗した論文だけを処理し直すかをテストする。
+    """
+    path = str(tmp_path / "checkpoint.json")
+    urls = ["https://arxiv.org/abs/2401.00001", "https://example.com/bad", "https://arxiv.org/pdf/2401.00001"]
+    ingester = _ingester(mocker)
+
+    def download_content(url: str) -> str:
+        if url.endswith("bad"):
+            raise RuntimeError
+        return "content"
+
+    ingester.content_downloader.download_content.side_effect = download_content  # type: ignore[attr-defined]
+    ingester.ingest(urls, IngestCheckpoint(path))
+    assert ingester.notion_repogitory.add_content.call_count == 1  # type: ignore[attr-defined]
+
+    resumed = _ingester(mocker)
+    checkpoint = IngestCheckpoint(path)
+    assert list(checkpoint.state["failed"]) == ["https://example.com/bad"]
+    resumed.ingest(urls, checkpoint)
+    assert [call.args[0] for call in resumed.content_downloader.download_content.call_args_list] == ["https://example.com/bad"]  # type: ignore[attr-defined]
+    assert checkpoint.state["failed"] == {}
+    assert len(checkpoint.state["done"]) == 2
+
+
+def test_batch_ingest_collects_submitted_batch_after_interruption(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    バッチジョブの投入後に中断しても、再実行時には投入し直さずに結果を回収して保存するかをテストする。
+    """
+    path = str(tmp_path / "checkpoint.json")
+    urls = ["https://example.com/a", "https://example.com/b"]
+    ingester = _ingester(mocker)
+    ingester.llm_service.submit_summary_batch.return_value = "batch_1"  # type: ignore[attr-defined]
+    ingester.llm_service.collect_summary_batch.side_effect = KeyboardInterrupt  # type: ignore[attr-defined]
+    with pytest.raises(KeyboardInterrupt):
+        ingester.ingest(urls, IngestCheckpoint(path), mode="batch")
+
+    resumed = _ingester(mocker)
+    resumed.llm_service.submit_summary_batch.return_value = "batch_2"  # type: ignore[attr-defined]
+    resumed.llm_service.collect_summary_batch.side_effect = [  # type: ignore[attr-defined]
+        {"0": PaperSummary(title="A", category=["NLP"], summary={"Q1: a": "A"})},
+        {"0": PaperSummary(title="B", category=["NLP"], summary={"Q1: a": "A"})},
+    ]
+    checkpoint = IngestCheckpoint(path)
+    resumed.ingest(urls, checkpoint, mode="batch")
+    collected = [call.args[0] for call in resumed.llm_service.collect_summary_batch.call_args_list]  # type: ignore[attr-defined]
+    assert collected == ["batch_1", "batch_2"]
+    # 結果が得られなかった論文だけを、新しいバッチとして投入し直す
+    assert resumed.llm_service.submit_summary_batch.call_args.args[0] == {"0": "content of https://example.com/b"}  # type: ignore[attr-defined]
+    assert [call.args[0].title for call in resumed.notion_repogitory.add_content.call_args_list] == ["A", "B"]  # type: ignore[attr-defined]
+    assert checkpoint.state["failed"] == {}
+    assert checkpoint.batch is None
+
+
+def test_batch_ingest_recovers_from_expired_batch(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    バッチジョブが期限切れで終わった場合、得られた結果は保存し、残りは失敗として記録してバッチを片付けるかをテストする。
+    再実行時には失敗した論文だけを新しいバッチで処理し直す。
+    """
+    path = str(tmp_path / "checkpoint.json")
+    urls = ["https://example.com/a", "https://example.com/b"]
+    output_line = {
+        "custom_id": "0:title",
+        "response": {"status_code": 200, "body": {}},
+        "error": None,
+    }
+    client = mocker.Mock()
+    client.batches.retrieve.return_value = mocker.Mock(
+        status="expired", output_file_id="file_out", error_file_id=None, errors=None, request_counts=None
+    )
+    client.files.content.return_value.text = json.dumps(output_line)
+    results = BatchJobClient(client, poll_interval_seconds=0).wait("batch_1")
+    assert list(results) == ["0:title"]
+
+    ingester = _ingester(mocker)
+    ingester.llm_service.submit_summary_batch.return_value = "batch_1"  # type: ignore[attr-defined]
+    # 期限切れまでに 1 本目の論文の結果だけが得られた
+    ingester.llm_service.collect_summary_batch.return_value = {"0": PaperSummary(title="A", category=["NLP"], summary={"Q1: a": "A"})}  # type: ignore[attr-defined]
+    checkpoint = IngestCheckpoint(path)
+    ingester.ingest(urls, checkpoint, mode="batch")
+    assert [value["title"] for value in checkpoint.state["done"].values()] == ["A"]
+    assert list(checkpoint.state["failed"]) == ["https://example.com/b"]
+    assert checkpoint.batch is None
+
+    resumed = _ingester(mocker)
+    resumed.llm_service.submit_summary_batch.return_value = "batch_2"  # type: ignore[attr-defined]
+    resumed.llm_service.collect_summary_batch.return_value = {"0": PaperSummary(title="B", category=["NLP"], summary={"Q1: a": "A"})}  # type: ignore[attr-defined]
+    resumed.ingest(urls, IngestCheckpoint(path), mode="batch")
+    assert resumed.llm_service.submit_summary_batch.call_args.args[0] == {"0": "content of https://example.com/b"}  # type: ignore[attr-defined]
+    assert IngestCheckpoint(path).state["failed"] == {}
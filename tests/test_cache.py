@@ -0,0 +1,107 @@
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.infrastructure.cache.cache import (
+    DEFAULT_LOCAL_CACHE_MAX_BYTES,
+    LocalDirectoryObjectStore,
+    LocalDiskCache,
+    ObjectStoreCache,
+    create_cache_from_env,
+)
+from src.infrastructure.file_downloader.url import content_key, extract_arxiv_id
+
+
+def test_local_disk_cache_counts_hits_and_misses(tmp_path: str) -> None:
+    """
+    保存した値が取得でき、ヒット・ミスが数えられるかをテストする。
+    """
+    cache = LocalDiskCache(str(tmp_path))
+    assert cache.get("text:1:arxiv:2401.00001") is None
+    cache.set("text:1:arxiv:2401.00001", "論文本文")
+    assert cache.get("text:1:arxiv:2401.00001") == "論文本文"
+    assert cache.stats.as_dict() == {"hits": 1, "misses": 1}
+
+
+def test_cache_expires_after_ttl(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    TTL を過ぎたエントリがミス扱いになるかをテストする。
+    """
+    cache = ObjectStoreCache(LocalDirectoryObjectStore(str(tmp_path)), ttl_seconds=60)
+    cache.set("key", "value")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("key") is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path: str) -> None:
+    """
+    サイズ上限を超えたときに、最近使われていないエントリから削除されるかをテストする。
+    """
+    cache = LocalDiskCache(str(tmp_path), max_bytes=400)
+    cache.set("a", "x" * 100)
+    time.sleep(0.01)
+    cache.set("b", "x" * 100)
+    time.sleep(0.01)
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.set("c", "x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://arxiv.org/abs/2401.00001",
+        "https://arxiv.org/pdf/2401.00001.pdf",
+        "https://arxiv.org/pdf/2401.00001",
+        "https://export.arxiv.org/abs/2401.00001?context=cs.CL",
+        "https://arxiv.org/abs/2401.00001/",
+    ],
+)
+def test_content_key_for_arxiv(url: str) -> None:
+    """
+    arXiv の URL は形式によらず同じキーになるかをテストする。
+    """
+    assert content_key(url) == "arxiv:2401.00001"
+
+
+def test_extract_arxiv_id_keeps_version_and_old_style_ids() -> None:
+    """
+    バージョン付き・旧形式の ID や、クエリ付きの URL から ID を取り出せるかをテストする。
+    """
+    assert extract_arxiv_id("https://arxiv.org/abs/2401.00001v2?context=cs") == "2401.00001v2"
+    assert extract_arxiv_id("https://arxiv.org/pdf/hep-th/9901001v1.pdf") == "hep-th/9901001v1"
+    assert extract_arxiv_id("arXiv:2401.00001") == "2401.00001"
+    assert extract_arxiv_id("https://example.com/arxiv/paper") is None
+
+
+def test_content_key_removes_tracking_query() -> None:
+    assert content_key("HTTPS://Example.com/blog/post/?utm_source=x#section") == "https://example.com/blog/post"
+
+
+def test_cache_lists_store_only_when_estimate_exceeds_limit(tmp_path: str, mocker: MockerFixture) -> None:
+    """
+    書き込みのたびに一覧を取得せず、書き込んだサイズの累計が上限を超えたときだけ一覧を取得して削除するかをテストする。
+    """
+    store = LocalDirectoryObjectStore(str(tmp_path))
+    list_objects = mocker.spy(store, "list_objects")
+    cache = ObjectStoreCache(store, max_bytes=1000)
+    for idx in range(8):
+        cache.set(f"key{idx}", "x" * 100)
+    # 最初の書き込みで見積もりを初期化し、その後は上限を超えた 1 回だけ一覧を取得する
+    assert list_objects.call_count == 2
+    assert sum(obj.size for obj in store.list_objects()) <= 1000
+
+
+def test_disk_cache_from_env_has_default_size_limit(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    サイズ上限を指定しない disk キャッシュにも、/tmp に収まる既定の上限が付くかをテストする。
+    """
+    monkeypatch.delenv("TEXT_CACHE_MAX_BYTES", raising=False)
+    cache = create_cache_from_env("TEXT_CACHE", str(tmp_path))
+    assert isinstance(cache, LocalDiskCache)
+    assert cache.max_bytes == DEFAULT_LOCAL_CACHE_MAX_BYTES
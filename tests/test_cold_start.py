@@ -0,0 +1,13 @@
+import os
+
+from benchmarks.cold_start import CHALLENGE_SCRIPT, run_script
+
+
+def test_challenge_path_stays_within_cold_start_budget() -> None:
+    """
+    URL 検証イベントへの応答が重いライブラリを読み込まず、コールドスタートの予算内に収まるかをテストする。
+    """
+    budget_ms = float(os.environ.get("COLD_START_BUDGET_MS", "200"))
+    result = run_script(CHALLENGE_SCRIPT)
+    assert result["heavy_modules"] == []
+    assert result["elapsed"] * 1000 < budget_ms
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.utils.deadline import DeadlineExceededError, RequestPolicy, deadline, hedge, remaining, retry, timeout_for
+
+
+def test_timeout_is_capped_by_deadline() -> None:
+    """
+    タイムアウトが締め切りまでの残り時間に縮められ、入れ子の締め切りは早い方が使われるかをテストする。
+    """
+    assert timeout_for(60) == 60
+    with deadline(10):
+        assert timeout_for(60, reserve=5) <= 5
+        with deadline(100):
+            assert remaining() is not None
+            assert remaining() <= 10  # type: ignore[operator]
+        with deadline(-1), pytest.raises(DeadlineExceededError):
+            timeout_for(60)
+    assert remaining() is None
+
+
+def test_retry_stops_before_deadline(mocker: MockerFixture) -> None:
+    """
+    リトライの待ち時間の後に締め切りを過ぎてしまう場合は、リトライせずに送出するかをテストする。
+    """
+    func = mocker.Mock(side_effect=[ConnectionError, "ok"])
+    assert retry(func, (ConnectionError,), max_attempts=3, base_delay=0.01, max_delay=0.01) == "ok"
+
+    func = mocker.Mock(side_effect=ConnectionError)
+    sleep = mocker.patch("src.utils.deadline.time.sleep")
+    with deadline(0.5), pytest.raises(ConnectionError):
+        retry(func, (ConnectionError,), max_attempts=5, base_delay=10, max_delay=10, reserve=0.5)
+    assert func.call_count == 1
+    sleep.assert_not_called()
+
+
+def test_request_policy_passes_timeout_and_hedges() -> None:
+    """
+    応答が遅い場合にもう 1 本リクエストを送り、先に返った結果を使うかをテストする。
+    """
+    calls: list[float] = []
+
+    def slow_then_fast(timeout: float) -> str:
+        calls.append(timeout)
+        if len(calls) == 1:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert RequestPolicy(timeout=30, hedge_after=0.05).call(slow_then_fast, (ConnectionError,)) == "fast"
+    assert time.monotonic() - started < 1
+    assert calls == [30, 30]
+    assert hedge(lambda: "only", 1) == "only"
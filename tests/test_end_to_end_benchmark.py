@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+
+def test_end_to_end_benchmark_runs_against_stub_services() -> None:
+    """
+    スタブのサービスに対してメンションの処理が最後まで通り、ステージごとの結果が出力されるかをテストする。
+    """
+    env = {**os.environ, "SLACK_CHANNEL_RATE_PER_SEC": "1000"}
+    args = [
+        "--iterations",
+        "1",
+        "--openai-latency-ms",
+        "0",
+        "--slack-latency-ms",
+        "0",
+        "--notion-latency-ms",
+        "0",
+        "--download-latency-ms",
+        "0",
+    ]
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-m", "benchmarks.end_to_end", *args], capture_output=True, text=True, check=True, env=env, timeout=120
+    )
+    assert "end-to-end" in result.stdout
+    assert "notion   requests=5" in result.stdout
+    assert "slack: post" in result.stdout
@@ -0,0 +1,93 @@
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.infrastructure.cache.cache import InMemoryLRUCache
+from src.infrastructure.file_downloader.file_downloader import FileDownloader
+from src.infrastructure.file_downloader.html_extractor import extract_main_content
+from src.infrastructure.http_client.http_client import HTTPClientPool
+
+ARTICLE_HTML = (
+    "<html><head><title>Example Paper</title><script>var tracking = 1;</script></head><body>"
+    "<nav>Home | About</nav>"
+    "<article><h1>Example Paper</h1>" + "<p>This paragraph explains the method in detail.</p>" * 10 + "</article>"
+    "<div class='comments'>Great post!</div><!-- hidden comment --><footer>Copyright</footer>"
+    "</body></html>"
+)
+
+
+def _response(mocker: MockerFixture, status_code: int, body: bytes = b"", headers: dict[str, str] | None = None) -> Any:
+    response = mocker.MagicMock(status_code=status_code, headers=headers or {}, url="https://example.com/post")
+    response.__enter__.return_value = response
+    response.iter_content.return_value = [body[i : i + 100] for i in range(0, len(body), 100)]
+    return response
+
+
+@pytest.fixture
+def downloader() -> FileDownloader:
+    return FileDownloader(HTTPClientPool(), text_cache=InMemoryLRUCache(max_entries=16))
+
+
+def test_extract_main_content_drops_boilerplate() -> None:
+    """
+    スクリプト・ナビゲーション・コメント欄・フッターを除き、本文だけが Markdown になるかをテストする。
+    """
+    markdown = extract_main_content(ARTICLE_HTML.encode(), "utf-8")
+    assert "This paragraph explains the method" in markdown
+    for noise in ("tracking", "Home | About", "Great post", "hidden comment", "Copyright"):
+        assert noise not in markdown
+
+
+def test_html_download_is_capped(downloader: FileDownloader, mocker: MockerFixture) -> None:
+    """
+    上限を超える HTML は上限のバイト数までしか読まないかをテストする。
+    """
+    downloader.html_max_bytes = 250
+    body = b"<html><body><p>" + b"a" * 1000 + b"</p></body></html>"
+    mocker.patch.object(downloader.session, "get", return_value=_response(mocker, 200, body))
+    assert downloader.download_content("https://example.com/post") == "a" * (250 - len(b"<html><body><p>"))
+
+
+def test_html_revalidation_reuses_extraction_on_304(downloader: FileDownloader, mocker: MockerFixture) -> None:
+    """
+    再取得時に ETag / Last-Modified の条件付きリクエストを送り、304 なら前回の抽出結果を使うかをテストする。
+    """
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT", "Content-Type": "text/html; charset=utf-8"}
+    get = mocker.patch.object(
+        downloader.session, "get", side_effect=[_response(mocker, 200, ARTICLE_HTML.encode(), headers), _response(mocker, 304)]
+    )
+    first = downloader.download_content("https://example.com/post")
+    downloader.html_revalidate_seconds = 0
+    extract = mocker.patch("src.infrastructure.file_downloader.file_downloader.extract_main_content")
+    assert downloader.download_content("https://example.com/post") == first
+    extract.assert_not_called()
+    conditional_headers = get.call_args.kwargs["headers"]
+    assert conditional_headers["If-None-Match"] == '"v1"'
+    assert conditional_headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+@pytest.mark.parametrize(
+    "wrapper",
+    [
+        '<div class="layout with-sidebar">',
+        '<div class="post-body share-enabled">',
+        '<div class="related-work">',
+        '<div id="comments-and-article">',
+    ],
+)
+def test_extract_main_content_keeps_wrappers_resembling_noise(wrapper: str) -> None:
+    """
+    ノイズに似た名前の class / id を持つ本文の外側の要素を消さず、本文の中のノイズだけを取り除くかをテストする。
+    """
+    html = (
+        f"<html><head><title>T</title></head><body>{wrapper}"
+        "<div class='sidebar'>Popular posts</div>"
+        "<article><h1>Example Paper</h1>" + "<p>This paragraph explains the method in detail.</p>" * 10 + ""
+        "<div class='share-buttons'>Tweet this</div></article>"
+        "</div></body></html>"
+    )
+    markdown = extract_main_content(html)
+    assert markdown.count("This paragraph explains the method") == 10
+    assert "Tweet this" not in markdown
+    assert "Popular posts" not in markdown
@@ -0,0 +1,360 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from typing import Any
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+import pytest
+from pytest_mock import MockerFixture
+
+from src.infrastructure.cache.cache import InMemoryLRUCache
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.llm._types import LLMSettings, Messages
+from src.infrastructure.llm.batch import BatchJobClient
+from src.infrastructure.llm.history import ConversationCompactor
+from src.infrastructure.llm.llm import (
+    SUMMARY_FAILURE_MESSAGE,
+    BatchContentSummarizer,
+    CategoryClassifier,
+    ChatAssistant,
+    ChunkNoteTaker,
+    ContentSummarizer,
+    LLMCondenseError,
+    LLMService,
+    TitleExtractor,
+)
+from src.infrastructure.llm.schemas import LLMOutputError
+from src.infrastructure.llm.tokenizer import TokenCounter
+from src.infrastructure.llm.usage import TokenUsageTracker
+from src.infrastructure.llm.windowing import detect_sections, front_matter, render_summary
+
+
+@pytest.fixture
+def llm_service(monkeypatch: pytest.MonkeyPatch) -> LLMService:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "8")
+    return LLMService(HTTPClientPool())
+
+
+def test_generate_summary_keeps_question_order(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    並列実行しても Q1〜Q8 の順序が保たれるかをテストする。
+    """
+
+    def fake_call(self: ContentSummarizer, inputs: dict[str, Any]) -> dict[str, str]:
+        # 後半の質問ほど早く終わるようにして、完了順と質問順をずらす
+        time.sleep(0.01 * (8 - int(inputs["question"][1:])))
+        return {self.to_answer_key(inputs["question"]): f"answer {inputs['question']}"}
+
+    mocker.patch.object(ContentSummarizer, "__call__", fake_call)
+    summary = llm_service.generate_summary("text")
+    assert [key.split(":")[0] for key in summary] == ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7", "Q8"]
+    assert next(iter(summary.values())) == "answer Q1"
+
+
+def test_generate_summary_reports_failed_question(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    1問だけ失敗しても他の回答は残り、失敗した質問にはその旨が入るかをテストする。
+    """
+
+    def fake_call(self: ContentSummarizer, inputs: dict[str, Any]) -> dict[str, str]:
+        if inputs["question"] == "Q3":
+            raise RuntimeError
+        return {self.to_answer_key(inputs["question"]): "ok"}
+
+    mocker.patch.object(ContentSummarizer, "__call__", fake_call)
+    summary = llm_service.generate_summary("text")
+    assert len(summary) == 8
+    failed = [value for key, value in summary.items() if key.startswith("Q3")]
+    assert failed == [SUMMARY_FAILURE_MESSAGE]
+
+
+def _completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }
+    )
+
+
+def test_generate_summary_batched_reasks_only_missing(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    まとめて回答させたときに欠けた質問だけを再度問い合わせるかをテストする。
+    """
+    llm_service.summary_mode = "batched"
+    llm_service.summary_batch_groups = [["Q1", "Q2", "Q3"]]
+    requested: list[list[str]] = []
+
+    def fake_generate(self: BatchContentSummarizer, _messages: Messages, _llm_settings: LLMSettings) -> ChatCompletion:
+        requested.append(self.target_questions)
+        # スキーマで全てのキーが必須のため、回答できなかった質問は空の回答として返る
+        answers = {question: "" if question == "Q2" and len(requested) == 1 else f"answer {question}" for question in self.target_questions}
+        return _completion(json.dumps(answers))
+
+    mocker.patch.object(BatchContentSummarizer, "_generate", fake_generate)
+    summary = llm_service.generate_summary("text")
+    assert requested == [["Q1", "Q2", "Q3"], ["Q2"]]
+    assert list(summary.values()) == ["answer Q1", "answer Q2", "answer Q3"]
+
+
+def test_response_cache_coalesces_identical_requests(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    同じリクエストは同時に送られても 1 回しか API を呼ばず、以降はキャッシュから返るかをテストする。
+    """
+    calls: list[Messages] = []
+
+    def fake_create(_self: TitleExtractor, messages: Messages, _llm_settings: LLMSettings) -> ChatCompletion:
+        calls.append(messages)
+        time.sleep(0.05)
+        return _completion('{"title": "Attention Is All You Need"}')
+
+    mocker.patch.object(TitleExtractor, "_create_completion", fake_create)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        titles = list(executor.map(llm_service.generate_title, ["paper"] * 4))
+    assert titles == ["Attention Is All You Need"] * 4
+    assert llm_service.generate_title("paper") == "Attention Is All You Need"
+    assert len(calls) == 1
+
+
+def test_chat_response_is_not_cached(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    キャッシュを無効にしている ChatAssistant は毎回 API を呼ぶかをテストする。
+    """
+    create = mocker.patch.object(ChatAssistant, "_create_completion", return_value=_completion("回答"))
+    messages = [{"role": "user", "content": "質問"}]
+    llm_service.generate_chat_response(messages)
+    llm_service.generate_chat_response(messages)
+    assert create.call_count == 2
+
+
+def _chunk(content: str | None, usage: dict[str, int] | None = None) -> ChatCompletionChunk:
+    choices = [] if content is None else [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+    return ChatCompletionChunk.model_validate(
+        {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o", "choices": choices, "usage": usage}
+    )
+
+
+def test_stream_chat_response_yields_deltas(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    ストリーミングでテキストの断片が順に返り、最後のチャンクの使用量が記録されるかをテストする。
+    """
+    chunks = [_chunk("こんにち"), _chunk("は"), _chunk(None, {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12})]
+    mocker.patch("openai.resources.chat.completions.Completions.create", return_value=iter(chunks))
+    assert list(llm_service.stream_chat_response([{"role": "user", "content": "質問"}])) == ["こんにち", "は"]
+    assert llm_service.usage_tracker.snapshot()["ChatAssistant"]["completion_tokens"] == 2
+
+
+def test_token_counter_split_respects_budget() -> None:
+    """
+    分割した各チャンクがトークン上限以内に収まり、連結すると元のテキストに戻るかをテストする。
+    """
+    counter = TokenCounter()
+    text = "".join(f"段落{i}の本文です。This is paragraph {i}.\n" for i in range(200))
+    chunks = counter.split(text, max_tokens=100)
+    assert len(chunks) > 1
+    assert all(counter.count(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_long_text_is_condensed_once_by_map_reduce(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    予算を超える入力はチャンクごとに要点を抜き出して圧縮され、同じ文書の圧縮は 1 度だけ行われるかをテストする。
+    """
+    llm_service.input_token_budget = 300
+    llm_service.chunk_tokens = 100
+    note_taker = mocker.patch.object(ChunkNoteTaker, "_create_completion", return_value=_completion("・要点"))
+    summarizer = mocker.patch.object(ContentSummarizer, "_create_completion", return_value=_completion('{"Q1": "A"}'))
+    text = "long paper body. " * 200
+
+    llm_service.generate_summary(text)
+    llm_service.generate_summary(text)
+    assert note_taker.call_count == len(llm_service.token_counter.split(text, 100))
+    sent_messages = summarizer.call_args_list[0].args[0]
+    assert "long paper body" not in sent_messages[1]["content"]
+
+
+def test_condense_fails_when_too_few_chunks_succeed(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    要点を抜き出せたチャンクが少なすぎる場合、欠けた要約を渡さずに失敗し、結果をキャッシュしないかをテストする。
+    """
+    llm_service.input_token_budget = 300
+    llm_service.chunk_tokens = 100
+    text = "long paper body. " * 200
+    num_chunks = len(llm_service.token_counter.split(text, 100))
+    # 1 つ目のチャンクだけ成功し、残りは失敗する
+    responses: list[Any] = [_completion("・要点"), *[RuntimeError()] * (num_chunks - 1)]
+    mocker.patch.object(ChunkNoteTaker, "_create_completion", side_effect=responses)
+    summarizer = mocker.patch.object(ContentSummarizer, "_create_completion")
+
+    with pytest.raises(LLMCondenseError):
+        llm_service.generate_summary(text)
+    summarizer.assert_not_called()
+    assert not llm_service._condensed_cache._entries
+
+
+def test_title_and_category_read_only_front_matter(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    タイトルは冒頭だけ、カテゴリはアブストラクトの終わりまでを入力にし、長い文書でも map-reduce を行わないかをテストする。
+    """
+    llm_service.input_token_budget = 300
+    note_taker = mocker.patch.object(ChunkNoteTaker, "_create_completion")
+    title_extractor = mocker.patch.object(TitleExtractor, "_create_completion", return_value=_completion('{"title": "T"}'))
+    category_classifier = mocker.patch.object(CategoryClassifier, "_create_completion", return_value=_completion('{"category": ["LLM"]}'))
+    text = "A Great Paper\nAlice, Bob\nAbstract\nWe propose a method.\n1 Introduction\n" + "long paper body. " * 2000
+
+    assert llm_service.generate_title(text) == "T"
+    assert llm_service.generate_category(text) == ["LLM"]
+    note_taker.assert_not_called()
+    assert llm_service.token_counter.count(title_extractor.call_args.args[0][1]["content"]) < 1100
+    category_input = category_classifier.call_args.args[0][1]["content"]
+    assert category_input.endswith("A Great Paper\nAlice, Bob\nAbstract\nWe propose a method.\n")
+
+
+def test_detect_sections_and_render_summary() -> None:
+    """
+    見出しの形式によらずセクションを区切り、ダイジェスト用の要約が repr ではなくテキストになるかをテストする。
+    """
+    text = "Title\nAbstract—We study X.\nMore abstract.\nI. INTRODUCTION\nBody\n## 2.1 Setup\nDetails\n"
+    assert [section.title for section in detect_sections(text)] == ["Abstract", "INTRODUCTION", "2.1 Setup"]
+    assert front_matter(text, TokenCounter(), 100) == "Title\nAbstract—We study X.\nMore abstract.\n"
+    summary = {"Q1: 何に関する論文か": "X の研究\n", "Q5: 限界": "なし", "Q2: 内容": SUMMARY_FAILURE_MESSAGE}
+    rendered = render_summary(summary, ["Q1", "Q2"], exclude=(SUMMARY_FAILURE_MESSAGE,))
+    assert rendered == "## Q1: 何に関する論文か\nX の研究"
+
+
+def test_summary_batch_round_trip(llm_service: LLMService, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    バッチに文書ごとのタイトル・カテゴリ・要約のリクエストを積み、結果を文書ごとにまとめ直すかをテストする。
+    失敗したリクエストの質問には失敗した旨が入り、タイトルが得られない文書は結果に含めない。
+    """
+    monkeypatch.setattr(llm_service, "summary_mode", "batched")
+    monkeypatch.setattr(llm_service, "summary_batch_groups", [["Q1", "Q2", "Q3", "Q4"], ["Q5", "Q6", "Q7", "Q8"]])
+    submit = mocker.patch.object(BatchJobClient, "submit", return_value="batch_1")
+    assert llm_service.submit_summary_batch({"0": "paper A", "1": "paper B"}) == "batch_1"
+    requests = submit.call_args.args[0]
+    assert [request["custom_id"] for request in requests[:4]] == [
+        "0:title",
+        "0:category",
+        "0:summary_batch:Q1,Q2,Q3,Q4",
+        "0:summary_batch:Q5,Q6,Q7,Q8",
+    ]
+    assert requests[0]["body"]["model"] == "gpt-4o-mini"
+
+    def result(custom_id: str, content: str) -> dict[str, Any]:
+        return {"custom_id": custom_id, "response": {"status_code": 200, "body": _completion(content).model_dump()}, "error": None}
+
+    answers = {f"Q{i}": f"answer Q{i}" for i in range(1, 5)}
+    results = {
+        "0:title": result("0:title", json.dumps({"title": "Paper A"})),
+        "0:category": result("0:category", json.dumps({"category": ["LLM", "Agent"]})),
+        "0:summary_batch:Q1,Q2,Q3,Q4": result("0:summary_batch:Q1,Q2,Q3,Q4", json.dumps(answers)),
+        "0:summary_batch:Q5,Q6,Q7,Q8": {"custom_id": "0:summary_batch:Q5,Q6,Q7,Q8", "response": None, "error": {"code": "server_error"}},
+        "1:title": {"custom_id": "1:title", "response": {"status_code": 500, "body": {}}, "error": None},
+        "1:category": result("1:category", json.dumps({"category": ["CV"]})),
+    }
+    mocker.patch.object(BatchJobClient, "wait", return_value=results)
+    summaries = llm_service.collect_summary_batch("batch_1")
+    assert list(summaries) == ["0"]
+    assert summaries["0"].title == "Paper A"
+    assert summaries["0"].category == ["LLM", "Agent"]
+    assert [key.split(":")[0] for key in summaries["0"].summary] == ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7", "Q8"]
+    assert next(iter(summaries["0"].summary.values())) == "answer Q1"
+    assert list(summaries["0"].summary.values())[4] == SUMMARY_FAILURE_MESSAGE
+
+
+def test_history_compaction_reuses_rolling_summary(mocker: MockerFixture) -> None:
+    """
+    予算を超える会話は古いやりとりを要約に畳み込み、次の返信では前回の要約に続きのやりとりだけを加えて要約するかをテストする。
+    """
+    summarize = mocker.Mock(side_effect=lambda previous, messages: f"{previous}+{len(messages)}")
+    compactor = ConversationCompactor(
+        TokenCounter(), summarize, InMemoryLRUCache(max_entries=8), prompt_token_budget=200, summary_tokens=20, fold_step=2
+    )
+    pinned = {"role": "user", "content": "excerpt", "pinned": True}
+    turns = [{"role": "user" if idx % 2 == 0 else "assistant", "content": f"message {idx} " + "x" * 100} for idx in range(12)]
+
+    compacted = compactor.compact([pinned, *turns])
+    assert compacted[0] == pinned
+    assert compacted[1]["role"] == "system"
+    assert compacted[-1] == turns[-1]
+    assert TokenCounter().count_messages(compacted) <= 200
+    folded = summarize.call_args.args[1]
+    assert compacted[1]["content"].endswith(f"+{len(folded)}")
+
+    # 2 往復後の返信では、前回までの要約を引き継いで新たに畳み込む分だけを要約する
+    more_turns = [*turns, {"role": "user", "content": "next " + "y" * 100}, {"role": "assistant", "content": "z" * 100}]
+    compactor.compact([pinned, *more_turns])
+    assert summarize.call_count == 2
+    previous, messages = summarize.call_args.args
+    assert previous == f"+{len(folded)}"
+    assert messages == more_turns[len(folded) : len(folded) + 2]
+
+
+def test_invalid_output_is_repaired_without_the_document(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    スキーマに合わない出力は、論文を送り直さずに出力と誤りだけを渡して直させ、直せなければ例外になるかをテストする。
+    """
+    create = mocker.patch.object(
+        CategoryClassifier,
+        "_create_completion",
+        side_effect=[_completion('{"category": "[LLM, Agent]"}'), _completion('{"category": ["LLM", "Agent"]}')],
+    )
+    assert llm_service.generate_category("Abstract\nlong paper body") == ["LLM", "Agent"]
+    first_messages, first_settings = create.call_args_list[0].args
+    assert first_settings["response_format"]["json_schema"]["strict"] is True
+    repair_messages = create.call_args_list[1].args[0]
+    assert "long paper body" not in repair_messages[1]["content"]
+    assert "category" in repair_messages[1]["content"]
+    assert "long paper body" in first_messages[1]["content"]
+
+    mocker.patch.object(TitleExtractor, "_create_completion", return_value=_completion('{"title": 1}'))
+    with pytest.raises(LLMOutputError):
+        llm_service.generate_title("paper")
+
+
+def test_summary_answer_is_validated_against_requested_question(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    依頼した質問の回答が無い出力は検証で不正とみなし、修正できなければ失敗した旨が回答に入るかをテストする。
+    """
+    create = mocker.patch.object(ContentSummarizer, "_create_completion", return_value=_completion("{}"))
+    summary = llm_service.generate_summary("text")
+    assert list(summary.values()) == [SUMMARY_FAILURE_MESSAGE] * 8
+    # 各質問につき、最初の呼び出しと修正の依頼の 2 回
+    assert create.call_count == 16
+
+
+def test_only_valid_responses_are_cached(llm_service: LLMService, mocker: MockerFixture) -> None:
+    """
+    検証に失敗した応答はキャッシュに残らずやり直しで API を呼び、直した応答は元のリクエストのキャッシュから返るかをテストする。
+    """
+    create = mocker.patch.object(TitleExtractor, "_create_completion", return_value=_completion('{"title": 1}'))
+    for _ in range(2):
+        with pytest.raises(LLMOutputError):
+            llm_service.generate_title("paper")
+    assert create.call_count == 4
+
+    create = mocker.patch.object(
+        TitleExtractor,
+        "_create_completion",
+        side_effect=[_completion('{"title": 1}'), _completion('{"title": "Fixed"}')],
+    )
+    assert llm_service.generate_title("paper") == "Fixed"
+    assert llm_service.generate_title("paper") == "Fixed"
+    assert create.call_count == 2
+
+
+def test_scoped_usage_tracker_also_records_to_parent() -> None:
+    """
+    範囲を絞った集計はその範囲の使用量だけを持ち、親の集計にも同じ使用量が加わるかをテストする。
+    """
+    parent = TokenUsageTracker()
+    response = _chunk(None, {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12})
+    parent.record("ChunkNoteTaker", response)
+    scoped = TokenUsageTracker(parent=parent)
+    scoped.record("ChunkNoteTaker", response)
+    assert scoped.snapshot()["ChunkNoteTaker"]["prompt_tokens"] == 10
+    assert parent.snapshot()["ChunkNoteTaker"]["prompt_tokens"] == 20
@@ -0,0 +1,64 @@
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.notion.notion import NotionRepository
+
+
+def _page(page_id: str, url: str, last_edited_time: str) -> dict[str, Any]:
+    return {"id": page_id, "last_edited_time": last_edited_time, "properties": {"url": {"url": url}}}
+
+
+class FakeDatabases:
+    def __init__(self, pages: list[dict[str, Any]]) -> None:
+        self.pages = pages
+        self.queries: list[dict[str, Any]] = []
+
+    def query(self, **kwargs: Any) -> dict[str, Any]:
+        self.queries.append(kwargs)
+        if "filter" in kwargs and "property" in kwargs["filter"]:
+            url = kwargs["filter"]["url"]["equals"]
+            return {"results": [page for page in self.pages if page["properties"]["url"]["url"] == url], "has_more": False}
+        # 2 件ずつページングして返す
+        start = int(kwargs.get("start_cursor", "0"))
+        results = self.pages[start : start + 2]
+        has_more = start + 2 < len(self.pages)
+        return {"results": results, "has_more": has_more, "next_cursor": str(start + 2) if has_more else None}
+
+
+@pytest.fixture
+def repository(monkeypatch: pytest.MonkeyPatch) -> NotionRepository:
+    monkeypatch.setenv("NOTION_DATABASE_ID", "database")
+    monkeypatch.setenv("NOTION_PAGE_INDEX_PATH", ":memory:")
+    return NotionRepository(HTTPClientPool())
+
+
+def test_fetch_page_id_syncs_all_pages(repository: NotionRepository, mocker: MockerFixture) -> None:
+    """
+    100 件を超えるデータベースでもページングして同期し、以降はインデックスから引けるかをテストする。
+    """
+    databases = FakeDatabases(
+        [_page(f"page-{i}", f"https://arxiv.org/abs/2401.0000{i}", f"2024-01-0{i + 1}T00:00:00.000Z") for i in range(5)]
+    )
+    mocker.patch.object(NotionRepository, "_get_client", return_value=mocker.Mock(databases=databases))
+
+    assert repository._fetch_page_id("https://arxiv.org/pdf/2401.00004.pdf") == "page-4"
+    assert len(databases.queries) == 3
+    assert repository._fetch_page_id("https://arxiv.org/abs/2401.00001") == "page-1"
+    assert len(databases.queries) == 3
+    assert repository.page_index.get_cursor("database") == "2024-01-05T00:00:00.000Z"
+
+
+def test_fetch_page_id_falls_back_to_filtered_query(repository: NotionRepository, mocker: MockerFixture) -> None:
+    """
+    同期の直後にインデックスに無い URL は、url プロパティで絞り込んだクエリで探すかをテストする。
+    """
+    databases = FakeDatabases([])
+    mocker.patch.object(NotionRepository, "_get_client", return_value=mocker.Mock(databases=databases))
+    assert repository._fetch_page_id("https://example.com/a") is None
+    databases.pages.append(_page("page-a", "https://example.com/a", "2024-01-01T00:00:00.000Z"))
+
+    assert repository._fetch_page_id("https://example.com/a") == "page-a"
+    assert databases.queries[-1]["filter"] == {"property": "url", "url": {"equals": "https://example.com/a"}}
@@ -0,0 +1,60 @@
+import time
+
+from pytest_mock import MockerFixture
+
+from benchmarks.synthetic_pdf import build_pdf
+from src.infrastructure.file_downloader.pdf_processor import PDFProcessor
+
+
+def test_iter_pages_reports_offsets() -> None:
+    """
+    各ページの offset が連結後のテキスト中の開始位置と一致するかをテストする。
+    """
+    processor = PDFProcessor(max_workers=1)
+    pages = list(processor.iter_pages(build_pdf(3, lines_per_page=2)))
+    text = processor.read_text(build_pdf(3, lines_per_page=2))
+    assert [page.page_number for page in pages] == [0, 1, 2]
+    for page in pages:
+        assert text[page.offset : page.offset + len(page.text)] == page.text
+    assert "Page 3 line 2" in pages[2].text
+
+
+def test_iter_pages_stops_at_max_pages() -> None:
+    processor = PDFProcessor(max_workers=1, max_pages=2)
+    assert len(list(processor.iter_pages(build_pdf(5, lines_per_page=1)))) == 2
+
+
+def test_parallel_extraction_matches_serial() -> None:
+    """
+    プロセスプールで抽出した結果が逐次抽出と同じになるかをテストする。
+    """
+    binary_content = build_pdf(4, lines_per_page=3)
+    serial = PDFProcessor(max_workers=1).read_text(binary_content)
+    parallel = PDFProcessor(max_workers=2, parallel_min_pages=1).read_text(binary_content)
+    assert parallel == serial
+
+
+def test_serial_extraction_skips_page_that_times_out() -> None:
+    """
+    プロセスプールを使わない逐次抽出でも、時間のかかるページは空として扱い、次のページから抽出を続けるかをテストする。
+    """
+    binary_content = build_pdf(3, lines_per_page=[2, 20000, 2])
+    started = time.monotonic()
+    pages = list(PDFProcessor(max_workers=1, page_timeout=0.5, parallel_min_pages=1).iter_pages(binary_content))
+    assert time.monotonic() - started < 4
+    assert [page.page_number for page in pages] == [0, 1, 2]
+    assert "Page 1 line 2" in pages[0].text
+    assert pages[1].text == ""
+    assert "Page 3 line 2" in pages[2].text
+    assert pages[2].offset == len(pages[0].text)
+
+
+def test_isolated_extraction_falls_back_when_child_fails(mocker: MockerFixture) -> None:
+    """
+    子プロセスで PDF を開けなかった場合、途中までのテキストを返さず、同じプロセス内で全ページを抽出するかをテストする。
+    """
+    binary_content = build_pdf(3, lines_per_page=2)
+    mocker.patch.object(PDFProcessor, "_wait_worker_ready", return_value=False)
+    processor = PDFProcessor(max_workers=1, parallel_min_pages=1)
+    assert processor.read_text(binary_content) == PDFProcessor(max_workers=1, page_timeout=0).read_text(binary_content)
+    assert "Page 3 line 2" in processor.read_text(binary_content)
@@ -0,0 +1,37 @@
+from src.infrastructure.retrieval.retrieval import PaperIndex, tokenize
+
+
+def test_tokenize_mixed_text() -> None:
+    """
+    英数字は単語、日本語は文字 bigram に分割されるかをテストする。
+    """
+    assert tokenize("BERT 事前学習") == ["bert", "事前", "前学", "学習"]
+
+
+def test_search_returns_relevant_chunks_in_document_order() -> None:
+    """
+    クエリに関連するチャンクが上位に選ばれ、文書中の順序で返るかをテストする。
+    """
+    index = PaperIndex(
+        [
+            "Abstract: we propose a new attention mechanism.",
+            "Related work on convolutional networks.",
+            "Experiments on the ImageNet dataset show accuracy gains.",
+            "本研究で用いたデータセットは ImageNet と COCO である。",
+        ]
+    )
+    assert index.search("どのデータセットを使ったか? ImageNet", top_k=2) == [
+        "Experiments on the ImageNet dataset show accuracy gains.",
+        "本研究で用いたデータセットは ImageNet と COCO である。",
+    ]
+
+
+def test_search_without_match_returns_leading_chunks() -> None:
+    index = PaperIndex(["title and abstract", "method", "results"])
+    assert index.search("zzz", top_k=1) == ["title and abstract"]
+
+
+def test_index_json_roundtrip() -> None:
+    index = PaperIndex(["transformer attention", "reinforcement learning agent"])
+    restored = PaperIndex.from_json(index.to_json())
+    assert restored.search("agent", top_k=1) == ["reinforcement learning agent"]
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.domain.models import SlackPost
+from src.infrastructure.http_client.http_client import HTTPClientPool
+from src.infrastructure.slack.rate_limiter import TokenBucket
+from src.infrastructure.slack.slack import MAX_BLOCKS_PER_MESSAGE, MAX_SECTION_TEXT_LENGTH, SlackService, message_text, pack_blocks
+
+
+@pytest.fixture
+def slack_service(monkeypatch: pytest.MonkeyPatch) -> SlackService:
+    monkeypatch.setenv("SLACK_TOKEN", "dummy")
+    monkeypatch.setenv("SLACK_CHANNEL_RATE_PER_SEC", "1000")
+    return SlackService(HTTPClientPool())
+
+
+def test_pack_blocks_respects_limits() -> None:
+    """
+    長いメッセージは section の文字数上限で分割され、ブロック数の上限ごとにメッセージが分かれるかをテストする。
+    """
+    long_message = "\n".join(["a" * 100] * 70)
+    packed = pack_blocks([long_message, *[f"Q{i}" for i in range(40)]])
+    assert len(packed) == 2
+    for blocks in packed:
+        assert len(blocks) <= MAX_BLOCKS_PER_MESSAGE
+        assert all(len(block["text"]["text"]) <= MAX_SECTION_TEXT_LENGTH for block in blocks if block["type"] == "section")
+    texts = [block["text"]["text"] for blocks in packed for block in blocks if block["type"] == "section"]
+    assert "\n".join(texts[:3]) == long_message
+    assert texts[3:] == [f"Q{i}" for i in range(40)]
+
+
+def test_post_messages_retries_after_rate_limit(slack_service: SlackService, mocker: MockerFixture) -> None:
+    """
+    429 が返った場合に Retry-After だけ待ってから再送し、同じスレッドへの投稿を 1 件にまとめるかをテストする。
+    """
+    limited = mocker.Mock(status_code=429, headers={"Retry-After": "0.05"})
+    ok = mocker.Mock(status_code=200)
+    ok.json.return_value = {"ok": True}
+    request = mocker.patch.object(slack_service.session, "request", side_effect=[limited, ok])
+    start = time.monotonic()
+    slack_service.post_messages([SlackPost(channel="C1", messages=["title", "Q1\n\nA1"], thread_ts="1.0")])
+    assert time.monotonic() - start >= 0.05
+    assert request.call_count == 2
+    payload = request.call_args.kwargs["json"]
+    assert payload["thread_ts"] == "1.0"
+    assert [block["type"] for block in payload["blocks"]] == ["section", "divider", "section"]
+
+
+def test_token_bucket_limits_rate() -> None:
+    """
+    バースト分を使い切った後は補充レートに従って待たされるかをテストする。
+    """
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_stream_message_throttles_updates(slack_service: SlackService, mocker: MockerFixture) -> None:
+    """
+    更新間隔内に届いた断片はまとめられ、最後に全文で 1 回だけ更新されるかをテストする。
+    """
+    ok = mocker.Mock(status_code=200)
+    ok.json.return_value = {"ok": True, "ts": "2.0"}
+    request = mocker.patch.object(slack_service.session, "request", return_value=ok)
+    slack_service.stream_update_interval = 60
+    assert slack_service.stream_message("C1", iter(["こんにち", "は"]), "1.0") == "こんにちは"
+    urls = [call.args[1].rsplit("/", 1)[-1] for call in request.call_args_list]
+    assert urls == ["chat.postMessage", "chat.update"]
+    assert request.call_args.kwargs["json"]["ts"] == "2.0"
+    assert request.call_args.kwargs["json"]["blocks"][0]["text"]["text"] == "こんにちは"
+
+
+def test_message_text_rebuilds_full_text_from_blocks() -> None:
+    """
+    通知用に切り詰めた text ではなく、section ブロックから投稿の全文を組み立て直すかをテストする。
+    """
+    long_message = "\n".join(["a" * 100] * 70)
+    blocks = pack_blocks([long_message, "Q2: b\n\nB"])[0]
+    assert message_text({"text": long_message[:150], "blocks": blocks}) == f"{long_message}\n\nQ2: b\n\nB"
+    assert message_text({"text": "ユーザーの質問", "blocks": [{"type": "rich_text", "elements": []}]}) == "ユーザーの質問"
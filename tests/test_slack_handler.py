@@ -0,0 +1,413 @@
+from collections.abc import Iterator
+import json
+import threading
+import time
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from src.application.slack_handler import SlackEventHandler
+from src.domain.models import PaperMetadata, ThreadSession
+from src.infrastructure.idempotency.idempotency import IdempotencyStoreError, InMemoryIdempotencyStore, create_idempotency_store_from_env
+from src.infrastructure.job_queue.job_queue import InMemoryJobQueue, JobQueueError, create_job_queue_from_env
+from src.infrastructure.llm.schemas import LLMOutputError
+from src.infrastructure.thread_session.thread_session import InMemoryThreadSessionStore, create_thread_session_store_from_env
+from src.utils.deadline import DeadlineExceededError, deadline
+
+
+def _slack_request(event_id: str, retry: bool = False) -> dict[str, Any]:
+    body = {
+        "event_id": event_id,
+        "event": {"type": "app_mention", "channel": "C1", "ts": "1700000000.000100", "blocks": []},
+    }
+    headers = {"X-Slack-Retry-Num": "1"} if retry else {}
+    return {"headers": headers, "body": json.dumps(body)}
+
+
+def _make_handler(mocker: MockerFixture, **overrides: Any) -> SlackEventHandler:
+    """依存するサービスをモックに、ストアをメモリ上のものにした SlackEventHandler を作る。overrides で個別に差し替える"""
+    metadata_resolver = mocker.Mock()
+    metadata_resolver.resolve_many.return_value = {}
+    collaborators: dict[str, Any] = {
+        "slack_service": mocker.Mock(),
+        "content_downloader": mocker.Mock(),
+        "llm_service": mocker.Mock(),
+        "notion_repogitpry": mocker.Mock(),
+        "paper_retriever": mocker.Mock(),
+        "job_queue": InMemoryJobQueue(),
+        "idempotency_store": InMemoryIdempotencyStore(),
+        "metadata_resolver": metadata_resolver,
+        "thread_session_store": InMemoryThreadSessionStore(),
+    }
+    return SlackEventHandler(**{**collaborators, **overrides})
+
+
+@pytest.fixture
+def handler(mocker: MockerFixture) -> SlackEventHandler:
+    handler = _make_handler(mocker)
+    mocker.patch.object(handler, "handle_mention")
+    return handler
+
+
+def test_async_mode_acks_and_worker_processes(handler: SlackEventHandler) -> None:
+    """
+    async モードではイベントを積むだけで応答し、ワーカーが処理するかをテストする。
+    """
+    handler.event_mode = "async"
+    assert handler.handle_event(_slack_request("Ev1")) == {"statusCode": 200}
+    handler.handle_mention.assert_not_called()  # type: ignore[attr-defined]
+    assert handler.process_jobs() == 1
+    handler.handle_mention.assert_called_once()  # type: ignore[attr-defined]
+
+
+def test_async_mode_deduplicates_retries(handler: SlackEventHandler) -> None:
+    """
+    同じ event_id の再送は積まれず、未処理のイベントの再送は積まれるかをテストする。
+    """
+    handler.event_mode = "async"
+    handler.handle_event(_slack_request("Ev1"))
+    handler.handle_event(_slack_request("Ev1", retry=True))
+    handler.handle_event(_slack_request("Ev2", retry=True))
+    assert handler.process_jobs() == 2
+
+
+def test_sync_mode_releases_failed_event(handler: SlackEventHandler) -> None:
+    """
+    同期モードで処理に失敗したイベントは、再び処理できる状態に戻るかをテストする。
+    """
+    handler.handle_mention.side_effect = RuntimeError  # type: ignore[attr-defined]
+    with pytest.raises(RuntimeError):
+        handler.handle_event(_slack_request("Ev1"))
+    assert handler.idempotency_store.try_acquire("Ev1")
+
+
+def test_main_message_posts_answers_progressively(mocker: MockerFixture) -> None:
+    """
+    タイトルが最初に投稿され、回答が生成された順に投稿され、Notion には Q1〜Q8 の順で保存されるかをテストする。
+    """
+    slack_service = mocker.Mock()
+    llm_service = mocker.Mock()
+    notion = mocker.Mock()
+    llm_service.generate_title.return_value = "Title"
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.iter_summary.return_value = iter([("Q2: b", "B"), ("Q1: a", "A")])
+    llm_service.generate_brief_digest.return_value = "digest"
+    handler = _make_handler(mocker, slack_service=slack_service, llm_service=llm_service, notion_repogitpry=notion)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=["https://example.com"])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    posted = [call.args[1] for call in slack_service.post_message.call_args_list]
+    assert posted == ["Title\nhttps://example.com", "Q2: b\n\nB", "Q1: a\n\nA"]
+    paper = notion.add_content.call_args.args[0]
+    assert list(paper.summary) == ["Q1: a", "Q2: b"]
+
+
+def test_main_message_uses_arxiv_metadata(mocker: MockerFixture) -> None:
+    """
+    メタデータが取得できた場合、タイトルは LLM で生成せず、カテゴリはアブストラクトから判定するかをテストする。
+    """
+    llm_service = mocker.Mock()
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.iter_summary.return_value = iter([("Q1: a", "A")])
+    llm_service.generate_brief_digest.return_value = "digest"
+    metadata_resolver = mocker.Mock()
+    url = "https://arxiv.org/abs/2401.00001"
+    metadata_resolver.resolve_many.return_value = {
+        url: PaperMetadata(paper_id="2401.00001", title="Title", categories=["cs.CL"], abstract="Abstract")
+    }
+    handler = _make_handler(mocker, llm_service=llm_service, metadata_resolver=metadata_resolver)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=[url])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    llm_service.generate_title.assert_not_called()
+    assert llm_service.generate_category.call_args.args[0] == "Title\ncs.CL\nAbstract"
+    assert handler.notion_repogitpry.add_content.call_args.args[0].title == "Title"  # type: ignore[attr-defined]
+
+
+def _link_blocks(*urls: str) -> list[dict[str, Any]]:
+    links = [{"type": "link", "url": url} for url in urls]
+    return [{"type": "rich_text", "elements": [{"type": "rich_text_section", "elements": links}]}]
+
+
+def test_extract_urls_deduplicates_same_paper(handler: SlackEventHandler) -> None:
+    """
+    同じ論文を指すリンクは 1 つにまとめ、出現順を保つかをテストする。
+    """
+    blocks = _link_blocks(
+        "https://arxiv.org/abs/2401.00001",
+        "https://example.com/post?utm_source=x",
+        "https://arxiv.org/pdf/2401.00001",
+        "https://example.com/post",
+    )
+    assert handler._extract_urls_from_blocks(blocks) == ["https://arxiv.org/abs/2401.00001", "https://example.com/post?utm_source=x"]
+
+
+def test_extract_urls_from_bulleted_list(handler: SlackEventHandler) -> None:
+    """
+    箇条書き（rich_text_list）の中のリンクも集めるかをテストする。
+    """
+    items = [
+        {"type": "rich_text_section", "elements": [{"type": "text", "text": "読む: "}, {"type": "link", "url": url}]}
+        for url in ("https://arxiv.org/abs/2401.00001", "https://arxiv.org/abs/2401.00002")
+    ]
+    blocks = [{"type": "rich_text", "elements": [{"type": "rich_text_list", "style": "bullet", "elements": items}]}]
+    assert handler._extract_urls_from_blocks(blocks) == ["https://arxiv.org/abs/2401.00001", "https://arxiv.org/abs/2401.00002"]
+
+
+def test_main_message_isolates_failed_links(mocker: MockerFixture) -> None:
+    """
+    複数のリンクを論文ごとにまとめて投稿し、1 本の失敗が他の論文の処理を止めないかをテストする。
+    """
+
+    def download_content(url: str) -> str:
+        if url.endswith("bad"):
+            raise RuntimeError
+        return f"content of {url}"
+
+    slack_service = mocker.Mock()
+    content_downloader = mocker.Mock()
+    content_downloader.download_content.side_effect = download_content
+    llm_service = mocker.Mock()
+    llm_service.generate_title.return_value = "Title"
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.iter_summary.side_effect = lambda _: iter([("Q1: a", "A")])
+    llm_service.generate_brief_digest.return_value = "digest"
+    notion = mocker.Mock()
+    handler = _make_handler(
+        mocker, slack_service=slack_service, content_downloader=content_downloader, llm_service=llm_service, notion_repogitpry=notion
+    )
+    urls = ["https://example.com/a", "https://example.com/bad", "https://example.com/c"]
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": _link_blocks(*urls)})
+    handler.metadata_resolver.resolve_many.assert_called_once_with(urls)  # type: ignore[attr-defined]
+    posts = [post for call in slack_service.post_messages.call_args_list for post in call.args[0]]
+    assert sorted(post.messages[0] for post in posts) == [
+        "Title\nhttps://example.com/a",
+        "Title\nhttps://example.com/c",
+        "https://example.com/bad\nコンテンツのダウンロードに失敗しました。",
+    ]
+    assert all(post.thread_ts == "1.0" for post in posts)
+    assert sorted(call.args[0].url for call in notion.add_content.call_args_list) == ["https://example.com/a", "https://example.com/c"]
+
+
+def _thread_handler(mocker: MockerFixture, store: InMemoryThreadSessionStore) -> SlackEventHandler:
+    slack_service = mocker.Mock()
+    slack_service.stream_message.return_value = "answer"
+    slack_service.get_conversations.return_value = {
+        "ok": True,
+        "messages": [
+            {"ts": "1.0", "text": "<@U1> https://example.com", "attachments": [{"original_url": "https://example.com"}]},
+            {"ts": "1.1", "bot_id": "B1", "text": "Title\nhttps://example.com"},
+            {"ts": "1.2", "text": "<@U1> 手法について"},
+        ],
+    }
+    paper_retriever = mocker.Mock()
+    paper_retriever.retrieve.return_value = ["passage"]
+    return _make_handler(mocker, slack_service=slack_service, paper_retriever=paper_retriever, thread_session_store=store)
+
+
+def test_thread_follow_up_uses_session_instead_of_history(mocker: MockerFixture) -> None:
+    """
+    初回は Slack の履歴から会話を組み立てて保存し、2 回目以降は保存した会話より新しいメッセージだけを確かめ、
+    保存した会話に質問を加えるかをテストする。
+    """
+    store = InMemoryThreadSessionStore()
+    handler = _thread_handler(mocker, store)
+    handler.handle_mention({"channel": "C1", "ts": "1.2", "thread_ts": "1.0", "text": "<@U1> 手法について"})
+    handler.handle_mention({"channel": "C1", "ts": "1.4", "thread_ts": "1.0", "text": "<@U1> 結果について"})
+    calls = handler.slack_service.get_conversations.call_args_list  # type: ignore[attr-defined]
+    assert [call.kwargs.get("oldest") for call in calls] == [None, "1.2"]
+    messages = handler.llm_service.stream_chat_response.call_args.args[0]  # type: ignore[attr-defined]
+    assert messages == [
+        {"role": "user", "content": "論文のうち、質問に関連する箇所の抜粋:\npassage", "pinned": True},
+        {"role": "assistant", "content": "Title\nhttps://example.com"},
+        {"role": "user", "content": "<@U1> 手法について"},
+        {"role": "assistant", "content": "answer"},
+        {"role": "user", "content": "<@U1> 結果について"},
+    ]
+    assert handler.notion_repogitpry.update_content.call_args.args == (
+        "https://example.com",
+        {"question": " 結果について", "answer": "answer"},
+    )  # type: ignore[attr-defined]
+    session = store.get("C1", "1.0")
+    assert session is not None
+    assert session.paper_id == "https://example.com/"
+    assert len(session.turns) == 5
+    assert session.last_ts == "1.4"
+
+
+def test_thread_follow_up_resyncs_session_that_is_behind(mocker: MockerFixture) -> None:
+    """
+    保存した会話より後に別のインスタンスが答えた質問があれば、Slack の履歴から会話を組み立て直すかをテストする。
+    """
+    store = InMemoryThreadSessionStore()
+    store.put(ThreadSession(channel="C1", thread_ts="1.0", paper_url="https://example.com", turns=[], last_ts="1.0"))
+    handler = _thread_handler(mocker, store)
+    handler.handle_mention({"channel": "C1", "ts": "1.4", "thread_ts": "1.0", "text": "<@U1> 結果について"})
+    messages = handler.llm_service.stream_chat_response.call_args.args[0]  # type: ignore[attr-defined]
+    assert {"role": "user", "content": "<@U1> 手法について"} in messages
+    session = store.get("C1", "1.0")
+    assert session is not None
+    assert session.last_ts == "1.4"
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_thread_session_store_expires(backend: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    保存した会話の状態を取り出せ、期限を過ぎると取り出せなくなるかをテストする。
+    """
+    monkeypatch.setenv("THREAD_SESSION_BACKEND", backend)
+    monkeypatch.setenv("THREAD_SESSION_PATH", ":memory:")
+    monkeypatch.setenv("THREAD_SESSION_TTL_SECONDS", "60")
+    store = create_thread_session_store_from_env()
+    store.put(ThreadSession(channel="C1", thread_ts="1.0", paper_url="https://example.com", summary={"Q1: a": "A"}))
+    session = store.get("C1", "1.0")
+    assert session is not None
+    assert session.summary == {"Q1: a": "A"}
+    assert store.get("C1", "2.0") is None
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert store.get("C1", "1.0") is None
+
+
+def test_main_message_saves_partial_summary_at_deadline(mocker: MockerFixture) -> None:
+    """
+    締め切りで LLM の呼び出しが打ち切られた場合、得られた分の要約を保存するかをテストする。
+    """
+    slack_service = mocker.Mock()
+    llm_service = mocker.Mock()
+    notion = mocker.Mock()
+    llm_service.generate_title.side_effect = DeadlineExceededError
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.iter_summary.return_value = iter([("Q1: a", "A")])
+    handler = _make_handler(mocker, slack_service=slack_service, llm_service=llm_service, notion_repogitpry=notion)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=["https://example.com"])
+    with deadline(handler.deadline_reserve - 1):
+        handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    paper = notion.add_content.call_args.args[0]
+    assert paper.title == "No Title"
+    assert paper.summary == {"Q1: a": "A"}
+    assert paper.brief_digest == ""
+    llm_service.generate_brief_digest.assert_not_called()
+
+
+def test_worker_stops_taking_jobs_near_deadline(handler: SlackEventHandler) -> None:
+    """
+    残り時間が少ない場合、ワーカーが新しいジョブを取り出さずに終えるかをテストする。
+    """
+    handler.event_mode = "async"
+    handler.handle_event(_slack_request("Ev1"))
+    with deadline(handler.job_min_remaining_seconds - 1):
+        assert handler.process_jobs() == 0
+    assert handler.process_jobs() == 1
+
+
+def test_main_message_falls_back_on_invalid_title_and_category(mocker: MockerFixture) -> None:
+    """
+    タイトル・カテゴリの出力が修正してもスキーマに合わない場合、既定値で論文を保存するかをテストする。
+    """
+    llm_service = mocker.Mock()
+    notion = mocker.Mock()
+    llm_service.generate_title.side_effect = LLMOutputError
+    llm_service.generate_category.side_effect = LLMOutputError
+    llm_service.iter_summary.return_value = iter([("Q1: a", "A")])
+    llm_service.generate_brief_digest.return_value = "digest"
+    handler = _make_handler(mocker, llm_service=llm_service, notion_repogitpry=notion)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=["https://example.com"])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    paper = notion.add_content.call_args.args[0]
+    assert paper.title == "No Title"
+    assert paper.category == ["No Category"]
+    assert paper.summary == {"Q1: a": "A"}
+
+
+def test_main_message_falls_back_on_category_failure(mocker: MockerFixture) -> None:
+    """
+    カテゴリの生成がどんな理由で失敗しても、投稿済みの要約を既定のカテゴリで保存するかをテストする。
+    """
+    llm_service = mocker.Mock()
+    notion = mocker.Mock()
+    llm_service.generate_title.return_value = "Title"
+    llm_service.generate_category.side_effect = RuntimeError
+    llm_service.iter_summary.return_value = iter([("Q1: a", "A")])
+    llm_service.generate_brief_digest.return_value = "digest"
+    handler = _make_handler(mocker, llm_service=llm_service, notion_repogitpry=notion)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=["https://example.com"])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    paper = notion.add_content.call_args.args[0]
+    assert paper.category == ["No Category"]
+    assert paper.summary == {"Q1: a": "A"}
+
+
+def test_main_message_posts_title_before_first_answer_arrives(mocker: MockerFixture) -> None:
+    """
+    メタデータのタイトルは最初の回答を待たずに投稿されるかをテストする。
+    """
+    title_posted = threading.Event()
+    slack_service = mocker.Mock()
+    slack_service.post_message.side_effect = lambda _channel, message, _ts: message.startswith("Title") and title_posted.set()
+    llm_service = mocker.Mock()
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.generate_brief_digest.return_value = "digest"
+
+    def iter_summary(_: str) -> Iterator[tuple[str, str]]:
+        # タイトルが投稿されるまで最初の回答を返さない
+        assert title_posted.wait(timeout=5)
+        yield "Q1: a", "A"
+
+    llm_service.iter_summary.side_effect = iter_summary
+    url = "https://arxiv.org/abs/2401.00001"
+    metadata_resolver = mocker.Mock()
+    metadata_resolver.resolve_many.return_value = {
+        url: PaperMetadata(paper_id="2401.00001", title="Title", categories=["cs.CL"], abstract="Abstract")
+    }
+    handler = _make_handler(mocker, slack_service=slack_service, llm_service=llm_service, metadata_resolver=metadata_resolver)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=[url])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    posted = [call.args[1] for call in slack_service.post_message.call_args_list]
+    assert posted == [f"Title\n{url}", "Q1: a\n\nA"]
+
+
+def test_main_message_holds_answers_until_title(mocker: MockerFixture) -> None:
+    """
+    タイトルより先に届いた回答は、タイトルの投稿後に届いた順で投稿されるかをテストする。
+    """
+    summary_finished = threading.Event()
+    slack_service = mocker.Mock()
+    llm_service = mocker.Mock()
+
+    def generate_title(_: str) -> str:
+        # 全ての回答が届くまでタイトルを返さない
+        assert summary_finished.wait(timeout=5)
+        return "Title"
+
+    def iter_summary(_: str) -> Iterator[tuple[str, str]]:
+        yield "Q2: b", "B"
+        yield "Q1: a", "A"
+        summary_finished.set()
+
+    llm_service.generate_title.side_effect = generate_title
+    llm_service.generate_category.return_value = ["NLP"]
+    llm_service.iter_summary.side_effect = iter_summary
+    llm_service.generate_brief_digest.return_value = "digest"
+    handler = _make_handler(mocker, slack_service=slack_service, llm_service=llm_service)
+    mocker.patch.object(handler, "_extract_urls_from_blocks", return_value=["https://example.com"])
+    handler.handle_mention({"channel": "C1", "ts": "1.0", "blocks": []})
+    posted = [call.args[1] for call in slack_service.post_message.call_args_list]
+    assert posted == ["Title\nhttps://example.com", "Q2: b\n\nB", "Q1: a\n\nA"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_async_mode_refuses_container_local_stores(backend: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    async モードでは、ワーカーと共有できない（メモリ上・/tmp 以下の）キューと処理済みの記録を使わないかをテストする。
+    """
+    monkeypatch.setenv("SLACK_EVENT_MODE", "async")
+    for prefix in ("JOB_QUEUE", "IDEMPOTENCY"):
+        monkeypatch.setenv(f"{prefix}_BACKEND", backend)
+        monkeypatch.delenv(f"{prefix}_PATH", raising=False)
+    with pytest.raises(JobQueueError):
+        create_job_queue_from_env()
+    with pytest.raises(IdempotencyStoreError):
+        create_idempotency_store_from_env()
+    monkeypatch.setenv("SLACK_EVENT_MODE", "sync")
+    create_job_queue_from_env()
+    create_idempotency_store_from_env()
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from src.infrastructure.llm.usage import estimate_cost
+from src.utils.concurrency import map_concurrently
+from src.utils.tracing import set_attributes, span, trace
+
+
+def test_spans_in_worker_threads_belong_to_trace() -> None:
+    """
+    スレッドプールで実行したスパンも呼び出し元のトレース・親スパンに紐づき、トークン数とコストが集計されるかをテストする。
+    """
+
+    def call_llm(idx: int) -> str | None:
+        with span("llm.ContentSummarizer") as current:
+            set_attributes(prompt_tokens=100, completion_tokens=10, cached_tokens=0, cost_usd=0.5)
+            _ = idx
+            return current.parent_id
+
+    with trace("C1:1.0") as current_trace, span("summary") as parent:
+        parent_ids = map_concurrently(call_llm, list(range(4)), max_workers=4)
+    assert parent_ids == [parent.span_id] * 4
+    stages = current_trace.summary()
+    assert stages["llm.ContentSummarizer"]["count"] == 4
+    assert stages["llm.ContentSummarizer"]["prompt_tokens"] == 400
+    assert stages["llm.ContentSummarizer"]["cost_usd"] == pytest.approx(2.0)
+
+
+def test_emf_output(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    """
+    EMF 形式では、スパンの所要時間が CloudWatch のメトリクス定義付きで標準出力に書き出されるかをテストする。
+    """
+    monkeypatch.setenv("TELEMETRY_FORMAT", "emf")
+    with span("download", url="https://example.com"):
+        pass
+    record = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert record["Span"] == "download"
+    assert record["url"] == "https://example.com"
+    assert record["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [{"Name": "Duration", "Unit": "Milliseconds"}]
+
+
+def test_estimate_cost_matches_dated_model_name() -> None:
+    """
+    日付付きのモデル名でも料金表を引き、キャッシュされた入力を割り引いて計算するかをテストする。
+    """
+    cost = estimate_cost("gpt-4o-mini-2024-07-18", prompt_tokens=1_000_000, cached_tokens=500_000, completion_tokens=1_000_000)
+    assert cost == pytest.approx(0.5 * 0.15 + 0.5 * 0.075 + 0.60)
+    assert estimate_cost("unknown-model", 1000, 0, 1000) == 0.0